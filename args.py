@@ -1,13 +1,22 @@
+import argparse
 import json
 
+from tableWriter import writeTable
 
-def importArgs(file):
+
+def importArgs(file, storeDir=None):
     """
     Import the raw JSON arguments as a dictionary.
 
     :param file: file containing the raw arguments to import
+    :param storeDir: read the arguments from this columnar store (see ingest.py) instead
     :return: imported args as JSON
     """
+    if storeDir is not None:
+        # Only import pyarrow when the store is used
+        from ingest import readCollection
+        return readCollection(storeDir, "bbtArguments")
+
     args_json = []
     with open(file) as args_file:
         for line in args_file:
@@ -26,39 +35,36 @@ def writeTimeStatsAndNoOfArgsToCSV(file, argsSubmissions):
                             participant in JSON
     :return: None
     """
-    file = open(file, "w")
-    file.write("prolificId,timeConstraint\n")
+    rows = []
     for s in argsSubmissions:
         if s['timeConstraint'] - s['timeUsed'] < -5:
             # Print a warning if the arguments were submitted more than 5 seconds after the time was up as this could indicate a connection issue.
             print('Participant ' + str(s['_id']) + '\'s arguments submission was not made within 5 seconds after time was up.')
-        file.write(s['_id'] + "," + str(s['timeConstraint']) + "\n")
+        rows.append([s['_id'], s['timeConstraint']])
 
-    file.close()
+    writeTable(file, ["prolificId", "timeConstraint"], rows)
 
 
 def writeArgumentsIndividuallyToCSV(file, argsSubmissions):
     """
-    Write arguments to a CSV file with one line per argument for task performance judgements
+    Write arguments to a CSV file with one row per argument for task performance judgements.
+    Arguments containing commas, quotes or newlines are quoted, so they are read back unchanged.
 
     :param file: file to write time statics to
     :param argsSubmissions: The arguments grouped by
                             participant in JSON
     :return: None
     """
-    file = open(file, "w")
-    file.write("prolificId,TDepth,DQual,DIntrp,Argument\n")
-    for s in argsSubmissions:
-        for arg in s['args']:
-            # Replace comma with semicolons and enters with three underscores to prevent corrupting the CSV file
-            arg_escaped = arg.replace(',', ';').replace('\n', '___')
-            file.write(s['_id'] + ",,,," + arg_escaped + "\n")
-
-    file.close()
+    writeTable(file, ["prolificId", "TDepth", "DQual", "DIntrp", "Argument"],
+               ([s['_id'], "", "", "", arg] for s in argsSubmissions for arg in s['args']))
 
 
 if __name__ == '__main__':
-    argsSubmissions = importArgs("/home/mike/git/bbt-analysis/data/in/args.json")
+    parser = argparse.ArgumentParser(description="Time statistics and the arguments to rate.")
+    parser.add_argument("--store", default=None, help="read the arguments from this columnar store (see ingest.py)")
+    args = parser.parse_args()
+
+    argsSubmissions = importArgs("/home/mike/git/bbt-analysis/data/in/args.json", args.store)
     # Calculate time used and write the time statistics to a CSV file for data analysis
     writeTimeStatsAndNoOfArgsToCSV("/home/mike/git/bbt-analysis/data/out/submissionTimesAndNoOfArgs.csv", argsSubmissions)
     # Write arguments to a CSV file with one line per argument for task performance judgements
@@ -0,0 +1,49 @@
+import argparse
+import runpy
+import sys
+
+# Subcommands: name -> (script run by it, description). The script is only
+# imported when its subcommand runs, so `python bbt.py --help` and the
+# scripts without heavy dependencies start fast.
+COMMANDS = {
+    "pipeline": ("pipeline", "run all analyses, skipping the ones whose inputs did not change"),
+    "args": ("args", "time statistics and the arguments to rate"),
+    "ratedArgs": ("ratedArgs", "average ratings of the arguments and inter-rater agreement"),
+    "pretask": ("pretask", "pretask questionnaires"),
+    "posttask": ("posttask", "ATI and UES scores of the posttask questionnaires"),
+    "condition": ("condition", "condition of every participant"),
+    "logs": ("logs", "search behavior metrics from the LogUI logs"),
+    "windows": ("timeline", "search behavior metrics per time window"),
+    "listReliance": ("listReliance", "similarity between the arguments and the clicked web pages"),
+    "join": ("join", "one table with all data of every participant"),
+    "ingest": ("ingest", "convert the logs and exports to a columnar store"),
+    "cache": ("eventCache", "build binary caches of the logs grouped per participant"),
+    "synthetic": ("synthetic", "generate synthetic logs and exports"),
+    "benchmark": ("benchmark", "run benchmarks on synthetic data"),
+    "viewports": ("visualizeInitialViewports", "plot the initial viewport sizes"),
+    "resizings": ("visualizeResizings", "plot the viewport resizings"),
+}
+
+
+def run(command, arguments):
+    """
+    Run the script of a subcommand as if it was started on its own.
+
+    :param command: name of the subcommand
+    :param arguments: command line arguments of the script
+    :return: None
+    """
+    script = COMMANDS[command][0]
+    sys.argv = [script + ".py"] + arguments
+    runpy.run_module(script, run_name="__main__", alter_sys=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analysis of the BBT study. Run `python bbt.py <command> --help` for the options of a command.",
+                                     epilog="commands:\n" + "\n".join("  %-14s %s" % (name, description) for (name, (_, description)) in COMMANDS.items()),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help="the analysis to run, see below")
+    parser.add_argument("arguments", nargs=argparse.REMAINDER, help="arguments of the command")
+    args = parser.parse_args()
+
+    run(args.command, args.arguments)
@@ -0,0 +1,448 @@
+import argparse
+import contextlib
+import gc
+import glob
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import synthetic
+
+# Benchmarks registered with registerBenchmark, by name
+BENCHMARKS = {}
+
+
+def registerBenchmark(function):
+    """
+    Register a benchmark so that it can be run from the command line.
+    Can be used as a decorator. A benchmark takes the parsed command line
+    arguments and returns a dictionary with its results.
+
+    :param function: the benchmark to register
+    :return: the registered function
+    """
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def timeCall(function, *args):
+    """
+    Time a call to a function, with its debug output silenced.
+
+    :param function: the function to call
+    :param args: the arguments of the call
+    :return: (result of the call, seconds it took)
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+    return result, seconds
+
+
+@registerBenchmark
+def cohortMetrics(args):
+    """
+    Compare the per participant metrics of logs.py with the cohort metrics
+    of cohortMetrics.py on synthetic logs, and check they are the same.
+
+    :param args: command line arguments, uses participants
+    :return: the timings and the number of differences
+    """
+    from logs import groupLogsPerSubmission, calculateMetricsPerSubmission, streamMetricsPerSubmission
+    from cohortMetrics import eventsFrame, computeCohortMetrics, validateCohortMetrics
+
+    logs = list(synthetic.generateLogs(args.participants))
+    grouped, groupSeconds = timeCall(groupLogsPerSubmission, logs)
+    _, perSubmissionSeconds = timeCall(lambda: [calculateMetricsPerSubmission(s, l) for (s, l) in grouped.items()])
+    _, streamSeconds = timeCall(streamMetricsPerSubmission, logs)
+    events, frameSeconds = timeCall(eventsFrame, logs)
+    _, cohortSeconds = timeCall(computeCohortMetrics, events)
+
+    return {"events": len(logs),
+            "groupLogsPerSubmission": {"seconds": groupSeconds},
+            "calculateMetricsPerSubmission": {"seconds": perSubmissionSeconds},
+            "streamMetricsPerSubmission": {"seconds": streamSeconds},
+            "eventsFrame": {"seconds": frameSeconds},
+            "computeCohortMetrics": {"seconds": cohortSeconds},
+            "differences": len(validateCohortMetrics(logs))}
+
+
+@registerBenchmark
+def logPipeline(args):
+    """
+    Time the steps of logs.py on a synthetic LogUI export: importing the
+    file, grouping the events per participant, calculating the metrics
+    and writing the CSV file.
+
+    :param args: command line arguments, uses participants
+    :return: the timings of every step
+    """
+    from logs import importLogs, groupLogsPerSubmission, calculateMetricsPerSubmission, writeToCSV
+
+    with tempfile.TemporaryDirectory() as directory:
+        logFile = os.path.join(directory, "logs.log")
+        synthetic.writeLogs(logFile, synthetic.generateLogs(args.participants))
+        logs, importSeconds = timeCall(importLogs, logFile)
+        grouped, groupSeconds = timeCall(groupLogsPerSubmission, logs)
+        metrics, metricsSeconds = timeCall(lambda: [calculateMetricsPerSubmission(s, l) for (s, l) in grouped.items()])
+        _, writeSeconds = timeCall(writeToCSV, os.path.join(directory, "behavior.csv"), metrics)
+        return {"events": len(logs),
+                "megabytes": os.path.getsize(logFile) / 1e6,
+                "importLogs": {"seconds": importSeconds, "eventsPerSecond": len(logs) / importSeconds},
+                "groupLogsPerSubmission": {"seconds": groupSeconds, "eventsPerSecond": len(logs) / groupSeconds},
+                "calculateMetricsPerSubmission": {"seconds": metricsSeconds, "eventsPerSecond": len(logs) / metricsSeconds},
+                "writeToCSV": {"seconds": writeSeconds}}
+
+
+@registerBenchmark
+def similarity(args):
+    """
+    Time the similarities of listReliance.py between the arguments of the
+    synthetic participants and the synthetic web pages they clicked.
+
+    :param args: command line arguments, uses participants
+    :return: the timing and the number of participants and pages
+    """
+    from similarity import calculateMaxSimilarities
+
+    rng = random.Random(0)
+    words = synthetic.QUERY_TERMS + [part for argument in synthetic.ARGUMENT_PARTS for part in argument.split()]
+    pages = {"https://example.org/page/" + str(i): " ".join(rng.choice(words) for _ in range(rng.randint(200, 2000))) for i in range(1, 501)}
+    argsPerParticipant = {}
+    clicksPerParticipant = {}
+    for _ in range(args.participants):
+        participant = synthetic.prolificID(rng)
+        argsPerParticipant[participant] = " ".join(synthetic.generateArguments(rng, participant)['args'])
+        clicksPerParticipant[participant] = rng.sample(list(pages), rng.randint(1, 10))
+
+    similarities, seconds = timeCall(calculateMaxSimilarities, argsPerParticipant, clicksPerParticipant, pages)
+    return {"participants": len(similarities), "pages": len(pages),
+            "calculateMaxSimilarities": {"seconds": seconds, "participantsPerSecond": len(similarities) / seconds}}
+
+
+@registerBenchmark
+def scoringBackends(args):
+    """
+    Compare the throughput of the scoring backends of listReliance.py on
+    synthetic arguments and web pages: building the page index of the
+    tfidf and embedding backends and scoring all participants. The
+    embedding backend is skipped if sentence-transformers is not installed.
+
+    :param args: command line arguments, uses participants and pages
+    :return: the timings of every backend
+    """
+    import importlib.util
+    from similarity import calculateMaxSimilarities, calculateIndexedMaxSimilarities, buildPageIndex
+
+    rng = random.Random(0)
+    words = synthetic.QUERY_TERMS + [part for argument in synthetic.ARGUMENT_PARTS for part in argument.split()]
+    pages = {"https://example.org/page/" + str(i): " ".join(rng.choice(words) for _ in range(rng.randint(200, 2000))) for i in range(1, args.pages + 1)}
+    argsPerParticipant = {}
+    clicksPerParticipant = {}
+    for _ in range(args.participants):
+        participant = synthetic.prolificID(rng)
+        argsPerParticipant[participant] = " ".join(synthetic.generateArguments(rng, participant)['args'])
+        clicksPerParticipant[participant] = rng.sample(list(pages), rng.randint(1, 10))
+
+    _, seconds = timeCall(calculateMaxSimilarities, argsPerParticipant, clicksPerParticipant, pages)
+    results = {"participants": args.participants, "pages": len(pages),
+               "bow": {"score": {"seconds": seconds, "participantsPerSecond": args.participants / seconds}}}
+    for backend in ["tfidf", "embedding"]:
+        if backend == "embedding" and importlib.util.find_spec("sentence_transformers") is None:
+            results[backend] = {"skipped": "sentence-transformers is not installed"}
+            continue
+        with tempfile.TemporaryDirectory() as directory:
+            index, indexSeconds = timeCall(buildPageIndex, backend, pages, directory)
+            _, scoreSeconds = timeCall(calculateIndexedMaxSimilarities, index, argsPerParticipant, clicksPerParticipant)
+        results[backend] = {"buildPageIndex": {"seconds": indexSeconds, "pagesPerSecond": len(pages) / indexSeconds},
+                            "score": {"seconds": scoreSeconds, "participantsPerSecond": args.participants / scoreSeconds}}
+    return results
+
+
+@registerBenchmark
+def textExtraction(args):
+    """
+    Compare the text extraction backends on a corpus of saved web pages,
+    e.g. the content cache of listReliance.py. Agreement is the fraction
+    of pages for which a backend gives the same text as BeautifulSoup.
+
+    :param args: command line arguments, uses corpus
+    :return: the timings and agreement of every backend
+    """
+    from textExtraction import BACKENDS
+
+    if args.corpus is None:
+        return {"skipped": "no --corpus given"}
+    pages = []
+    for file in sorted(glob.glob(os.path.join(args.corpus, "*.html"))):
+        with open(file, "rb") as page:
+            pages.append(page.read())
+
+    results = {"pages": len(pages), "megabytes": sum(len(page) for page in pages) / 1e6}
+    reference, _ = timeCall(lambda: [BACKENDS["bs4"](page) for page in pages])
+    for (name, extractText) in BACKENDS.items():
+        texts, seconds = timeCall(lambda: [extractText(page) for page in pages])
+        results[name] = {"seconds": seconds,
+                         "pagesPerSecond": len(pages) / seconds if seconds else None,
+                         "agreement": sum(text == expected for (text, expected) in zip(texts, reference)) / len(pages) if pages else None}
+    return results
+
+
+def tracedMemory(function, *args):
+    """
+    Measure the memory allocated by a call that is still in use afterwards.
+
+    :param function: the function to call
+    :param args: the arguments of the call
+    :return: (result of the call, bytes allocated)
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = function(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+@registerBenchmark
+def eventMemory(args):
+    """
+    Measure the memory of the logs grouped per participant, as decoded
+    JSON and as the LogEvent objects of groupLogsPerSubmission. The bytes
+    per event are also the megabytes per million events.
+
+    :param args: command line arguments, uses participants
+    :return: the bytes per event of both
+    """
+    from logs import groupLogsPerSubmission
+
+    lines = [json.dumps(log) for log in synthetic.generateLogs(args.participants)]
+
+    def groupJSON():
+        grouped = {}
+        for line in lines:
+            log = json.loads(line)
+            grouped.setdefault(log['applicationSpecificData']['prolificID'], []).append(log)
+        return grouped
+
+    results = {"events": len(lines)}
+    for (name, group) in [("json", groupJSON), ("LogEvent", lambda: groupLogsPerSubmission(json.loads(line) for line in lines))]:
+        grouped, size = tracedMemory(group)
+        events = sum(len(logs) for logs in grouped.values())
+        results[name] = {"bytesPerEvent": size / events}
+        del grouped
+    return results
+
+
+@registerBenchmark
+def eventCache(args):
+    """
+    Time building the binary event cache of a synthetic LogUI export,
+    opening it and reading the events of one participant, compared with
+    grouping the events of the export as logs.py does without a cache.
+
+    :param args: command line arguments, uses participants
+    :return: the timings of every step
+    """
+    from logs import groupLogsPerSubmission, iterLogs
+    from eventCache import buildEventCache, EventCache
+
+    with tempfile.TemporaryDirectory() as directory:
+        logFile = os.path.join(directory, "logs.log")
+        cacheFile = os.path.join(directory, "logs.cache")
+        synthetic.writeLogs(logFile, synthetic.generateLogs(args.participants))
+        _, groupSeconds = timeCall(lambda: groupLogsPerSubmission(iterLogs(logFile)))
+        _, buildSeconds = timeCall(buildEventCache, logFile, cacheFile)
+        cache, openSeconds = timeCall(EventCache, cacheFile)
+        participants = cache.participants()
+        _, participantSeconds = timeCall(cache.events, participants[len(participants) // 2])
+        grouped, readSeconds = timeCall(lambda: [cache.events(prolificid) for prolificid in participants])
+        events = sum(len(logs) for logs in grouped)
+        cache.close()
+        return {"events": events,
+                "megabytes": os.path.getsize(cacheFile) / 1e6,
+                "groupLogsPerSubmission": {"seconds": groupSeconds, "eventsPerSecond": events / groupSeconds},
+                "buildEventCache": {"seconds": buildSeconds},
+                "openEventCache": {"seconds": openSeconds},
+                "readParticipant": {"seconds": participantSeconds},
+                "readAllParticipants": {"seconds": readSeconds, "eventsPerSecond": events / readSeconds}}
+
+
+@registerBenchmark
+def csvWriters(args):
+    """
+    Compare writing the behavior metrics of many participants with one
+    file.write per concatenated row, as the scripts used to do, with the
+    batched writers of tableWriter.py, uncompressed and compressed.
+
+    :param args: command line arguments, uses participants
+    :return: the timings and file size of every output format
+    """
+    from logs import CSV_COLUMNS, metricsRow
+    from tableWriter import writeTable
+
+    rng = random.Random(0)
+    metrics = [dict({column: rng.random() * 100 for column in CSV_COLUMNS}, prolificId=synthetic.prolificID(rng)) for _ in range(args.participants)]
+
+    def concatenate(file):
+        out = open(file, "w")
+        out.write(",".join(CSV_COLUMNS) + "\n")
+        for s in metrics:
+            out.write(s['prolificId'] + "," + ",".join(str(s[column]) for column in CSV_COLUMNS[1:]) + "\n")
+        out.close()
+
+    results = {"rows": len(metrics)}
+    with tempfile.TemporaryDirectory() as directory:
+        _, seconds = timeCall(concatenate, os.path.join(directory, "concatenated.csv"))
+        results["concatenated"] = {"seconds": seconds, "rowsPerSecond": len(metrics) / seconds,
+                                   "megabytes": os.path.getsize(os.path.join(directory, "concatenated.csv")) / 1e6}
+        for extension in ["csv", "csv.gz", "csv.zst", "parquet"]:
+            file = os.path.join(directory, "behavior." + extension)
+            _, seconds = timeCall(writeTable, file, CSV_COLUMNS, (metricsRow(s) for s in metrics))
+            results[extension] = {"seconds": seconds, "rowsPerSecond": len(metrics) / seconds, "megabytes": os.path.getsize(file) / 1e6}
+    return results
+
+
+@registerBenchmark
+def coldStart(args):
+    """
+    Time starting a new Python process for the command line interface and
+    for importing the scripts, e.g. to use importArgs of listReliance.py.
+    The fastest of five runs is kept, as the first run also fills the
+    caches of the file system.
+
+    :param args: command line arguments, not used
+    :return: the startup time of every command
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    commands = {"python": ["-c", "pass"],
+                "bbt.py --help": ["bbt.py", "--help"],
+                "bbt.py pipeline --help": ["bbt.py", "pipeline", "--help"],
+                "bbt.py logs --help": ["bbt.py", "logs", "--help"],
+                "bbt.py listReliance --help": ["bbt.py", "listReliance", "--help"]}
+    for script in ["args", "condition", "pretask", "posttask", "ratedArgs", "logs", "join", "listReliance", "pipeline"]:
+        commands["import " + script] = ["-c", "import " + script]
+
+    results = {}
+    for (name, command) in commands.items():
+        seconds = []
+        for _ in range(5):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + command, cwd=directory, stdout=subprocess.DEVNULL, check=True)
+            seconds.append(time.perf_counter() - start)
+        results[name] = {"seconds": min(seconds)}
+    return results
+
+
+def flattenResults(results, prefix=""):
+    """
+    Flatten the nested results of a benchmark.
+
+    :param results: the results of a benchmark
+    :param prefix: path of the results in the outer results
+    :return: dictionary path -> value, e.g. importLogs.seconds -> 1.5
+    """
+    flat = {}
+    for (key, value) in results.items():
+        if isinstance(value, dict):
+            flat.update(flattenResults(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def findRegressions(results, previous, tolerance=0.2, minimumSeconds=0.01):
+    """
+    Compare the timings of a benchmark with a previous run of it.
+
+    :param results: the results of the benchmark
+    :param previous: the results of the previous run
+    :param tolerance: fraction a timing may be slower before it is a regression
+    :param minimumSeconds: timings below this are too noisy to compare
+    :return: list of (path, previous seconds, seconds) of the regressions
+    """
+    before = flattenResults(previous)
+    regressions = []
+    for (path, seconds) in flattenResults(results).items():
+        if path.split(".")[-1] != "seconds" or not isinstance(before.get(path), (int, float)):
+            continue
+        if seconds > minimumSeconds and seconds > before[path] * (1 + tolerance):
+            regressions.append((path, before[path], seconds))
+    return regressions
+
+
+def loadResults(file):
+    """
+    Load the stored results of earlier runs.
+
+    :param file: JSON lines file with one run of one benchmark per line
+    :return: list of the runs, oldest first
+    """
+    if not os.path.exists(file):
+        return []
+    with open(file) as results_file:
+        return [json.loads(line) for line in results_file if line.strip()]
+
+
+def storeResults(file, run):
+    """
+    Append the results of a run to the stored results.
+
+    :param file: JSON lines file with one run of one benchmark per line
+    :param run: the run, with the benchmark, its parameters and its results
+    :return: None
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+    with open(file, "a") as results_file:
+        results_file.write(json.dumps(run) + "\n")
+
+
+def gitCommit():
+    """
+    :return: the commit the benchmarked code is at, None outside a git checkout
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run benchmarks on synthetic data.")
+    parser.add_argument("benchmarks", nargs="*", default=None, help="benchmarks to run (default: all): " + ", ".join(BENCHMARKS))
+    parser.add_argument("--participants", type=int, default=10000, help="number of synthetic participants")
+    parser.add_argument("--pages", type=int, default=5000, help="number of synthetic web pages for scoringBackends")
+    parser.add_argument("--corpus", default=None, help="directory with saved web pages (*.html) for textExtraction")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the out/ directory the results are stored in")
+    parser.add_argument("--results", default=None, help="file the results are stored in and compared with (default: out/benchmark-results.jsonl of --data-dir)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="fraction a timing may be slower than in the last run before it is reported")
+    parser.add_argument("--no-store", action="store_true", help="compare with the stored results, but do not store this run")
+    args = parser.parse_args()
+    if args.results is None:
+        args.results = os.path.join(args.data_dir, "out", "benchmark-results.jsonl")
+
+    stored = loadResults(args.results)
+    commit = gitCommit()
+    regressions = 0
+    for name in args.benchmarks or BENCHMARKS:
+        results = BENCHMARKS[name](args)
+        print(name + ": " + str(results))
+        # Only runs on the same number of participants are comparable
+        previous = [run for run in stored if run["benchmark"] == name and run["participants"] == args.participants]
+        if previous:
+            for (path, before, seconds) in findRegressions(results, previous[-1]["results"], args.tolerance):
+                print("[REGRESSION] " + name + " " + path + ": " + "%.3f" % before + " s at " + str(previous[-1]["commit"]) + ", now " + "%.3f" % seconds + " s")
+                regressions += 1
+        if not args.no_store:
+            storeResults(args.results, {"benchmark": name, "participants": args.participants, "commit": commit,
+                                        "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results})
+    if regressions:
+        raise SystemExit(1)
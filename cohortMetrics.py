@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+import contextlib
+import io
+from urllib.parse import unquote
+from logEvent import CLICK_TYPES
+from metrics import QUERYSERP_URL
+from timestamps import parseTimestampsMillis, microsToMillis
+
+# Columns of the metrics, in the order of the CSV written by logs.writeToCSV
+METRIC_COLUMNS = ["prolificId", "queriesIssued", "queryRate", "avgQueryLengthWords", "avgQueryLengthChars", "serpsVisited",
+                  "noOfResultsClicked", "deepestRankVisitedResults", "avgRankVisitedResults", "dwellTimePerMinute", "timeUsed"]
+
+def eventsFrame(logs):
+    """
+    Convert LogUI events to a DataFrame with one column per field used by
+    the metrics. The timestamps are converted in one batch.
+
+    :param logs: the raw, ungrouped logs, e.g. from logs.iterLogs
+    :return: DataFrame with the events in the order of the logs
+    """
+    columns = {"prolificID": [], "eventType": [], "type": [], "timestamp": [], "hasFocus": [], "newURL": [], "previousURL": [], "rank": []}
+    clickTypes = set(CLICK_TYPES)
+    for log in logs:
+        details = log['eventDetails']
+        columns["prolificID"].append(log['applicationSpecificData']['prolificID'])
+        columns["eventType"].append(log['eventType'])
+        columns["type"].append(details['type'])
+        columns["timestamp"].append(log['timestamps']['eventTimestamp'])
+        columns["hasFocus"].append(bool(details.get('hasFocus')))
+        columns["newURL"].append(details.get('newURL'))
+        columns["previousURL"].append(details.get('previousURL'))
+        columns["rank"].append(int(log['metadata'][0]['value']) if details['type'] in clickTypes else 0)
+    columns["timestamp"] = parseTimestampsMillis(columns["timestamp"])
+    return pd.DataFrame(columns)
+
+
+def eventsFrameFromStore(storeDir, logFile):
+    """
+    Read the events of an ingested LogUI export from the columnar store
+    (see ingest.py) as a DataFrame, without decoding any JSON.
+
+    :param storeDir: directory of the store
+    :param logFile: the LogUI export that was ingested
+    :return: DataFrame with the events in the order of the logs
+    """
+    from ingest import readLogTable, logCondition
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = readLogTable(storeDir, conditions=[logCondition(logFile)],
+                         columns=["seq", "prolificID", "eventType", "type", "timestamp", "hasFocus", "newURL", "previousURL", "metadata"])
+    table = table.set_column(table.schema.get_field_index("timestamp"), "timestamp", pc.cast(table["timestamp"], pa.int64()))
+    events = table.sort_by("seq").to_pandas()
+    events["timestamp"] = microsToMillis(events["timestamp"].values)
+    events["hasFocus"] = events["hasFocus"].fillna(False).astype(bool)
+    isClick = events["type"].isin(CLICK_TYPES)
+    events["rank"] = 0
+    events.loc[isClick, "rank"] = [int(metadata[0]) for metadata in events.loc[isClick, "metadata"]]
+    return events.drop(columns=["seq", "metadata"])
+
+
+def computeCohortMetrics(events):
+    """
+    Calculate the search behavior metrics of all participants at once
+    with grouped array operations, see logs.calculateMetricsPerSubmission
+    for the metrics. Participants are included in the same way and in the
+    same order as by logs.groupLogsPerSubmission: from their first
+    started event on.
+
+    :param events: DataFrame with the events in the order of the logs, see eventsFrame
+    :return: DataFrame with one row of metrics per participant
+    """
+    position = np.arange(len(events))
+    isStart = ((events["eventType"] == "statusEvent") & (events["type"] == "started")).values
+
+    # Drop the events of a participant before the first started event, and participants without ID
+    firstStart = pd.Series(np.where(isStart, position, len(events))).groupby(events["prolificID"].values).transform("min")
+    kept = (position >= firstStart.fillna(len(events)).values) & events["prolificID"].notna().values
+    firstStartPositions = np.flatnonzero(kept & (position == firstStart.values))
+    participants = events["prolificID"].values[firstStartPositions]
+    startTime = events["timestamp"].values[firstStartPositions]
+
+    # Group the events per participant, keeping the order of the logs within a participant
+    participant = pd.Categorical(events["prolificID"].values[kept], categories=participants).codes
+    order = np.argsort(participant, kind="stable")
+    participant = participant[order]
+    events = events[kept].iloc[order]
+    count = len(participants)
+    eventTypes = events["type"].values
+    timestamps = events["timestamp"].values
+
+    # Time used: from the first start to the last stop
+    stops = np.flatnonzero(eventTypes == "stopped")
+    # Also without any stopped events, which would make a mask of one element for no stops
+    lastOfStops = np.ones(len(stops), dtype=bool)
+    lastOfStops[:-1] = participant[stops][:-1] != participant[stops][1:]
+    lastStops = stops[lastOfStops]
+    stopTime = np.zeros(count, dtype=np.int64)
+    stopTime[participant[lastStops]] = timestamps[lastStops]
+    timeUsed = (stopTime - startTime) / 1000
+
+    # Dwell time: intervals between focus changes that end in losing focus,
+    # plus the interval until the stop if the last change gained focus
+    isFocus = eventTypes == "viewportFocusChange"
+    focusParticipant = participant[isFocus]
+    focusTimestamps = timestamps[isFocus]
+    hasFocus = events["hasFocus"].values[isFocus]
+    firstOfParticipant = np.ones(len(focusParticipant), dtype=bool)
+    firstOfParticipant[1:] = focusParticipant[1:] != focusParticipant[:-1]
+    previousTimestamps = np.where(firstOfParticipant, startTime[focusParticipant], np.roll(focusTimestamps, 1))
+    focusTime = np.zeros(count, dtype=np.int64)
+    np.add.at(focusTime, focusParticipant[~hasFocus], (focusTimestamps - previousTimestamps)[~hasFocus])
+    lastOfParticipant = np.ones(len(focusParticipant), dtype=bool)
+    lastOfParticipant[:-1] = focusParticipant[:-1] != focusParticipant[1:]
+    endsWithFocus = lastOfParticipant & hasFocus
+    np.add.at(focusTime, focusParticipant[endsWithFocus], stopTime[focusParticipant[endsWithFocus]] - focusTimestamps[endsWithFocus])
+    dwellTime = focusTime / 1000 / (timeUsed / 60)
+    dwellTime[dwellTime == 0] = 60
+
+    # Result clicks
+    isClick = np.isin(eventTypes, CLICK_TYPES)
+    clickParticipant = participant[isClick]
+    ranks = events["rank"].values[isClick].astype(np.int64)
+    clicks = np.bincount(clickParticipant, minlength=count)
+    rankSum = np.zeros(count, dtype=np.int64)
+    np.add.at(rankSum, clickParticipant, ranks)
+    deepestRank = np.zeros(count, dtype=np.int64)
+    np.maximum.at(deepestRank, clickParticipant, ranks)
+
+    # Queries and SERPs: a SERP is visited whenever the new URL is a SERP, a query
+    # is issued when the query differs from the one of the previous URL.
+    # Every distinct URL and query is only parsed once.
+    isURLChange = eventTypes == "URLChange"
+    urlParticipant = participant[isURLChange]
+    urlChanges = isURLChange.sum()
+    urlCodes, urls = pd.factorize(np.concatenate([events["newURL"].values[isURLChange], events["previousURL"].values[isURLChange]]))
+    queryserps = pd.Series(urls, dtype=object).str.extract(QUERYSERP_URL.pattern)
+    isQueryserpURL = queryserps[0].notna().values
+    newURL, previousURL = urlCodes[:urlChanges], urlCodes[urlChanges:]
+    rawQueryCodes, rawQueries = pd.factorize(queryserps[1].values)
+    isSerp = isQueryserpURL[newURL]
+    isQuery = isSerp & (~isQueryserpURL[previousURL] | (rawQueryCodes[newURL] != rawQueryCodes[previousURL]))
+    queries = pd.Series(rawQueries, dtype=object).map(lambda query: unquote(unquote(query)))
+    queryParticipant = urlParticipant[isQuery]
+    queryCodes = rawQueryCodes[newURL[isQuery]]
+    queriesIssued = np.bincount(queryParticipant, minlength=count)
+    queryWords = np.bincount(queryParticipant, weights=queries.str.split().str.len().values[queryCodes], minlength=count)
+    queryChars = np.bincount(queryParticipant, weights=queries.str.len().values[queryCodes], minlength=count)
+    serpsVisited = np.bincount(urlParticipant[isSerp], minlength=count)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            "prolificId": participants,
+            "queriesIssued": queriesIssued,
+            "queryRate": queriesIssued / (timeUsed / 60),
+            "avgQueryLengthWords": np.where(queriesIssued == 0, 0, queryWords / queriesIssued),
+            "avgQueryLengthChars": np.where(queriesIssued == 0, 0, queryChars / queriesIssued),
+            "serpsVisited": serpsVisited,
+            "noOfResultsClicked": clicks,
+            "deepestRankVisitedResults": deepestRank,
+            "avgRankVisitedResults": np.where(clicks == 0, 0, rankSum / clicks),
+            "dwellTimePerMinute": dwellTime,
+            "timeUsed": timeUsed,
+        }, columns=METRIC_COLUMNS)
+
+
+def validateCohortMetrics(logs):
+    """
+    Compare the cohort metrics with the ones calculated per participant
+    by logs.streamMetricsPerSubmission.
+
+    :param logs: list of the raw, ungrouped logs
+    :return: list of (prolificId, metric, per participant value, cohort value) that differ
+    """
+    from logs import streamMetricsPerSubmission
+
+    # Silence the debug output of the per participant implementation
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = streamMetricsPerSubmission(logs)
+    actual = computeCohortMetrics(eventsFrame(logs)).to_dict("records")
+
+    differences = []
+    if [metrics["prolificId"] for metrics in expected] != [metrics["prolificId"] for metrics in actual]:
+        differences.append((None, "prolificId", len(expected), len(actual)))
+        return differences
+    for expectedMetrics, actualMetrics in zip(expected, actual):
+        for column in METRIC_COLUMNS[1:]:
+            if expectedMetrics[column] != actualMetrics[column]:
+                differences.append((expectedMetrics["prolificId"], column, expectedMetrics[column], actualMetrics[column]))
+    return differences
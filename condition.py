@@ -1,24 +1,35 @@
+import argparse
 import json
 
+from tableWriter import TableWriter, writeTable
 
-def processConditions(file, outfile):
+
+def processConditions(file, outfile, storeDir=None):
     """
     Convert the raw JSON conditions to a CSV file.
 
     :param file: file containing the raw conditions to convert
     :param outfile: file to write output too
+    :param storeDir: read the conditions from this columnar store (see ingest.py) instead
     :return: None
     """
+    if storeDir is not None:
+        # Only import pyarrow when the store is used
+        from ingest import readCollection
+        writeTable(outfile, ["prolificID", "condition"], ([condition['_id'], condition['condition']] for condition in readCollection(storeDir, "bbtCondition")))
+        return
+
     with open(file, "r") as conditions_file:
-        with open(outfile, "w") as csv_file:
-            csv_file.write("prolificID,condition\n")
+        with TableWriter(outfile, ["prolificID", "condition"]) as writer:
             for line in conditions_file:
                 pretask = json.loads(line)
-                csv_file.write(pretask['_id'] + "," + str(pretask['condition']) + "\n")
-        csv_file.close()
-    conditions_file.close()
+                writer.writeRow([pretask['_id'], pretask['condition']])
 
 
 if __name__ == '__main__':
-    processConditions("/home/mike/git/bbt-analysis/data/in/condition.json", "/home/mike/git/bbt-analysis/data/out/condition.csv")
+    parser = argparse.ArgumentParser(description="Condition of every participant.")
+    parser.add_argument("--store", default=None, help="read the conditions from this columnar store (see ingest.py)")
+    args = parser.parse_args()
+
+    processConditions("/home/mike/git/bbt-analysis/data/in/condition.json", "/home/mike/git/bbt-analysis/data/out/condition.csv", args.store)
 
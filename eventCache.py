@@ -0,0 +1,236 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+from logEvent import LogEvent
+from logs import CONDITIONS
+
+# Header: magic, size and modification time of the log file, hash of the code,
+# offsets of the string table and the index, number of strings and participants
+HEADER = struct.Struct("<8sqq16sqqqq")
+MAGIC = b"BBTEVT01"
+
+# One event: timestamp, ids of eventType, type, newURL, previousURL, resultTitle,
+# resultQuery and viewportSize in the string table, rank and hasFocus. -1 is None.
+RECORD = struct.Struct("<q8ib")
+
+# One participant: id of the prolific ID, offset of the first event, number of events
+INDEX_ENTRY = struct.Struct("<iqq")
+
+# Scripts converting the events, the cache is built again when one changes
+CODE_FILES = ["eventCache.py", "logEvent.py", "timestamps.py"]
+
+
+def codeHash():
+    """
+    Hash the scripts converting the events, so a cache built by other code is not used.
+
+    :return: digest of 16 bytes
+    """
+    hash = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for script in CODE_FILES:
+        with open(os.path.join(directory, script), "rb") as file:
+            hash.update(file.read())
+    return hash.digest()[:16]
+
+
+def buildEventCache(logFile, cacheFile):
+    """
+    Group the events of a log file per participant, as groupLogsPerSubmission
+    does, and write them to a binary cache file. The events of a participant
+    are stored next to each other as fixed size records, with the strings in
+    one shared table and an index from prolific ID to the first record.
+    The file is written under another name first and then renamed, so a
+    reader never sees a half written cache.
+
+    :param logFile: file containing the raw logs
+    :param cacheFile: file to write the cache to
+    :return: None
+    """
+    from logs import groupLogsPerSubmission, iterLogs
+
+    stat = os.stat(logFile)
+    grouped = groupLogsPerSubmission(iterLogs(logFile))
+    strings = {}
+
+    def stringId(string):
+        if string is None:
+            return -1
+        id = strings.get(string)
+        if id is None:
+            id = strings[string] = len(strings)
+        return id
+
+    index = []
+    temporaryFile = cacheFile + ".tmp"
+    with open(temporaryFile, "wb") as cache_file:
+        cache_file.write(bytes(HEADER.size))
+        offset = HEADER.size
+        for (prolificid, events) in grouped.items():
+            index.append(INDEX_ENTRY.pack(stringId(prolificid), offset, len(events)))
+            cache_file.write(b"".join(RECORD.pack(e.timestamp, stringId(e.eventType), stringId(e.type), stringId(e.newURL), stringId(e.previousURL),
+                                                  stringId(e.resultTitle), stringId(e.resultQuery), stringId(e.viewportSize),
+                                                  -1 if e.rank is None else e.rank, -1 if e.hasFocus is None else int(e.hasFocus))
+                                      for e in events))
+            offset += len(events) * RECORD.size
+
+        # String table: the end offset of every string, then the UTF-8 bytes of all strings
+        encoded = [string.encode("utf-8") for string in strings]
+        ends = []
+        end = 0
+        for string in encoded:
+            end += len(string)
+            ends.append(end)
+        stringsOffset = offset
+        cache_file.write(struct.pack("<%dq" % len(ends), *ends))
+        cache_file.write(b"".join(encoded))
+
+        indexOffset = stringsOffset + 8 * len(ends) + end
+        cache_file.write(b"".join(index))
+        cache_file.seek(0)
+        cache_file.write(HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns, codeHash(), stringsOffset, indexOffset, len(strings), len(index)))
+    os.replace(temporaryFile, cacheFile)
+
+
+def isCurrent(cacheFile, logFile):
+    """
+    Check whether a cache was built from the current log file by the current code.
+
+    :param cacheFile: the cache file
+    :param logFile: the log file the cache was built from
+    :return: True if the cache can be used
+    """
+    if not os.path.exists(cacheFile):
+        return False
+    with open(cacheFile, "rb") as cache_file:
+        header = cache_file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return False
+    (magic, size, mtime, code) = HEADER.unpack(header)[:4]
+    stat = os.stat(logFile)
+    return magic == MAGIC and size == stat.st_size and mtime == stat.st_mtime_ns and code == codeHash()
+
+
+class EventCache:
+    """
+    Read only view of a cache file built by buildEventCache. The file is
+    memory-mapped, so opening it only reads the header and the index, and
+    the events of a participant are read from their own block without
+    touching the rest of the file. Strings are decoded when first used.
+    Several processes can open the same cache and share its pages.
+    """
+
+    def __init__(self, cacheFile):
+        """
+        :param cacheFile: the cache file
+        """
+        with open(cacheFile, "rb") as cache_file:
+            self.data = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, _, _, _, self.stringsOffset, indexOffset, self.stringCount, participants) = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            self.data.close()
+            raise ValueError(cacheFile + " is not an event cache")
+        self.stringsStart = self.stringsOffset + 8 * self.stringCount
+        self.strings = {}
+        # Prolific ID -> (offset of the first event, number of events), in the order of groupLogsPerSubmission
+        self.index = {self.string(id): (offset, count)
+                      for (id, offset, count) in struct.iter_unpack(INDEX_ENTRY.format, self.data[indexOffset:indexOffset + participants * INDEX_ENTRY.size])}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        """
+        :return: None
+        """
+        self.data.close()
+
+    def string(self, id):
+        """
+        :param id: id of a string in the string table, -1 for None
+        :return: the string, interned like the strings of LogEvent
+        """
+        if id < 0:
+            return None
+        string = self.strings.get(id)
+        if string is None:
+            end = struct.unpack_from("<q", self.data, self.stringsOffset + 8 * id)[0]
+            start = struct.unpack_from("<q", self.data, self.stringsOffset + 8 * (id - 1))[0] if id > 0 else 0
+            string = self.strings[id] = sys.intern(self.data[self.stringsStart + start:self.stringsStart + end].decode("utf-8"))
+        return string
+
+    def participants(self):
+        """
+        :return: the prolific IDs, in the order of groupLogsPerSubmission
+        """
+        return list(self.index)
+
+    def block(self, prolificid):
+        """
+        :param prolificid: prolific ID of a participant
+        :return: the records of the events of the participant, as a memoryview of the mapped file
+        """
+        (offset, count) = self.index[prolificid]
+        return memoryview(self.data)[offset:offset + count * RECORD.size]
+
+    def events(self, prolificid):
+        """
+        :param prolificid: prolific ID of a participant
+        :return: list with the events of the participant as LogEvent, as groupLogsPerSubmission gives them
+        """
+        string = self.string
+        events = []
+        block = self.block(prolificid)
+        for (timestamp, eventType, type, newURL, previousURL, resultTitle, resultQuery, viewportSize, rank, hasFocus) in RECORD.iter_unpack(block):
+            event = LogEvent(prolificid, string(eventType), string(type), timestamp)
+            event.newURL = string(newURL)
+            event.previousURL = string(previousURL)
+            event.resultTitle = string(resultTitle)
+            event.resultQuery = string(resultQuery)
+            event.viewportSize = string(viewportSize)
+            event.rank = None if rank < 0 else rank
+            event.hasFocus = None if hasFocus < 0 else bool(hasFocus)
+            events.append(event)
+        block.release()
+        return events
+
+
+def openEventCache(logFile, cacheFile):
+    """
+    Open the cache of a log file, building it first if it does not
+    exist or the log file changed since it was built.
+
+    :param logFile: file containing the raw logs
+    :param cacheFile: the cache file
+    :return: the EventCache
+    """
+    if not isCurrent(cacheFile, logFile):
+        buildEventCache(logFile, cacheFile)
+    return EventCache(cacheFile)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the binary caches of the LogUI logs grouped per participant.")
+    parser.add_argument("conditions", nargs="*", default=CONDITIONS, help="conditions to build the cache of (default: all)")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the in/ and out/ directories")
+    parser.add_argument("--show", default=None, metavar="PROLIFICID", help="print the events of one participant instead")
+    args = parser.parse_args()
+
+    for condition in args.conditions:
+        logFile = args.data_dir + "/in/logs-" + condition + ".log"
+        with openEventCache(logFile, args.data_dir + "/out/.events-" + condition + ".cache") as cache:
+            if args.show is None:
+                print(logFile + ": " + str(len(cache)) + " participants")
+            elif args.show in cache.index:
+                for event in cache.events(args.show):
+                    print({field: getattr(event, field) for field in LogEvent.__slots__ if getattr(event, field) is not None})
@@ -0,0 +1,215 @@
+import codecs
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import instrumentation
+
+from logs import CSV_COLUMNS, metricsRow
+from metrics import SubmissionMetrics
+from tableWriter import TableWriter, readTable
+
+# Scripts calculating the metrics and writing their rows, the checkpoint is discarded when one changes
+CODE_FILES = ["incremental.py", "logs.py", "metrics.py", "logEvent.py", "timestamps.py"]
+
+# Number of bytes before the high-water mark used to check the log file was only appended to
+GUARD_SIZE = 4096
+
+
+def codeHash():
+    """
+    Hash the scripts calculating the metrics, so a checkpoint made by
+    other code is not used.
+
+    :return: hex digest
+    """
+    hash = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for script in CODE_FILES:
+        with open(os.path.join(directory, script), "rb") as file:
+            hash.update(file.read())
+    return hash.hexdigest()
+
+
+def guardHash(logFile, offset):
+    """
+    Hash the bytes just before the high-water mark. If they changed, the
+    log file was rewritten instead of appended to.
+
+    :param logFile: file containing the raw logs
+    :param offset: the high-water mark
+    :return: hex digest
+    """
+    with open(logFile, "rb") as file:
+        file.seek(max(0, offset - GUARD_SIZE))
+        return hashlib.sha256(file.read(offset - max(0, offset - GUARD_SIZE))).hexdigest()
+
+
+def openCheckpoint(checkpointFile, logFile):
+    """
+    Open the checkpoint database of a log file. It holds the pickled
+    accumulator state of every participant, so an update only loads the
+    participants with new events, and the high-water mark of the log file.
+    The checkpoint is emptied when it cannot be continued: it was made by
+    other code or the log file was not only appended to.
+
+    :param checkpointFile: SQLite file the checkpoint is stored in
+    :param logFile: file containing the raw logs
+    :return: (connection, dictionary with the high-water mark, format and guard)
+    """
+    connection = sqlite3.connect(checkpointFile)
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+    connection.execute("CREATE TABLE IF NOT EXISTS participants (prolificID TEXT PRIMARY KEY, seq INTEGER, stopped INTEGER, state BLOB)")
+    meta = dict(connection.execute("SELECT key, value FROM meta"))
+    if meta.get('code') != codeHash() or os.path.getsize(logFile) < meta.get('offset', 0) or guardHash(logFile, meta.get('offset', 0)) != meta.get('guard'):
+        connection.execute("DELETE FROM participants")
+        meta = {"code": codeHash(), "offset": 0, "format": None}
+    return connection, meta
+
+
+def readNewLogs(logFile, offset, format):
+    """
+    Read the events added to a log file after the high-water mark. Both
+    NDJSON files and JSON array exports whose array was extended are
+    supported. An event that is still being written is left for the next run.
+
+    :param logFile: file containing the raw logs
+    :param offset: byte offset just after the last event read before, 0 for a new file
+    :param format: "array" or "ndjson", None to detect it from the first character
+    :return: (list of the new events, new high-water mark, format)
+    """
+    with open(logFile, "rb") as file:
+        file.seek(offset)
+        data = file.read()
+
+    if format is None:
+        start = len(data) - len(data.lstrip())
+        if start == len(data):
+            return [], offset, None
+        if data[start:start + 1] == b'[':
+            format = "array"
+            offset += start + 1
+            data = data[start + 1:]
+        else:
+            format = "ndjson"
+
+    logs = []
+    if format == "ndjson":
+        lines = data.split(b'\n')
+        for line in lines[:-1]:
+            if line.strip():
+                logs.append(json.loads(line))
+            offset += len(line) + 1
+        # The last line has no newline yet, only use it when it is complete
+        if lines[-1].strip():
+            try:
+                logs.append(json.loads(lines[-1]))
+                offset += len(lines[-1])
+            except json.JSONDecodeError:
+                pass
+        return logs, offset, format
+
+    # Decode without the bytes of a character that is cut off at the end
+    text = codecs.getincrementaldecoder("utf-8")().decode(data, final=False)
+    decoder = json.JSONDecoder()
+    pos = 0
+    end = 0
+    while True:
+        while pos < len(text) and text[pos] in ' \t\r\n,':
+            pos += 1
+        # Stop before the closing bracket, a later export continues the array there
+        if pos == len(text) or text[pos] == ']':
+            break
+        try:
+            log, pos = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            break
+        logs.append(log)
+        end = pos
+    return logs, offset + len(text[:end].encode("utf-8")), format
+
+
+def updateLogFile(logFile, outFile, checkpointFile):
+    """
+    Update the search behavior metrics of a log file with the events added
+    since the last update. The state of the accumulators of every
+    participant is kept in a checkpoint together with the byte offset up to
+    which the log file was read, so only the new events are processed and
+    only the participants with new events are loaded and recalculated.
+    Participants without a stopped event yet are left out until they stopped.
+    Otherwise the CSV file is the same as the one of logs.processLogFile.
+
+    The log file is processed from the start when there is no checkpoint,
+    when it was not only appended to or when the metrics code changed.
+
+    :param logFile: file containing the raw logs
+    :param outFile: CSV file with the metrics, is updated, may be compressed
+    :param checkpointFile: file to keep the state in between updates
+    :return: number of new events
+    """
+    connection, meta = openCheckpoint(checkpointFile, logFile)
+    with instrumentation.timer("incremental.readNewLogs"):
+        logs, meta['offset'], meta['format'] = readNewLogs(logFile, meta['offset'], meta['format'])
+
+    # Same as logs.streamMetricsPerSubmission, but continuing the state of the checkpoint
+    submissions = {}
+    stopped = set()
+    (nextSeq,) = connection.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM participants").fetchone()
+    for log in logs:
+        prolificid = log['applicationSpecificData']['prolificID']
+        metrics = submissions.get(prolificid)
+        if metrics is None:
+            stored = connection.execute("SELECT seq, stopped, state FROM participants WHERE prolificID = ?", (prolificid,)).fetchone()
+            if stored is not None:
+                metrics = pickle.loads(stored[2])
+                submissions[prolificid] = metrics
+                if stored[1]:
+                    stopped.add(prolificid)
+            elif prolificid is None or not (log['eventType'] == "statusEvent" and log['eventDetails']['type'] == "started"):
+                continue
+            else:
+                metrics = SubmissionMetrics(prolificid)
+                submissions[prolificid] = metrics
+                connection.execute("INSERT INTO participants VALUES (?, ?, 0, NULL)", (prolificid, nextSeq))
+                nextSeq += 1
+        metrics.feed(log)
+        if log['eventDetails']['type'] == "stopped":
+            stopped.add(prolificid)
+
+    rows = {}
+    if os.path.exists(outFile):
+        existingRows = readTable(outFile)
+        next(existingRows)
+        rows = {row[0]: row for row in existingRows}
+    for (prolificid, metrics) in submissions.items():
+        connection.execute("UPDATE participants SET stopped = ?, state = ? WHERE prolificID = ?",
+                           (prolificid in stopped, pickle.dumps(metrics, protocol=pickle.HIGHEST_PROTOCOL), prolificid))
+        rows.pop(prolificid, None)
+
+    # The temporary file keeps the extension, so it is compressed in the same way
+    temporaryFile = os.path.join(os.path.dirname(outFile), ".tmp-" + os.path.basename(outFile))
+    with TableWriter(temporaryFile, CSV_COLUMNS) as writer:
+        # Participants that are still busy get their row once they stopped
+        for (prolificid,) in connection.execute("SELECT prolificID FROM participants WHERE stopped ORDER BY seq").fetchall():
+            if prolificid not in rows:
+                metrics = submissions.get(prolificid)
+                if metrics is None:
+                    (state,) = connection.execute("SELECT state FROM participants WHERE prolificID = ?", (prolificid,)).fetchone()
+                    metrics = pickle.loads(state)
+                instrumentation.log(instrumentation.DEBUG, "***********************************************")
+                submissionMetrics = metrics.finalize()
+                instrumentation.log(instrumentation.DEBUG, submissionMetrics)
+                rows[prolificid] = metricsRow(submissionMetrics)
+            writer.writeRow(rows[prolificid])
+    os.replace(temporaryFile, outFile)
+
+    # The CSV file is written first, so an interrupted update is done again the next time
+    meta['guard'] = guardHash(logFile, meta['offset'])
+    connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta.items())
+    connection.commit()
+    connection.close()
+    instrumentation.count("incremental.events", len(logs))
+    instrumentation.count("incremental.participantsUpdated", len(submissions))
+    instrumentation.log(instrumentation.INFO, logFile + ": " + str(len(logs)) + " new events, " + str(len(submissions)) + " participants updated")
+    return len(logs)
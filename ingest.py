@@ -0,0 +1,375 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import argparse
+import json
+import os
+from logs import iterLogs, CONDITIONS
+from timestamps import parseTimestampMicros, formatTimestamp
+
+# Columns of the LogUI events in the store. Only the fields used by the analysis are kept.
+LOG_SCHEMA = pa.schema([
+    ('seq', pa.int64()),
+    ('prolificID', pa.string()),
+    ('eventType', pa.string()),
+    ('type', pa.string()),
+    ('name', pa.string()),
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('hasFocus', pa.bool_()),
+    ('newURL', pa.string()),
+    ('previousURL', pa.string()),
+    ('viewportWidth', pa.int32()),
+    ('viewportHeight', pa.int32()),
+    ('stringRepr', pa.string()),
+    ('metadata', pa.list_(pa.string())),
+])
+
+# MongoDB collection exports and the files they are exported to
+COLLECTIONS = {"bbtArguments": "args.json",
+               "bbtPretask": "pretask.json",
+               "bbtPosttask": "posttask.json",
+               "bbtCondition": "condition.json"}
+
+BATCH_SIZE = 100000
+
+# Version of the layout of the store, sources ingested with another layout are ingested again
+STORE_VERSION = 2
+
+# Arrow types of the values of documents that are stored as such, other values are stored as JSON text
+SCALAR_TYPES = {'bool': pa.bool_(), 'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+
+
+def logCondition(logFile):
+    """
+    Get the condition of a LogUI export from its file name, e.g. logs-list.log.
+
+    :param logFile: the LogUI export
+    :return: the condition
+    """
+    name = os.path.splitext(os.path.basename(logFile))[0]
+    return name[len("logs-"):] if name.startswith("logs-") else name
+
+
+def eventToRow(seq, log):
+    """
+    Flatten one LogUI event to a row of the store.
+
+    :param seq: position of the event in the export
+    :param log: the event as JSON
+    :return: the row as a dictionary with the columns of LOG_SCHEMA
+    """
+    details = log['eventDetails']
+    resolution = details.get('viewportResolution') or {}
+    metadata = log.get('metadata')
+    return {'seq': seq,
+            'prolificID': log['applicationSpecificData']['prolificID'],
+            'eventType': log['eventType'],
+            'type': details['type'],
+            'name': details.get('name'),
+            'timestamp': parseTimestampMicros(log['timestamps']['eventTimestamp']),
+            'hasFocus': details.get('hasFocus'),
+            'newURL': details.get('newURL'),
+            'previousURL': details.get('previousURL'),
+            'viewportWidth': resolution.get('width'),
+            'viewportHeight': resolution.get('height'),
+            'stringRepr': details.get('stringRepr'),
+            'metadata': None if metadata is None else [None if m.get('value') is None else str(m['value']) for m in metadata]}
+
+
+def rowToEvent(row):
+    """
+    Rebuild a LogUI event from a row of the store, with the same
+    structure as the export but only the fields kept in the store.
+
+    :param row: the row with the timestamp in micros
+    :return: the event as JSON
+    """
+    details = {'type': row['type']}
+    for field in ('name', 'hasFocus', 'newURL', 'previousURL', 'stringRepr'):
+        if row[field] is not None:
+            details[field] = row[field]
+    if row['viewportWidth'] is not None:
+        details['viewportResolution'] = {'width': row['viewportWidth'], 'height': row['viewportHeight']}
+    log = {'eventType': row['eventType'],
+           'eventDetails': details,
+           'timestamps': {'eventTimestamp': formatTimestamp(row['timestamp'])},
+           'applicationSpecificData': {'prolificID': row['prolificID']}}
+    if row['metadata'] is not None:
+        log['metadata'] = [{'value': value} for value in row['metadata']]
+    return log
+
+
+def loadManifest(storeDir):
+    """
+    Load the manifest of the store, recording which sources were ingested.
+
+    :param storeDir: directory of the store
+    :return: the manifest
+    """
+    path = os.path.join(storeDir, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def updateManifest(storeDir, key, source):
+    """
+    Record that a source has been ingested.
+
+    :param storeDir: directory of the store
+    :param key: the part of the store the source was written to
+    :param source: the ingested file
+    :return: None
+    """
+    manifest = loadManifest(storeDir)
+    stat = os.stat(source)
+    manifest[key] = {'source': os.path.abspath(source), 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'version': STORE_VERSION}
+    with open(os.path.join(storeDir, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def isIngested(storeDir, key, source):
+    """
+    Check whether the source was ingested with the current layout of the
+    store and has not changed since.
+
+    :param storeDir: directory of the store
+    :param key: the part of the store the source is written to
+    :param source: the file to check
+    :return: True if ingesting again can be skipped
+    """
+    entry = loadManifest(storeDir).get(key)
+    stat = os.stat(source)
+    return (entry is not None and entry.get('version') == STORE_VERSION and entry['source'] == os.path.abspath(source)
+            and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns)
+
+
+def ingestLogs(logFile, storeDir, force=False):
+    """
+    Convert a LogUI export to the store. The events of a condition are
+    written to logs/condition=<condition>/events.parquet in batches, in
+    the order of the export, so they can be read back in that order one
+    row group at a time. The position in the export is kept in the seq
+    column.
+
+    :param logFile: the LogUI export (JSON array or NDJSON)
+    :param storeDir: directory of the store
+    :param force: ingest even if the export did not change
+    :return: None
+    """
+    condition = logCondition(logFile)
+    key = "logs/" + condition
+    if not force and isIngested(storeDir, key, logFile):
+        return
+
+    eventsFile = logPartitionFile(storeDir, condition)
+    os.makedirs(os.path.dirname(eventsFile), exist_ok=True)
+    # Written next to the events and renamed when complete, so readers never see a partial export.
+    # Datasets skip files starting with a dot, so a partial file left by a crash is not read either.
+    partialFile = os.path.join(os.path.dirname(eventsFile), ".events.parquet.partial")
+
+    # Write the events in batches so the export is never held as JSON, every batch is a row group
+    with pq.ParquetWriter(partialFile, LOG_SCHEMA, compression='zstd') as writer:
+        rows = []
+        for seq, log in enumerate(iterLogs(logFile)):
+            rows.append(eventToRow(seq, log))
+            if len(rows) == BATCH_SIZE:
+                writer.write_table(pa.Table.from_pylist(rows, schema=LOG_SCHEMA))
+                rows = []
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=LOG_SCHEMA))
+    os.replace(partialFile, eventsFile)
+    updateManifest(storeDir, key, logFile)
+
+
+def logPartitionFile(storeDir, condition):
+    """
+    Get the file with the events of a condition in the store.
+
+    :param storeDir: directory of the store
+    :param condition: the condition, see logCondition
+    :return: path of the Parquet file
+    """
+    return os.path.join(storeDir, "logs", "condition=" + condition, "events.parquet")
+
+
+def iterDocuments(file):
+    """
+    Read a MongoDB collection export one document at a time.
+
+    :param file: the collection export
+    :return: generator yielding the documents as JSON
+    """
+    with open(file) as collection_file:
+        for line in collection_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def valueKind(value):
+    """
+    Get the kind of a value in a document: one of the keys of SCALAR_TYPES,
+    ('list', kinds of the elements) or 'json' for anything else.
+
+    :param value: the value, not None
+    :return: the kind
+    """
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'str'
+    if isinstance(value, list):
+        return ('list', frozenset(valueKind(element) for element in value if element is not None))
+    return 'json'
+
+
+def columnType(kinds):
+    """
+    Get the Arrow type of a field from the kinds of its values. Integers
+    and floats together are floats. Values of different kinds, e.g. attn as
+    1 in one document and "1" in another, cannot be in one typed column.
+
+    :param kinds: set with the kinds of the values, see valueKind
+    :return: the Arrow type, or None if the values are stored as JSON text
+    """
+    if not kinds:
+        return pa.string()
+    if kinds <= {'int', 'float'}:
+        return pa.float64() if 'float' in kinds else pa.int64()
+    if all(isinstance(kind, tuple) for kind in kinds):
+        elementType = columnType(frozenset().union(*(kind[1] for kind in kinds)))
+        return None if elementType is None else pa.list_(elementType)
+    if len(kinds) == 1:
+        return SCALAR_TYPES.get(next(iter(kinds)))
+    return None
+
+
+def collectionSchema(file):
+    """
+    Find the columns of a collection export: the fields of all documents,
+    not only the ones of the first document, with the type of their values.
+
+    :param file: the collection export
+    :return: (schema, set of the fields stored as text)
+    """
+    kinds = {}
+    for document in iterDocuments(file):
+        for (field, value) in document.items():
+            fieldKinds = kinds.setdefault(field, set())
+            if value is not None:
+                fieldKinds.add(valueKind(value))
+    types = {field: columnType(fieldKinds) for (field, fieldKinds) in kinds.items()}
+    textFields = {field for (field, type) in types.items() if type is None}
+    return pa.schema([(field, pa.string() if type is None else type) for (field, type) in types.items()]), textFields
+
+
+def ingestCollection(file, storeDir, collection, force=False):
+    """
+    Convert a MongoDB collection export (one JSON document per line)
+    to <collection>.parquet in the store, in the order of the export.
+    The export is read twice, once for the schema and once to write the
+    documents in batches. Values of fields with mixed types are stored as
+    JSON text, e.g. "1" for 1, as one column has one type.
+
+    :param file: the collection export
+    :param storeDir: directory of the store
+    :param collection: name of the collection, e.g. bbtArguments
+    :param force: ingest even if the export did not change
+    :return: None
+    """
+    if not force and isIngested(storeDir, collection, file):
+        return
+
+    schema, textFields = collectionSchema(file)
+    os.makedirs(storeDir, exist_ok=True)
+    collectionFile = os.path.join(storeDir, collection + ".parquet")
+
+    def column(field, documents):
+        values = [document.get(field) for document in documents]
+        if field in textFields:
+            values = [value if value is None or isinstance(value, str) else json.dumps(value) for value in values]
+        return values
+
+    with pq.ParquetWriter(collectionFile + ".partial", schema, compression='zstd') as writer:
+        documents = []
+        for document in iterDocuments(file):
+            documents.append(document)
+            if len(documents) == BATCH_SIZE:
+                writer.write_table(pa.Table.from_pydict({field: column(field, documents) for field in schema.names}, schema=schema))
+                documents = []
+        if documents:
+            writer.write_table(pa.Table.from_pydict({field: column(field, documents) for field in schema.names}, schema=schema))
+    os.replace(collectionFile + ".partial", collectionFile)
+    updateManifest(storeDir, collection, file)
+
+
+def readLogTable(storeDir, conditions=None, columns=None, prolificIDs=None):
+    """
+    Read LogUI events from the store. Only the requested columns are read.
+
+    :param storeDir: directory of the store
+    :param conditions: conditions to read, defaults to all
+    :param columns: columns to read, defaults to all (plus condition)
+    :param prolificIDs: participants to read, defaults to all
+    :return: the events as a pyarrow Table
+    """
+    dataset = ds.dataset(os.path.join(storeDir, "logs"), format="parquet", partitioning="hive")
+    filter = None
+    if conditions is not None:
+        filter = pc.field('condition').isin(conditions)
+    if prolificIDs is not None:
+        participantFilter = pc.field('prolificID').isin(prolificIDs)
+        filter = participantFilter if filter is None else filter & participantFilter
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+def iterStoredLogs(storeDir, logFile):
+    """
+    Read the events of an ingested LogUI export in the order of the
+    export, in the same structure as iterLogs. The events are stored in
+    that order, so only one batch is held in memory at a time.
+
+    :param storeDir: directory of the store
+    :param logFile: the LogUI export that was ingested
+    :return: generator yielding the events
+    """
+    events = pq.ParquetFile(logPartitionFile(storeDir, logCondition(logFile)))
+    for batch in events.iter_batches(batch_size=BATCH_SIZE, columns=LOG_SCHEMA.names):
+        batch = batch.set_column(batch.schema.get_field_index('timestamp'), 'timestamp', pc.cast(batch['timestamp'], pa.int64()))
+        for row in batch.to_pylist():
+            yield rowToEvent(row)
+
+
+def readCollection(storeDir, collection, columns=None):
+    """
+    Read documents of a collection from the store. Fields that a document
+    did not have in the export are left out, as in the export.
+
+    :param storeDir: directory of the store
+    :param collection: name of the collection, e.g. bbtArguments
+    :param columns: fields to read, defaults to all
+    :return: list of the documents as dictionaries
+    """
+    return [{field: value for (field, value) in document.items() if value is not None}
+            for document in pq.read_table(os.path.join(storeDir, collection + ".parquet"), columns=columns).to_pylist()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the LogUI logs and MongoDB exports to a columnar store.")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the in/ directory")
+    parser.add_argument("--store", default=None, help="directory of the store (default: <data-dir>/store)")
+    parser.add_argument("--force", action="store_true", help="ingest again even if the exports did not change")
+    args = parser.parse_args()
+    storeDir = args.store or args.data_dir + "/store"
+
+    for condition in CONDITIONS:
+        ingestLogs(args.data_dir + "/in/logs-" + condition + ".log", storeDir, args.force)
+    for (collection, file) in COLLECTIONS.items():
+        ingestCollection(args.data_dir + "/in/" + file, storeDir, collection, args.force)
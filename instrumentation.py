@@ -0,0 +1,393 @@
+import contextlib
+import json
+import math
+import time
+
+# Levels of the debug output, from least to most output
+QUIET = 0
+# Progress, summaries and warnings
+INFO = 1
+# The metrics of every participant
+DEBUG = 2
+# Every query, SERP and click
+TRACE = 3
+
+# Level of the debug output. Hot paths check it before building a message:
+# if instrumentation.LEVEL >= instrumentation.TRACE: instrumentation.log(...)
+LEVEL = INFO
+
+# Report of the current run, None when instrumentation is disabled. Hot paths
+# check it before measuring anything, so a disabled run only pays for the check.
+REPORT = None
+
+# Number of functions in the profile of the report
+PROFILE_FUNCTIONS = 30
+
+# Number of source lines in the memory section of the report
+MEMORY_LINES = 15
+
+
+class Histogram:
+    """
+    Distribution of a value, e.g. the processing time of a participant,
+    in buckets that are powers of two. Quantiles are estimated as the
+    upper bound of their bucket, so they are at most a factor 2 too high.
+    Histograms of different processes can be merged.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        # Exponent e -> number of values in [2^(e-1), 2^e)
+        self.buckets = {}
+
+    def add(self, value):
+        """
+        :param value: the value to add, >= 0
+        :return: None
+        """
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        exponent = math.frexp(value)[1] if value > 0 else -1074
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def quantile(self, q):
+        """
+        :param q: the quantile, e.g. 0.99
+        :return: estimate of the quantile, None without values
+        """
+        if self.count == 0:
+            return None
+        seen = 0
+        for exponent in sorted(self.buckets):
+            seen += self.buckets[exponent]
+            if seen >= q * self.count:
+                return min(2.0 ** exponent, self.max)
+        return self.max
+
+    def toJSON(self):
+        """
+        :return: the histogram as JSON, with estimates of the median, 90th and 99th percentile
+        """
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else None,
+                "min": self.min, "max": self.max, "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+                "buckets": [[2.0 ** exponent, self.buckets[exponent]] for exponent in sorted(self.buckets)]}
+
+    @classmethod
+    def fromJSON(cls, data):
+        """
+        :param data: a histogram as JSON, see toJSON
+        :return: the histogram
+        """
+        histogram = cls()
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        histogram.buckets = {math.frexp(bound)[1] - 1: count for (bound, count) in data["buckets"]}
+        return histogram
+
+    def merge(self, other):
+        """
+        :param other: histogram to add the values of
+        :return: None
+        """
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        for (exponent, count) in other.buckets.items():
+            self.buckets[exponent] = self.buckets.get(exponent, 0) + count
+
+
+class Report:
+    """
+    Timers, counters and histograms of one run, with an optional cProfile
+    profile and tracemalloc memory trace.
+    """
+
+    def __init__(self, profile=False, memory=False):
+        """
+        :param profile: profile the run with cProfile
+        :param memory: trace the memory allocations with tracemalloc
+        """
+        self.started = time.time()
+        self.start = time.perf_counter()
+        # Name -> [seconds, calls]
+        self.timers = {}
+        self.counters = {}
+        self.histograms = {}
+        # Label -> profile and memory of a worker process
+        self.processes = {}
+        self.profiler = None
+        self.memory = memory
+        if profile:
+            # Only imported when profiling
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+
+    def toJSON(self):
+        """
+        :return: the report as JSON
+        """
+        report = {"started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                  "seconds": time.perf_counter() - self.start,
+                  "timers": {name: {"seconds": seconds, "calls": calls} for (name, (seconds, calls)) in self.timers.items()},
+                  "counters": dict(self.counters),
+                  "histograms": {name: histogram.toJSON() for (name, histogram) in self.histograms.items()}}
+        if self.profiler is not None:
+            report["profile"] = profileFunctions(self.profiler)
+        if self.memory:
+            report["memory"] = memoryLines()
+        if self.processes:
+            report["processes"] = self.processes
+        return report
+
+    def merge(self, report, label):
+        """
+        Add the report of a worker process.
+
+        :param report: the report as JSON
+        :param label: name of the work done by the process, e.g. a stage
+        :return: None
+        """
+        for (name, timer) in report["timers"].items():
+            total = self.timers.setdefault(name, [0.0, 0])
+            total[0] += timer["seconds"]
+            total[1] += timer["calls"]
+        for (name, value) in report["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        for (name, histogram) in report["histograms"].items():
+            self.histograms.setdefault(name, Histogram()).merge(Histogram.fromJSON(histogram))
+        process = {key: report[key] for key in ("seconds", "profile", "memory") if key in report}
+        self.processes[label] = process
+
+    def stop(self):
+        """
+        Stop profiling and tracing memory.
+
+        :return: None
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.stop()
+
+
+def profileFunctions(profiler):
+    """
+    :param profiler: the cProfile profiler
+    :return: the functions with the highest cumulative time, as JSON
+    """
+    import pstats
+    stats = pstats.Stats(profiler).stats
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_FUNCTIONS]
+    return [{"function": file + ":" + str(line) + "(" + name + ")", "calls": calls, "totalSeconds": total, "cumulativeSeconds": cumulative}
+            for ((file, line, name), (_, calls, total, cumulative, _)) in functions]
+
+
+def memoryLines():
+    """
+    :return: the current and peak traced memory and the lines allocating most, as JSON
+    """
+    import tracemalloc
+    current, peak = tracemalloc.get_traced_memory()
+    lines = tracemalloc.take_snapshot().statistics("lineno")[:MEMORY_LINES]
+    return {"currentBytes": current, "peakBytes": peak,
+            "lines": [{"line": str(statistic.traceback), "bytes": statistic.size, "blocks": statistic.count} for statistic in lines]}
+
+
+def log(level, message):
+    """
+    Print a debug message if the level of the debug output is high enough.
+    In hot paths, check LEVEL first so the message is not built for nothing.
+
+    :param level: level of the message, e.g. DEBUG
+    :param message: the message
+    :return: None
+    """
+    if LEVEL >= level:
+        print(message)
+
+
+def enable(profile=False, memory=False):
+    """
+    Start collecting a report of this run.
+
+    :param profile: profile the run with cProfile
+    :param memory: trace the memory allocations with tracemalloc
+    :return: None
+    """
+    global REPORT
+    REPORT = Report(profile, memory)
+
+
+def disable():
+    """
+    Stop collecting, the report is discarded.
+
+    :return: None
+    """
+    global REPORT
+    if REPORT is not None:
+        REPORT.stop()
+    REPORT = None
+
+
+def count(name, n=1):
+    """
+    :param name: name of the counter, e.g. logs.events
+    :param n: number to add
+    :return: None
+    """
+    if REPORT is not None:
+        REPORT.counters[name] = REPORT.counters.get(name, 0) + n
+
+
+def observe(name, value):
+    """
+    :param name: name of the histogram, e.g. logs.participantSeconds
+    :param value: the value to add
+    :return: None
+    """
+    if REPORT is not None:
+        histogram = REPORT.histograms.get(name)
+        if histogram is None:
+            histogram = REPORT.histograms[name] = Histogram()
+        histogram.add(value)
+
+
+def record(name, seconds):
+    """
+    Add a duration measured elsewhere to a timer, e.g. of work done by another process.
+
+    :param name: name of the timer
+    :param seconds: the duration
+    :return: None
+    """
+    if REPORT is not None:
+        total = REPORT.timers.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+
+@contextlib.contextmanager
+def _timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timer(name):
+    """
+    Time a block of code: with instrumentation.timer("logs.writeToCSV"): ...
+
+    :param name: name of the timer
+    :return: context manager
+    """
+    if REPORT is None:
+        return contextlib.nullcontext()
+    return _timer(name)
+
+
+def settings():
+    """
+    :return: the settings to pass to runInstrumented in a worker process
+    """
+    return {"level": LEVEL, "enabled": REPORT is not None,
+            "profile": REPORT is not None and REPORT.profiler is not None, "memory": REPORT is not None and REPORT.memory}
+
+
+def runInstrumented(settings, function, *args, **kwargs):
+    """
+    Run a function in a worker process with the instrumentation settings
+    of the main process. The report of the worker is returned, so the main
+    process can merge it into its own report.
+
+    :param settings: the settings of the main process, see settings()
+    :param function: module level function to run
+    :return: (result of the function, report of the worker as JSON or None)
+    """
+    global LEVEL
+    LEVEL = settings["level"]
+    # A forked worker has a copy of the report and the profiler of the main process
+    disable()
+    if not settings["enabled"]:
+        return function(*args, **kwargs), None
+    enable(settings["profile"], settings["memory"])
+    try:
+        result = function(*args, **kwargs)
+        return result, REPORT.toJSON()
+    finally:
+        disable()
+
+
+def merge(report, label):
+    """
+    Merge the report of a worker process, see runInstrumented.
+
+    :param report: the report of the worker, None if it had none
+    :param label: name of the work done by the worker
+    :return: None
+    """
+    if REPORT is not None and report is not None:
+        REPORT.merge(report, label)
+
+
+def addArguments(parser):
+    """
+    Add the command line arguments of the instrumentation to a script.
+
+    :param parser: the argparse parser of the script
+    :return: None
+    """
+    parser.add_argument("--verbosity", type=int, default=INFO, choices=[QUIET, INFO, DEBUG, TRACE],
+                        help="debug output: 0 none, 1 progress (default), 2 metrics per participant, 3 every query, SERP and click")
+    parser.add_argument("--report", default=None, help="write a JSON report with timers, counters and histograms to this file")
+    parser.add_argument("--profile", action="store_true", help="add a cProfile profile to the --report")
+    parser.add_argument("--trace-memory", action="store_true", help="add the memory allocations traced by tracemalloc to the --report")
+
+
+def configure(args):
+    """
+    Configure the instrumentation from the command line arguments, see addArguments.
+
+    :param args: the parsed command line arguments
+    :return: None
+    """
+    global LEVEL
+    LEVEL = args.verbosity
+    if (args.profile or args.trace_memory) and args.report is None:
+        raise SystemExit("--profile and --trace-memory are written to the report, give a --report file")
+    if args.report is not None:
+        enable(args.profile, args.trace_memory)
+
+
+def writeReport(file):
+    """
+    Write the report of this run as JSON and stop collecting.
+
+    :param file: the file to write to, None to only return the report
+    :return: the report as JSON, None if instrumentation is disabled
+    """
+    if REPORT is None:
+        return None
+    report = REPORT.toJSON()
+    disable()
+    if file is not None:
+        with open(file, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    return report
@@ -0,0 +1,184 @@
+import argparse
+import os
+import instrumentation
+
+from logs import iterLogs, CONDITIONS
+from tableWriter import readTable, TableWriter
+
+
+def indexTable(file):
+    """
+    Read a CSV file written by the other scripts into a hash index on the
+    prolific ID in its first column.
+
+    :param file: the CSV file, optionally compressed
+    :return: (names of the other columns, dictionary prolific ID -> other values,
+             prolific IDs that occur in more than one row)
+    """
+    rows = readTable(file)
+    header = next(rows)
+    index = {}
+    duplicates = set()
+    for row in rows:
+        if row[0] in index:
+            duplicates.add(row[0])
+        else:
+            index[row[0]] = row[1:]
+    return header[1:], index, duplicates
+
+
+def logParticipants(logFiles, storeDir=None):
+    """
+    Find the participants in the raw logs and whether the logs contain
+    their started event. Participants without it are dropped by
+    logs.groupLogsPerSubmission, so they have no behavior metrics.
+
+    :param logFiles: files containing the raw logs
+    :param storeDir: read the events of the log files from this columnar store instead
+    :return: dictionary prolific ID -> True if the participant has a started event
+    """
+    participants = {}
+    if storeDir is not None:
+        # Only import pyarrow when the store is used, and only read two columns
+        from ingest import readLogTable, logCondition
+        events = readLogTable(storeDir, [logCondition(logFile) for logFile in logFiles], ['prolificID', 'eventType', 'type']).to_pydict()
+        logs = ({'applicationSpecificData': {'prolificID': prolificID}, 'eventType': eventType, 'eventDetails': {'type': type}}
+                for (prolificID, eventType, type) in zip(events['prolificID'], events['eventType'], events['type']))
+    else:
+        logs = (log for logFile in logFiles for log in iterLogs(logFile))
+
+    for log in logs:
+        prolificID = log['applicationSpecificData']['prolificID']
+        started = log['eventType'] == "statusEvent" and log['eventDetails']['type'] == "started"
+        participants[prolificID] = participants.get(prolificID, False) or started
+    participants.pop(None, None)
+    return participants
+
+
+def joinParticipants(sources, behaviorFiles, logFiles, outFile, reportFile, storeDir=None):
+    """
+    Join the outputs of the other scripts on the prolific ID into one wide
+    table with a row per participant. Every file is read once into a hash
+    index, then the rows are joined in a single pass over all participants.
+    Participants missing from a source get empty values there, and every
+    missing or duplicate participant is written to the report.
+
+    :param sources: list of (name, CSV file) with the prolific ID in the first column
+    :param behaviorFiles: dictionary condition -> behavior CSV file of logs.py
+    :param logFiles: the raw logs, to explain participants without behavior metrics
+    :param outFile: file to write the wide table to, see tableWriter.py
+    :param reportFile: CSV file to write the missing and duplicate participants to
+    :param storeDir: read the raw logs from this columnar store instead
+    :return: number of problems in the report
+    """
+    indexes = []
+    problems = []
+    for (name, file) in sources:
+        columns, index, duplicates = indexTable(file)
+        indexes.append((name, columns, index))
+        problems += [(prolificID, name, "duplicate rows, the first one is used") for prolificID in duplicates]
+
+    # The behavior metrics of all conditions form one source
+    behaviorColumns = None
+    behavior = {}
+    for (condition, file) in behaviorFiles.items():
+        columns, index, duplicates = indexTable(file)
+        behaviorColumns = ["behaviorCondition"] + columns
+        problems += [(prolificID, "behavior", "duplicate rows in behavior-" + condition + ", the first one is used") for prolificID in duplicates]
+        for (prolificID, values) in index.items():
+            if prolificID in behavior:
+                problems.append((prolificID, "behavior", "in behavior-" + behavior[prolificID][0] + " and behavior-" + condition + ", the first one is used"))
+            else:
+                behavior[prolificID] = [condition] + values
+    if behaviorColumns is not None:
+        indexes.append(("behavior", behaviorColumns, behavior))
+
+    inLogs = logParticipants(logFiles, storeDir)
+
+    # Columns that occur in several sources are prefixed with the name of the source
+    occurrences = {}
+    for (name, columns, index) in indexes:
+        for column in columns:
+            occurrences[column] = occurrences.get(column, 0) + 1
+    header = ["prolificID"]
+    for (name, columns, index) in indexes:
+        header += [column if occurrences[column] == 1 else name + "_" + column for column in columns]
+
+    participants = dict.fromkeys(prolificID for (name, columns, index) in indexes for prolificID in index)
+    participants.update(dict.fromkeys(inLogs))
+
+    with TableWriter(outFile, header) as writer:
+        for prolificID in participants:
+            row = [prolificID]
+            for (name, columns, index) in indexes:
+                values = index.get(prolificID)
+                if values is None:
+                    row += [""] * len(columns)
+                    if name != "behavior":
+                        problems.append((prolificID, name, "missing"))
+                    elif prolificID not in inLogs:
+                        problems.append((prolificID, name, "missing, not in the logs"))
+                    elif not inLogs[prolificID]:
+                        problems.append((prolificID, name, "missing, no started event in the logs"))
+                    else:
+                        problems.append((prolificID, name, "missing"))
+                else:
+                    row += values
+            writer.writeRow(row)
+
+    with TableWriter(reportFile, ["prolificID", "source", "problem"]) as writer:
+        writer.writeRows(problems)
+
+    instrumentation.log(instrumentation.INFO, "Joined " + str(len(participants)) + " participants from " + str(len(indexes)) + " sources")
+    for (name, columns, index) in indexes:
+        instrumentation.log(instrumentation.INFO, name + ": " + str(len(participants) - len(index)) + " participants missing")
+    return len(problems)
+
+
+def defaultSources(outDir):
+    """
+    Get the outputs of the other scripts that are joined.
+
+    :param outDir: the out/ directory
+    :return: list of (name, CSV file)
+    """
+    return [("condition", os.path.join(outDir, "condition.csv")),
+            ("pretask", os.path.join(outDir, "pretasks.csv")),
+            ("posttask", os.path.join(outDir, "posttask.csv")),
+            ("args", os.path.join(outDir, "submissionTimesAndNoOfArgs.csv")),
+            ("ratedArgs", os.path.join(outDir, "argumentsAvgRatings.csv")),
+            ("listReliance", os.path.join(outDir, "listReliance.csv"))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Join the outputs of all scripts into one table with a row per participant.")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the in/ and out/ directories")
+    parser.add_argument("--store", default=None, help="read the logs from this columnar store (see ingest.py)")
+    parser.add_argument("--out", default=None, help="file to write the table to (default: out/participants.csv)")
+    instrumentation.addArguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args)
+
+    outDir = args.data_dir + "/out"
+    sources = []
+    for (name, file) in defaultSources(outDir):
+        if os.path.exists(file):
+            sources.append((name, file))
+        else:
+            instrumentation.log(instrumentation.INFO, "[WARNING] " + file + " does not exist, " + name + " is not joined")
+    behaviorFiles = {}
+    logFiles = []
+    for condition in CONDITIONS:
+        behaviorFile = outDir + "/behavior-" + condition + ".csv"
+        if os.path.exists(behaviorFile):
+            behaviorFiles[condition] = behaviorFile
+        else:
+            instrumentation.log(instrumentation.INFO, "[WARNING] " + behaviorFile + " does not exist, the behavior of " + condition + " is not joined")
+        logFile = args.data_dir + "/in/logs-" + condition + ".log"
+        # The store has the events of the log files, which do not need to exist then
+        if args.store is not None or os.path.exists(logFile):
+            logFiles.append(logFile)
+        else:
+            instrumentation.log(instrumentation.INFO, "[WARNING] " + logFile + " does not exist, its participants are not explained in the report")
+    joinParticipants(sources, behaviorFiles, logFiles, args.out or outDir + "/participants.csv", outDir + "/participants-report.csv", args.store)
+    instrumentation.writeReport(args.report)
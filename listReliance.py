@@ -1,9 +1,25 @@
-from bs4 import BeautifulSoup
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from urllib.request import urlopen
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logs import iterLogs, CONDITIONS
+from pageFetcher import fetchPages, isTransient, readCachedText, EXTRACTION_ERRORS
+from textExtraction import getExtractor
+from tableWriter import TableWriter
 
+import argparse
+import hashlib
 import json
+import os
+import sqlite3
+import instrumentation
+
+# Text of web pages that did not load, their clicks are written to the error file
+UNUSABLE_PAGE = "If you're seeing this message, it means we're having trouble loading external resources on our website"
+
+# Text extraction backend of the web pages, see textExtraction.py
+TEXT_EXTRACTOR = "lxml"
+
+# Scripts scoring the participants, the scores in a job checkpoint are discarded when one changes
+SCORING_FILES = ["listReliance.py", "similarity.py", "textExtraction.py"]
 
 def calculateBoWVectors(arguments, webpage):
     """
@@ -13,32 +29,38 @@ def calculateBoWVectors(arguments, webpage):
     :param webpage: webpage contents to compare against as one string
     :return: two vectors representing word frequencies.
     """
+    # scikit-learn takes a second to import, so only when vectors are calculated
+    from sklearn.feature_extraction.text import CountVectorizer
+
     vectorizer = CountVectorizer(strip_accents='unicode')
     X = vectorizer.fit_transform([arguments, webpage])
 
     return X.toarray()
 
 
-def getWebPageText(url):
+def getWebPageText(url, timeout=30):
     """
     Get the text contents of the web page at the specified URL.
 
     :param url: web page to get the contents of
+    :param timeout: seconds to wait for the server
     :return: contents of the web page as plain text.
     """
-    html = urlopen(url).read()
-    soup = BeautifulSoup(html, features="html.parser")
+    with urlopen(url, timeout=timeout) as response:
+        return extractText(response.read(), response.headers.get_content_charset())
 
-    # Delete tags
-    for script in soup(["script", "style", "header"]):
-        script.extract()
 
-    # Get text, break into lines, remove leading/trailing blank spaces & blank lines
-    text = soup.get_text()
-    lines = (line.strip() for line in text.splitlines())
-    text = '\n'.join(line for line in lines if line)
+def extractText(html, charset=None, backend=TEXT_EXTRACTOR):
+    """
+    Get the text contents of the HTML of a web page.
+    See textExtraction.py for the backends.
 
-    return text
+    :param html: the HTML of the web page
+    :param charset: charset of the Content-Type header of the page, None if it had none
+    :param backend: the text extraction backend to use
+    :return: contents of the web page as plain text.
+    """
+    return getExtractor(backend)(html, charset)
 
 
 def importArgs(file):
@@ -68,55 +90,346 @@ def importClicksFromLogs(logFiles):
     clicksPerParticipant = {}
 
     for file in logFiles:
-        with open(file) as logFile:
-            logs_json = json.load(logFile)
-            for log in logs_json:
-                if log['eventDetails']['type'] == "mouseClick" and (log['eventDetails']['name'] == 'SEARCH_RESULT_CLICKED_AUX' or log['eventDetails']['name'] == 'SEARCH_RESULT_CLICKED'):
-                    prolificID = log['applicationSpecificData']['prolificID']
-                    url = log['metadata'][1]['value']
-                    if prolificID not in clicksPerParticipant:
-                        clicksPerParticipant.update({prolificID: [url]})
-                    else:
-                        clicksPerParticipant[prolificID].append(url)
+        for log in iterLogs(file):
+            if log['eventDetails']['type'] == "mouseClick" and (log['eventDetails']['name'] == 'SEARCH_RESULT_CLICKED_AUX' or log['eventDetails']['name'] == 'SEARCH_RESULT_CLICKED'):
+                prolificID = log['applicationSpecificData']['prolificID']
+                url = log['metadata'][1]['value']
+                if prolificID not in clicksPerParticipant:
+                    clicksPerParticipant.update({prolificID: [url]})
+                else:
+                    clicksPerParticipant[prolificID].append(url)
 
     return clicksPerParticipant
 
-if __name__ == '__main__':
 
-    # Log files to extract the search result clicks from
-    logFiles = ["/home/mike/git/bbt-analysis/data/in/logs-list.log",
-                "/home/mike/git/bbt-analysis/data/in/logs-grid.log",
-                "/home/mike/git/bbt-analysis/data/in/logs-ilsp.log",
-                "/home/mike/git/bbt-analysis/data/in/logs-sa.log"]
-    clicksPerParticipant = importClicksFromLogs(logFiles)
-    argsPerParticipant = importArgs("/home/mike/git/bbt-analysis/data/in/args.json")
+def importClicksFromStore(storeDir, logFiles):
+    """
+    Import clicked search results from log files ingested in the
+    columnar store (see ingest.py), grouped per participant.
+    Only the columns needed for the clicks are read.
+
+    :param storeDir: directory of the store
+    :param logFiles: An array of strings pointing to ingested log files.
+    :return: Clicked web search results
+    """
+    from ingest import readLogTable, logCondition
+    import pyarrow.compute as pc
+
+    clicksPerParticipant = {}
+    for file in logFiles:
+        clicks = readLogTable(storeDir, conditions=[logCondition(file)], columns=['seq', 'prolificID', 'type', 'name', 'metadata'])
+        clicks = clicks.filter((pc.field('type') == "mouseClick") & pc.field('name').isin(['SEARCH_RESULT_CLICKED_AUX', 'SEARCH_RESULT_CLICKED']))
+        for row in clicks.sort_by('seq').to_pylist():
+            clicksPerParticipant.setdefault(row['prolificID'], []).append(row['metadata'][1])
+
+    return clicksPerParticipant
+
+
+def importArgsFromStore(storeDir):
+    """
+    Import submitted arguments from the columnar store (see ingest.py)
+    and group arguments per participant.
+
+    :param storeDir: directory of the store
+    :return: Dictionary with the arguments grouped by participant as one string.
+    """
+    from ingest import readCollection
+
+    return {document['_id']: ' '.join(document['args']) for document in readCollection(storeDir, "bbtArguments", ['_id', 'args'])}
+
+
+def importClicksAndArgs(logFiles, argsFile, storeDir=None):
+    """
+    Import the clicked search results and the arguments, from the exports
+    or from the columnar store. Exports that changed since they were
+    ingested are ingested first.
+
+    :param logFiles: An array of strings pointing to log files.
+    :param argsFile: File to import the arguments from.
+    :param storeDir: directory of the store, None to read the exports
+    :return: (clicked web search results, arguments) grouped per participant
+    """
+    if storeDir is None:
+        return importClicksFromLogs(logFiles), importArgs(argsFile)
+    # Only import pyarrow when the store is used
+    from ingest import ingestLogs, ingestCollection
+    for logFile in logFiles:
+        ingestLogs(logFile, storeDir)
+    ingestCollection(argsFile, storeDir, "bbtArguments")
+    return importClicksFromStore(storeDir, logFiles), importArgsFromStore(storeDir)
+
+
+def calculateReliance(logFiles, argsFile, outFile, errorFile, cacheDir, backend="bow", indexDir=None, storeDir=None):
+    """
+    Calculate the highest cosine similarity between the arguments of each
+    participant and the web pages they clicked, and write it to a CSV file.
+    Clicks whose web page could not be used are written to the error file
+    so the cosine similarity can be calculated manually.
+
+    :param logFiles: An array of strings pointing to log files.
+    :param argsFile: File to import the arguments from.
+    :param outFile: CSV file to write the similarities to
+    :param errorFile: CSV file to write the failed clicks to
+    :param cacheDir: directory of the content cache of the web pages
+    :param backend: scoring backend, see similarity.BACKENDS
+    :param indexDir: directory to keep the page index of the tfidf and embedding backends in
+    :param storeDir: read the clicks and arguments from this columnar store (see ingest.py) instead
+    :return: None
+    """
+    with instrumentation.timer("listReliance.importClicks"):
+        clicksPerParticipant, argsPerParticipant = importClicksAndArgs(logFiles, argsFile, storeDir)
+
+    # Fetch every clicked web page once, pages fetched in an earlier run are read from the cache
+    with instrumentation.timer("listReliance.fetchPages"):
+        webPageTexts, fetchErrors = fetchPages([url for (participant, urls) in clicksPerParticipant.items() if participant is not None for url in urls],
+                                               cacheDir, extractText, TEXT_EXTRACTOR)
+    instrumentation.count("listReliance.pages", len(webPageTexts))
+    instrumentation.count("listReliance.fetchErrors", len(fetchErrors))
+
+    # Calculate the highest similarity of every participant at once, scikit-learn is only imported here
+    from similarity import calculateMaxSimilarities, calculateIndexedMaxSimilarities, buildPageIndex
+    if backend == "bow":
+        with instrumentation.timer("listReliance.calculateMaxSimilarities"):
+            maxSimilarities = calculateMaxSimilarities(argsPerParticipant, clicksPerParticipant, webPageTexts)
+    else:
+        with instrumentation.timer("listReliance.buildPageIndex"):
+            index = buildPageIndex(backend, webPageTexts, indexDir)
+        with instrumentation.timer("listReliance.calculateIndexedMaxSimilarities"):
+            maxSimilarities = calculateIndexedMaxSimilarities(index, argsPerParticipant, clicksPerParticipant)
 
     # Open a file for wrtiting the cosine similarities to
-    file = open("/home/mike/git/bbt-analysis/data/out/listReliance.csv", "w")
-    error_file = open("/home/mike/git/bbt-analysis/data/out/listReliance-errors.csv", "w")
-    file.write("prolificID,maxSimilarity\n")
-    for i, (participant, urls) in enumerate(clicksPerParticipant.items()):
-        if participant is not None:
-            highest = 0.0
-            # Check the similarity between each url and submitted arguments
+    with TableWriter(outFile, ["prolificID", "maxSimilarity"]) as file, TableWriter(errorFile, None) as error_file:
+        for i, (participant, urls) in enumerate(clicksPerParticipant.items()):
+            if participant is not None:
+                instrumentation.count("listReliance.clicks", len(urls))
+                for url in urls:
+                    if instrumentation.LEVEL >= instrumentation.TRACE:
+                        instrumentation.log(instrumentation.TRACE, "************" + str(i) + " Participant: " + participant + ", url: " + url + " ***********************")
+                    # Add participant and URL to a file if an error occurred so cosine similarity can be calculated manually
+                    if url in fetchErrors or participant not in argsPerParticipant:
+                        error_file.writeRow([participant, url])
+                        instrumentation.log(instrumentation.TRACE, "[Added to error file]")
+                        instrumentation.count("listReliance.errors")
+                    elif UNUSABLE_PAGE in webPageTexts[url]:
+                        instrumentation.log(instrumentation.TRACE, "[Added to error file]")
+                        instrumentation.count("listReliance.errors")
+                        error_file.writeRow([participant, url])
+
+                file.writeRow([participant, maxSimilarities.get(participant, 0.0)])
+
+
+def scoringHash():
+    """
+    Hash the scripts scoring the participants, so scores of other code are not used.
+
+    :return: hex digest
+    """
+    hash = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for script in SCORING_FILES:
+        with open(os.path.join(directory, script), "rb") as file:
+            hash.update(file.read())
+    return hash.hexdigest()
+
+
+def openJobCheckpoint(checkpointFile, inputFiles, backend="bow"):
+    """
+    Open the checkpoint database of a job. It holds the outcome of every
+    clicked web page (ok, unusable, transient or permanent download failure,
+    or unextractable) and the highest similarity of every scored participant.
+    The scores are discarded when an input file, the scoring backend or the
+    scoring code changed. The download outcomes are kept, since they do not
+    depend on the inputs or the code, but pages whose text could not be
+    extracted are tried again when the scoring code changed, as the new code
+    may extract them.
+
+    :param checkpointFile: SQLite file the checkpoint is stored in
+    :param inputFiles: the log files and the arguments file
+    :param backend: scoring backend, see similarity.BACKENDS
+    :return: the connection
+    """
+    connection = sqlite3.connect(checkpointFile)
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+    connection.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, outcome TEXT, error TEXT)")
+    connection.execute("CREATE TABLE IF NOT EXISTS participants (prolificID TEXT PRIMARY KEY, maxSimilarity REAL, complete INTEGER)")
+    inputs = json.dumps({"code": scoringHash(), "backend": backend,
+                         "inputs": [[os.path.abspath(file), os.stat(file).st_size, os.stat(file).st_mtime_ns] for file in inputFiles]})
+    meta = dict(connection.execute("SELECT key, value FROM meta"))
+    if meta.get('inputs') != inputs:
+        connection.execute("DELETE FROM participants")
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('inputs', ?)", (inputs,))
+    if meta.get('code') != scoringHash():
+        connection.execute("DELETE FROM pages WHERE outcome = 'unextractable'")
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('code', ?)", (scoringHash(),))
+    connection.commit()
+    return connection
+
+
+def scoreBatch(argsPerParticipant, clicksPerParticipant, webPageTexts, indexDir=None):
+    """
+    Calculate the highest similarity of a batch of participants in a worker
+    process. With the bow backend the similarity of a participant and a page
+    does not depend on the other texts, and the other backends use the page
+    index of all pages, so the batches give the same scores as one run.
+
+    :param argsPerParticipant: arguments of the participants of the batch
+    :param clicksPerParticipant: clicked URLs of the participants of the batch
+    :param webPageTexts: text of the pages clicked in the batch by participants with arguments, for the bow backend
+    :param indexDir: directory of the page index of the tfidf and embedding backends, None for bow
+    :return: dictionary with the highest similarity per participant
+    """
+    if not argsPerParticipant:
+        # Nobody in the batch submitted arguments, all participants of the batch get 0.0
+        return {}
+    from similarity import calculateMaxSimilarities, calculateIndexedMaxSimilarities, PageIndex
+    if indexDir is not None:
+        return calculateIndexedMaxSimilarities(PageIndex.load(indexDir), argsPerParticipant, clicksPerParticipant)
+    if not webPageTexts:
+        # No page to compare with, all participants of the batch get 0.0
+        return {}
+    return calculateMaxSimilarities(argsPerParticipant, clicksPerParticipant, webPageTexts)
+
+
+def runJob(logFiles, argsFile, outFile, errorFile, cacheDir, checkpointFile, workers=4, batchSize=1000, backend="bow", indexDir=None, storeDir=None):
+    """
+    calculateReliance as a resumable job. The outcome of every page and the
+    score of every participant are recorded in a checkpoint as soon as they
+    are known, so a run that is interrupted or crashes continues where it
+    stopped. Participants are scored in batches by a pool of worker
+    processes. A participant is complete once none of its pages failed
+    with a transient error; a rerun only fetches those pages again and
+    only scores the participants that are not complete. Pages that failed
+    for good, e.g. with a 404, are not fetched again; delete the checkpoint
+    to try them anyway. Pages whose text could not be extracted are only
+    extracted again, from the cached HTML, once the scoring code changed.
+    The output files are the same as the ones of calculateReliance.
+
+    :param logFiles: An array of strings pointing to log files.
+    :param argsFile: File to import the arguments from.
+    :param outFile: CSV file to write the similarities to
+    :param errorFile: CSV file to write the failed clicks to
+    :param cacheDir: directory of the content cache of the web pages
+    :param checkpointFile: SQLite file to keep the progress of the job in
+    :param workers: number of worker processes scoring participants, 1 to score in this process
+    :param batchSize: number of participants scored at a time by a worker
+    :param backend: scoring backend, see similarity.BACKENDS
+    :param indexDir: directory of the page index of the tfidf and embedding backends
+    :param storeDir: read the clicks and arguments from this columnar store (see ingest.py) instead
+    :return: None
+    """
+    if backend != "bow" and indexDir is None:
+        raise ValueError("The workers read the page index of the " + backend + " backend from disk, give an indexDir")
+    with instrumentation.timer("listReliance.importClicks"):
+        clicksPerParticipant, argsPerParticipant = importClicksAndArgs(logFiles, argsFile, storeDir)
+        clicksPerParticipant.pop(None, None)
+
+    connection = openJobCheckpoint(checkpointFile, logFiles + [argsFile], backend)
+    complete = {participant for (participant,) in connection.execute("SELECT prolificID FROM participants WHERE complete = 1")}
+    outcomes = dict(connection.execute("SELECT url, outcome FROM pages"))
+    pending = [participant for participant in clicksPerParticipant if participant not in complete]
+    instrumentation.count("listReliance.participantsSkipped", len(clicksPerParticipant) - len(pending))
+    instrumentation.log(instrumentation.INFO, str(len(clicksPerParticipant) - len(pending)) + " participants done before, " + str(len(pending)) + " to score")
+
+    # Pages fetched before are read from the content cache, only the ones that failed are downloaded again
+    with instrumentation.timer("listReliance.fetchPages"):
+        webPageTexts, fetchErrors = fetchPages([url for participant in pending for url in clicksPerParticipant[participant] if outcomes.get(url) not in ("permanent", "unextractable")],
+                                               cacheDir, extractText, TEXT_EXTRACTOR)
+    instrumentation.count("listReliance.pages", len(webPageTexts))
+    instrumentation.count("listReliance.fetchErrors", len(fetchErrors))
+    for (url, text) in webPageTexts.items():
+        outcomes[url] = "unusable" if UNUSABLE_PAGE in text else "ok"
+    for (url, error) in fetchErrors.items():
+        if isinstance(error, EXTRACTION_ERRORS):
+            outcomes[url] = "unextractable"
+        else:
+            outcomes[url] = "transient" if isTransient(error) else "permanent"
+    connection.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                           [(url, outcomes[url], None) for url in webPageTexts] + [(url, outcomes[url], repr(error)) for (url, error) in fetchErrors.items()])
+    connection.commit()
+
+    if backend != "bow":
+        # The index covers the pages clicked by all participants of the current logs, the ones fetched
+        # before are read from the content cache; pages of earlier logs in the checkpoint are left out
+        from similarity import buildPageIndex
+        for url in dict.fromkeys(url for urls in clicksPerParticipant.values() for url in urls):
+            if outcomes.get(url) in ("ok", "unusable") and url not in webPageTexts:
+                text = readCachedText(cacheDir, url, TEXT_EXTRACTOR)
+                if text is not None:
+                    webPageTexts[url] = text
+        with instrumentation.timer("listReliance.buildPageIndex"):
+            index = buildPageIndex(backend, webPageTexts, indexDir)
+        # New pages can change the similarities of a tfidf index, then everyone is scored again
+        meta = dict(connection.execute("SELECT key, value FROM meta"))
+        if meta.get('index') != index.fingerprint():
+            connection.execute("DELETE FROM participants")
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('index', ?)", (index.fingerprint(),))
+            connection.commit()
+            pending = list(clicksPerParticipant)
+        webPageTexts = {}
+
+    def record(scores):
+        connection.executemany("INSERT OR REPLACE INTO participants VALUES (?, ?, ?)",
+                               [(participant, scores.get(participant, 0.0),
+                                 all(outcomes.get(url) != "transient" for url in clicksPerParticipant[participant])) for participant in scores])
+        connection.commit()
+        instrumentation.count("listReliance.participantsScored", len(scores))
+
+    batches = []
+    for i in range(0, len(pending), batchSize):
+        batch = pending[i:i + batchSize]
+        # Only the pages of participants with arguments are compared with
+        batches.append(({participant: argsPerParticipant[participant] for participant in batch if participant in argsPerParticipant},
+                         {participant: clicksPerParticipant[participant] for participant in batch},
+                         {url: webPageTexts[url] for participant in batch if participant in argsPerParticipant
+                          for url in clicksPerParticipant[participant] if url in webPageTexts},
+                         None if backend == "bow" else indexDir))
+    with instrumentation.timer("listReliance.scoreBatches"):
+        if workers <= 1:
+            for batch in batches:
+                record(dict.fromkeys(batch[1], 0.0) | scoreBatch(*batch))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                settings = instrumentation.settings()
+                futures = {executor.submit(instrumentation.runInstrumented, settings, scoreBatch, *batch): batch for batch in batches}
+                # Record every batch as soon as it is scored, errors in the workers are raised here
+                for future in as_completed(futures):
+                    scores, report = future.result()
+                    instrumentation.merge(report, "scoreBatch")
+                    record(dict.fromkeys(futures[future][1], 0.0) | scores)
+
+    scores = dict(connection.execute("SELECT prolificID, maxSimilarity FROM participants"))
+    connection.close()
+    with TableWriter(outFile, ["prolificID", "maxSimilarity"]) as file, TableWriter(errorFile, None) as error_file:
+        for (participant, urls) in clicksPerParticipant.items():
+            instrumentation.count("listReliance.clicks", len(urls))
             for url in urls:
-                print("************" + str(i) + " Participant: " + participant + ", url: " + url + " ***********************")
-                try:
-                    webPageText = getWebPageText(url)
-                    print(webPageText[0:250].replace('\n', "__"))
-                    cos_sim = cosine_similarity(calculateBoWVectors(argsPerParticipant[participant], webPageText))[0][1]
-                    highest = highest if cos_sim < highest else cos_sim
-
-                    if "If you're seeing this message, it means we're having trouble loading external resources on our website" in webPageText:
-                        print("[Added to error file]")
-                        error_file.write(participant + "," + url + "\n")
-                except:
-                    # Add participant and URL to a file if an error contains so cosine similarity can be calculated manually
-                    error_file.write(participant + "," + url + "\n")
-                    print("[Added to error file]")
-
-            file.write(participant + "," + str(cos_sim) + "\n")
-            file.flush()
-            error_file.flush()
-    file.close()
-    error_file.close()
+                # Add participant and URL to a file if an error occurred so cosine similarity can be calculated manually
+                if outcomes.get(url) != "ok" or participant not in argsPerParticipant:
+                    error_file.writeRow([participant, url])
+                    instrumentation.count("listReliance.errors")
+            file.writeRow([participant, scores[participant]])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calculate the highest similarity between the arguments and the clicked web pages.")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the in/, out/ and cache/ directories")
+    parser.add_argument("--resume", action="store_true", help="run as a job that continues where an earlier run stopped and only retries the failures")
+    parser.add_argument("--workers", type=int, default=4, help="number of worker processes scoring participants with --resume")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of participants scored at a time with --resume")
+    parser.add_argument("--store", default=None, help="read the logs and arguments from this columnar store (see ingest.py)")
+    parser.add_argument("--backend", default="bow", choices=["bow", "tfidf", "embedding"],
+                        help="similarity of word counts (default), of TF-IDF vectors or of sentence embeddings")
+    instrumentation.addArguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args)
+
+    # Log files to extract the search result clicks from
+    logFiles = [args.data_dir + "/in/logs-" + condition + ".log" for condition in CONDITIONS]
+    indexDir = args.data_dir + "/cache/index-" + args.backend
+    files = (args.data_dir + "/in/args.json", args.data_dir + "/out/listReliance.csv", args.data_dir + "/out/listReliance-errors.csv",
+             args.data_dir + "/cache/pages")
+    if args.resume:
+        runJob(logFiles, *files, args.data_dir + "/out/.listReliance.checkpoint", args.workers, args.batch_size, args.backend, indexDir, args.store)
+    else:
+        calculateReliance(logFiles, *files, args.backend, indexDir, args.store)
+    instrumentation.writeReport(args.report)
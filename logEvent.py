@@ -0,0 +1,78 @@
+import sys
+
+from timestamps import parseTimestampMillis
+
+# Event types of clicks on search results
+CLICK_TYPES = ("click", "auxclick", "mouseClick")
+
+
+class LogEvent:
+    """
+    Compact representation of one LogUI event with only the fields used by
+    the metrics. Strings that repeat between events (event types, prolific
+    IDs, URLs) are interned, so all events share one copy. The timestamp is
+    an int in milliseconds and the rank a small int. Fields that do not
+    apply to the type of the event are None.
+    """
+    __slots__ = ("prolificID", "eventType", "type", "timestamp", "hasFocus", "newURL", "previousURL",
+                 "rank", "resultTitle", "resultQuery", "viewportSize")
+
+    def __init__(self, prolificID, eventType, type, timestamp):
+        """
+        :param prolificID: prolific ID of the participant
+        :param eventType: LogUI event type, e.g. statusEvent
+        :param type: type in the event details, e.g. started
+        :param timestamp: event timestamp in milliseconds since epoch
+        """
+        self.prolificID = prolificID
+        self.eventType = eventType
+        self.type = type
+        self.timestamp = timestamp
+        # viewportFocusChange
+        self.hasFocus = None
+        # URLChange
+        self.newURL = None
+        self.previousURL = None
+        # Clicks on search results
+        self.rank = None
+        self.resultTitle = None
+        self.resultQuery = None
+        # Size of the viewport when started and after a viewportResize, e.g. 1280x720
+        self.viewportSize = None
+
+    @classmethod
+    def fromLog(cls, log):
+        """
+        Convert a LogUI event as decoded from JSON.
+
+        :param log: the event as JSON
+        :return: the event as LogEvent
+        """
+        prolificID = log['applicationSpecificData']['prolificID']
+        details = log['eventDetails']
+        type = details['type']
+        event = cls(None if prolificID is None else sys.intern(prolificID), sys.intern(log['eventType']), sys.intern(type),
+                    parseTimestampMillis(log['timestamps']['eventTimestamp']))
+        if type == "viewportFocusChange":
+            event.hasFocus = details['hasFocus']
+        elif type == "URLChange":
+            # The new URL of one event is the previous URL of the next one
+            event.newURL = sys.intern(details['newURL'])
+            event.previousURL = sys.intern(details['previousURL'])
+        elif type in CLICK_TYPES:
+            metadata = log['metadata']
+            event.rank = int(metadata[0]['value'])
+            event.resultTitle = sys.intern(metadata[3]['value'])
+            event.resultQuery = sys.intern(metadata[4]['value'])
+        elif type == "started":
+            resolution = details['viewportResolution']
+            event.viewportSize = sys.intern(str(resolution['width']) + "x" + str(resolution['height']))
+        elif type == "viewportResize":
+            event.viewportSize = sys.intern(details['stringRepr'])
+        return event
+
+    def isStarted(self):
+        """
+        :return: True if this is the started event of LogUI
+        """
+        return self.eventType == "statusEvent" and self.type == "started"
@@ -1,7 +1,16 @@
 import json
-from urllib.parse import unquote
 import re
-import datetime
+import itertools
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+import instrumentation
+from logEvent import LogEvent
+from metrics import SubmissionMetrics, parseQueryserpURL
+from tableWriter import writeTable
+
+# Experimental conditions, each with its own LogUI export
+CONDITIONS = ["list", "grid", "ilsp", "sa"]
 
 
 def importLogs(file):
@@ -16,20 +25,91 @@ def importLogs(file):
         return logs_json
 
 
+def iterLogs(file, chunkSize=1 << 16):
+    """
+    Read the raw logs one event at a time instead of loading the whole
+    export. Both the JSON array export of LogUI and NDJSON (one event per
+    line) are supported; the format is detected from the first character.
+
+    :param file: file containing the raw logs to read
+    :param chunkSize: number of characters read from the file at once
+    :return: generator yielding the log events in file order
+    """
+    with open(file) as log_file:
+        buffer = log_file.read(chunkSize)
+        start = len(buffer) - len(buffer.lstrip())
+        while start == len(buffer):
+            buffer = log_file.read(chunkSize)
+            if not buffer:
+                return
+            start = len(buffer) - len(buffer.lstrip())
+
+        if buffer[start] == '[':
+            yield from _iterJSONArray(log_file, buffer, start + 1, chunkSize)
+        else:
+            # NDJSON: complete the partially read line and continue line by line
+            lines = (buffer + log_file.readline()).splitlines()
+            for line in itertools.chain(lines, log_file):
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _iterJSONArray(log_file, buffer, pos, chunkSize):
+    """
+    Decode the elements of a JSON array incrementally.
+
+    :param log_file: open file positioned after the buffered text
+    :param buffer: text read so far
+    :param pos: position in the buffer just after the opening bracket
+    :param chunkSize: number of characters read from the file at once
+    :return: generator yielding the elements of the array
+    """
+    decoder = json.JSONDecoder()
+    eof = False
+    while True:
+        # Skip whitespace and separators between the elements
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array in " + log_file.name)
+            buffer = log_file.read(chunkSize)
+            pos = 0
+            eof = not buffer
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Element is cut off at the end of the buffer, read more text
+            if eof:
+                raise
+            more = log_file.read(chunkSize)
+            eof = not more
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+        yield element
+        pos = end
+
+
 def groupLogsPerSubmission(logs):
     """
-    Group all logs by the prolific id of the participant.
+    Group all logs by the prolific id of the participant. The logs are
+    kept as compact LogEvent objects instead of the decoded JSON.
 
-    :param logs: the raw, ungrouped logs
-    :return: logs grouped per participant
+    :param logs: the raw, ungrouped logs, either a list or
+                 a generator such as the one of iterLogs
+    :return: LogEvents grouped per participant
     """
     submissionsGrouped = {}
     for log in logs:
         prolificid = log['applicationSpecificData']['prolificID']
         if (prolificid not in submissionsGrouped) and (log['eventType'] == "statusEvent" and log['eventDetails']['type'] == "started"):
-            submissionsGrouped.update({prolificid: [log]})
+            submissionsGrouped.update({prolificid: [LogEvent.fromLog(log)]})
         elif prolificid in submissionsGrouped:
-            submissionsGrouped[prolificid].append(log)
+            submissionsGrouped[prolificid].append(LogEvent.fromLog(log))
     submissionsGrouped.pop(None, None)
     return submissionsGrouped
 
@@ -37,8 +117,8 @@ def groupLogsPerSubmission(logs):
 def calculateMetricsPerSubmission(submission, submissionLogs):
     """
     calculate search behavior metrics from the logs
-    of one participant. SubmissionTime required for
-    certain metrics that are calculated per minute.
+    of one participant in a single pass. The metrics are
+    calculated by the accumulators registered in metrics.py.
 
     Metrics calculated:
     - [queriesIssued] number of queries issued in total
@@ -54,196 +134,185 @@ def calculateMetricsPerSubmission(submission, submissionLogs):
 
     :param submission: prolific ID of the participant
     :param submissionLogs: the logs of one participant
-    :return:
+    :return: the metrics of the participant
     """
-    pagefocusLogs, queryserpLogs, clickLogs, startLogs, stopLogs, resizingLogs = filterLogs(submissionLogs)
-    submissionMetrics = {"prolificId": submission}
-
-    print("***********************************************")
-
-    # Calulate result click metrics
-    # Set the last two to 0 if no results were clicked
-    ranks = extractResultRanksLogs(clickLogs)
-    submissionMetrics['noOfResultsClicked'] = len(ranks)
-    submissionMetrics['deepestRankVisitedResults'] = 0 if len(ranks) == 0 else max(ranks)
-    submissionMetrics['avgRankVisitedResults'] = 0 if len(ranks) == 0 else sum(rank for rank in ranks) / len(ranks)
-
-    # Calculate dwell time / time used
-    dwellTime, timeUsed = extractPagefocusIntervals(pagefocusLogs, startLogs, stopLogs)
-    submissionMetrics['dwellTimePerMinute'] = dwellTime
-    submissionMetrics['timeUsed'] = timeUsed
-
-    # Collect all viewport size
-    viewportSizes = extractViewportResizeEvents(resizingLogs)
-    # Prepend initial size
-    viewportSizes.insert(0, str(startLogs[0]['eventDetails']['viewportResolution']['width']) + "x" + str(startLogs[0]['eventDetails']['viewportResolution']['height']))
-
-    # Calculate query/serp metrics
-    queries, serps = processQueryserpLogs(queryserpLogs)
-    print(queries)
-    print(serps)
-    submissionMetrics['queriesIssued'] = len(queries)
-    submissionMetrics['queryRate'] = len(queries) / (timeUsed / 60)
-    submissionMetrics['avgQueryLengthWords'] = 0 if len(queries) == 0 else sum(
-        len(query.split()) for query in queries) / len(queries)
-    submissionMetrics['avgQueryLengthChars'] = 0 if len(queries) == 0 else sum(len(query) for query in queries) / len(
-        queries)
-    submissionMetrics['serpsVisited'] = len(serps)
-
-    print(submissionMetrics)
-    print(viewportSizes)
+    start = time.perf_counter() if instrumentation.REPORT is not None else None
+    instrumentation.log(instrumentation.DEBUG, "***********************************************")
+
+    metrics = SubmissionMetrics(submission)
+    for log in submissionLogs:
+        metrics.feed(log)
+    submissionMetrics = metrics.finalize()
+
+    instrumentation.log(instrumentation.DEBUG, submissionMetrics)
+    if start is not None:
+        instrumentation.observe("logs.participantSeconds", time.perf_counter() - start)
+        instrumentation.count("logs.events", len(submissionLogs))
+        instrumentation.count("logs.participants")
     return submissionMetrics
 
 
-def filterLogs(submissionLogs):
+def streamMetricsPerSubmission(logs):
     """
-    Filters the JSON logs in the parameter per category:
-    pagefocus, query/serp and clicks
+    Calculate the search behavior metrics of all participants while
+    reading the logs, without grouping them first. Only the state of the
+    accumulators is kept per participant. Participants are included in the
+    same way and in the same order as by groupLogsPerSubmission.
 
-    :param submissionLogs: unfiltered JSON logs per participant
-    :return: Logs filtered in terms of pagefocus, query/serp and clicks
+    :param logs: the raw, ungrouped logs, e.g. from iterLogs
+    :return: list with the metrics of each participant
     """
-    pagefocusLogs = []
-    queryserpLogs = []
-    clickLogs = []
-    startLogs = []
-    stopLogs = []
-    resizingLogs = []
-
-    for submissionLog in submissionLogs:
-        if (submissionLog['eventDetails']['type'] == "URLChange"):
-            queryserpLogs.append(submissionLog)
-        elif (submissionLog['eventDetails']['type'] == 'click' or
-              submissionLog['eventDetails']['type'] == 'auxclick' or
-              submissionLog['eventDetails']['type'] == 'mouseClick'):
-            clickLogs.append(submissionLog)
-        elif (submissionLog['eventDetails']['type'] == "viewportFocusChange"):
-            pagefocusLogs.append(submissionLog)
-        # Also include start/stop logs in case participant started without focus/ended without focus.
-        elif (submissionLog['eventDetails']['type'] == "started"):
-            startLogs.append(submissionLog)
-        elif (submissionLog['eventDetails']['type'] == "stopped"):
-            stopLogs.append(submissionLog)
-        elif (submissionLog['eventDetails']['type'] == "viewportResize"):
-            resizingLogs.append(submissionLog)
-
-    return pagefocusLogs, queryserpLogs, clickLogs, startLogs, stopLogs, resizingLogs
-
-
-def processQueryserpLogs(queryserpLogs):
-    """
-    Filter out all the queries and SERP changes. Done in
-    this way since are incoorperated in one type of log.
+    if instrumentation.REPORT is not None:
+        return _streamMetricsInstrumented(logs)
 
-    :param queryserpLogs: the logs containing the queries and serp
-    :return: list of the queries issued, list of the serps visited
-    """
-    queries = []
-    serps = []
-
-    for log in queryserpLogs:
-        # parse query and serp number
-        queryserp_newURL = re.search('^https?:[\/]{2}[0-9.\/a-z-]+\?#([0-9]+)-(.*)$', log['eventDetails']['newURL'])
-        queryserp_previousURL = re.search('^https?:[\/]{2}[0-9.\/a-z-]+\?#([0-9]+)-(.*)$', log['eventDetails']['previousURL'])
-        # Look at the previous and new query/serp to identify cases below
-        if queryserp_newURL and queryserp_previousURL:
-            if queryserp_newURL.group(2) == queryserp_previousURL.group(2):
-                # Case where query stayed the same and serp number changed
-                serps.append(int(queryserp_newURL.group(1)))
-            else:
-                # Case where query differed, thus new query issued
-                serps.append(1)
-                queries.append(unquote(unquote(queryserp_newURL.group(2))))
-        elif not queryserp_newURL:
-            # Case where no new query was issued. Can happen on refresh or return to main landing page.
-            # Pass since its no serp visit or query issued
-            pass
-        elif not queryserp_previousURL and queryserp_newURL:
-            # Case without previous query, thus new query issued (from main)
-            serps.append(1)
-            queries.append(unquote(unquote(queryserp_newURL.group(2))))
-
-    return queries, serps
-
-
-def extractResultRanksLogs(clickLogs):
-    """
-    Extract the rank of each clicked result and return in a list.
+    submissions = {}
+    for log in logs:
+        prolificid = log['applicationSpecificData']['prolificID']
+        metrics = submissions.get(prolificid)
+        if metrics is None:
+            if not (log['eventType'] == "statusEvent" and log['eventDetails']['type'] == "started"):
+                continue
+            metrics = SubmissionMetrics(prolificid)
+            submissions[prolificid] = metrics
+        metrics.feed(log)
+    submissions.pop(None, None)
 
-    :param clickLogs: the clicklogs to extract the ranks from
-    :return: the extracted ranks in a list
-    """
-    for log in clickLogs:
-        print("SERP: " + log['metadata'][4]['value'] + " | " + log['metadata'][3]['value'])
-    return [int(log['metadata'][0]['value']) for log in clickLogs]
+    submissionMetrics = []
+    for metrics in submissions.values():
+        instrumentation.log(instrumentation.DEBUG, "***********************************************")
+        submissionMetrics.append(metrics.finalize())
+        instrumentation.log(instrumentation.DEBUG, submissionMetrics[-1])
+    return submissionMetrics
 
 
-def extractPagefocusIntervals(pagefocusLogs, startLogs, stopLogs):
+def _streamMetricsInstrumented(logs):
     """
-    Calculate the intervals in which the pagefocus was on the SERP.
-    Also calculate the time used.
+    streamMetricsPerSubmission while collecting a report, see instrumentation.py.
+    Kept apart so the loop without a report does not measure anything.
+    The time spent on the events of every participant is summed, so the
+    latency histogram is the same as for calculateMetricsPerSubmission.
 
-    :param pagefocusLogs: logs of pagefocusEvent
-    :param startLogs: logs of LogUI being started
-    :param stopLogs: logs of LogUI being stopped
-    :return: list of focus intervals in millis
+    :param logs: the raw, ungrouped logs, e.g. from iterLogs
+    :return: list with the metrics of each participant
     """
-    # include start/stop times if the user started with focus/ended without focus.
-    startLogTime = int(datetime.datetime.strptime(startLogs[0]['timestamps']['eventTimestamp'], '%Y-%m-%dT%H:%M:%S.%fZ').timestamp() * 1000)
-    stopLogTime = int(datetime.datetime.strptime(stopLogs[-1]['timestamps']['eventTimestamp'], '%Y-%m-%dT%H:%M:%S.%fZ').timestamp() * 1000)
+    clock = time.perf_counter
+    submissions = {}
+    seconds = {}
+    events = {}
+    skipped = 0
+    for log in logs:
+        start = clock()
+        prolificid = log['applicationSpecificData']['prolificID']
+        metrics = submissions.get(prolificid)
+        if metrics is None:
+            if not (log['eventType'] == "statusEvent" and log['eventDetails']['type'] == "started"):
+                skipped += 1
+                continue
+            metrics = SubmissionMetrics(prolificid)
+            submissions[prolificid] = metrics
+            seconds[prolificid] = 0.0
+            events[prolificid] = 0
+        metrics.feed(log)
+        seconds[prolificid] += clock() - start
+        events[prolificid] += 1
+    submissions.pop(None, None)
 
-    lastTimestamp = startLogTime
-    lastFocus = False
-    focusIntervals = []
+    submissionMetrics = []
+    for (prolificid, metrics) in submissions.items():
+        start = clock()
+        instrumentation.log(instrumentation.DEBUG, "***********************************************")
+        submissionMetrics.append(metrics.finalize())
+        instrumentation.log(instrumentation.DEBUG, submissionMetrics[-1])
+        instrumentation.observe("logs.participantSeconds", seconds[prolificid] + clock() - start)
+        instrumentation.observe("logs.participantEvents", events[prolificid])
+    instrumentation.count("logs.events", sum(events.values()) + skipped)
+    instrumentation.count("logs.eventsWithoutStarted", skipped)
+    instrumentation.count("logs.participants", len(submissions))
+    return submissionMetrics
 
-    for log in pagefocusLogs:
-        timestamp = int(datetime.datetime.strptime(log['timestamps']['eventTimestamp'], '%Y-%m-%dT%H:%M:%S.%fZ').timestamp() * 1000)
-        hasFocus = log['eventDetails']['hasFocus']
 
-        # Add a focus interval if we went from true to false.
-        if not hasFocus:
-            focusIntervals.append((lastTimestamp, timestamp))
+# Columns of the behavior CSV files
+CSV_COLUMNS = ["prolificId", "queriesIssued", "queryRate", "avgQueryLengthWords", "avgQueryLengthChars", "serpsVisited", "noOfResultsClicked",
+               "deepestRankVisitedResults", "avgRankVisitedResults", "dwellTimePerMinute", "timeUsed"]
 
-        lastTimestamp = timestamp
-        lastFocus = hasFocus
 
-    # Close off last focus interval with stoptime if unfocused when time was over
-    if lastFocus:
-        focusIntervals.append((lastTimestamp, stopLogTime))
+def metricsRow(s):
+    """
+    Get the metrics of one participant as a row of the behavior CSV files.
 
-    timeUsedSecs = (stopLogTime - startLogTime) / 1000
-    timeUsedMins = timeUsedSecs / 60
-    dwellTime = sum((endTime - startTime) for (startTime, endTime) in focusIntervals) / 1000 / timeUsedMins
-    if dwellTime == 0:
-        # If no page focus intervals were collected, the participants was on the SERP all the time.
-        # However, using the above dwell time calculation this would come down to 0. Therefore, we set it
-        # to the true value of 60 if 0 is calculated.
-        dwellTime = 60
-    return dwellTime, timeUsedSecs
+    :param s: the metrics of the participant
+    :return: the values in the order of CSV_COLUMNS
+    """
+    return [s[column] for column in CSV_COLUMNS]
 
 
-def extractViewportResizeEvents(resizingLogs):
+def writeToCSV(out_file, submissionMetrics):
     """
-    Extract the viewport sizes after the viewport has been resized.
+    Write the metrics of all participants to a CSV file.
 
-    :param resizingLogs: Logs containing the resizing events.
-    :return: viewport sizes
+    :param out_file: the file to write to, see tableWriter.py
+    :param submissionMetrics: the metrics of each participant
+    :return: None
     """
-    viewportSizes = []
-    for log in resizingLogs:
-        viewportSizes.append(log['eventDetails']['stringRepr'])
+    writeTable(out_file, CSV_COLUMNS, (metricsRow(s) for s in submissionMetrics))
 
-    return viewportSizes
 
+def writeViewports(file, submissionMetrics):
+    """
+    Write the viewport sizes of all participants as numeric arrays to a
+    NumPy .npz file, one row per size in the order of the logs: the
+    initial size of a participant followed by the sizes after every resize.
+
+    Arrays:
+    - [prolificIds] prolific ID of every participant
+    - [participant] index in prolificIds of the participant of the size
+    - [initial] True for the initial size, False for a resize
+    - [width], [height] the size in pixels
+
+    :param file: the .npz file to write to
+    :param submissionMetrics: the metrics of each participant, with initialViewport and viewportResizes
+    :return: None
+    """
+    # NumPy is only needed for the viewports, so it is imported here
+    import numpy as np
+
+    participant = []
+    initial = []
+    sizes = []
+    for (i, s) in enumerate(submissionMetrics):
+        if s['initialViewport'] is not None:
+            participant.append(i)
+            initial.append(True)
+            sizes.append(s['initialViewport'])
+        participant.extend([i] * len(s['viewportResizes']))
+        initial.extend([False] * len(s['viewportResizes']))
+        sizes.extend(s['viewportResizes'])
+    sizes = np.array(sizes, dtype=np.int32).reshape(len(sizes), 2)
+    np.savez_compressed(file, prolificIds=np.array([s['prolificId'] for s in submissionMetrics], dtype=str),
+                        participant=np.array(participant, dtype=np.int32), initial=np.array(initial, dtype=bool),
+                        width=sizes[:, 0], height=sizes[:, 1])
+
+
+def readViewports(files):
+    """
+    Read and concatenate the viewport sizes written by writeViewports,
+    e.g. of all conditions. The participant indices are renumbered so
+    they stay unique.
 
+    :param files: the .npz files to read
+    :return: dictionary with the arrays, see writeViewports
+    """
+    import numpy as np
 
-def writeToCSV(out_file, submissionMetrics):
-    file = open(out_file, "w")
-    file.write("prolificId,queriesIssued,queryRate,avgQueryLengthWords,avgQueryLengthChars,serpsVisited,noOfResultsClicked,deepestRankVisitedResults,avgRankVisitedResults,dwellTimePerMinute,timeUsed\n")
-    for s in submissionMetrics:
-        file.write(s['prolificId'] + "," + str(s['queriesIssued']) + "," + str(s['queryRate']) + "," + str(s['avgQueryLengthWords']) + "," + str(s['avgQueryLengthChars']) + "," + str(s['serpsVisited']) + "," +
-                   str(s['noOfResultsClicked']) + "," + str(s['deepestRankVisitedResults']) + "," + str(s['avgRankVisitedResults']) + "," + str(s['dwellTimePerMinute']) + "," + str(s['timeUsed']) + "\n")
-    file.close()
+    parts = []
+    participants = 0
+    for file in files:
+        with np.load(file) as viewports:
+            part = {name: viewports[name] for name in viewports.files}
+        part['participant'] = part['participant'] + participants
+        participants += len(part['prolificIds'])
+        parts.append(part)
+    return {name: np.concatenate([part[name] for part in parts]) for name in ["prolificIds", "participant", "initial", "width", "height"]}
 
 
 def getSubmissionTimes(file):
@@ -258,12 +327,110 @@ def getSubmissionTimes(file):
     return submissionTimes
 
 
-if __name__ == '__main__':
-    logs = importLogs("/home/mike/git/bbt-analysis/data/in/logs-list.log")
-    logsPerSubmission = groupLogsPerSubmission(logs)
-    submissionMetrics = []
-    for (submission, submissionLogs) in logsPerSubmission.items():
-        submissionMetrics.append(calculateMetricsPerSubmission(submission, submissionLogs))
-    writeToCSV("/home/mike/git/bbt-analysis/data/out/behavior-list.csv", submissionMetrics)
+def processLogFile(logFile, outFile, storeDir=None, cacheFile=None, viewportFile=None):
+    """
+    Calculate the search behavior metrics of all participants
+    in one log file and write them to a CSV file.
+
+    :param logFile: file containing the raw logs
+    :param outFile: CSV file to write the metrics to
+    :param storeDir: read the events of the log file from this
+                     columnar store (see ingest.py) instead
+    :param cacheFile: read the events grouped per participant from this
+                      binary cache (see eventCache.py) instead
+    :param viewportFile: .npz file to write the viewport sizes to, see writeViewports
+    :return: None
+    """
+    parseQueryserpURL.cache_clear()
+    if cacheFile is not None:
+        from eventCache import openEventCache
+        with instrumentation.timer("logs.calculateMetricsPerSubmission"), openEventCache(logFile, cacheFile) as cache:
+            submissionMetrics = [calculateMetricsPerSubmission(prolificid, cache.events(prolificid)) for prolificid in cache.participants()]
+    else:
+        if storeDir is None:
+            logs = iterLogs(logFile)
+        else:
+            # Only import pyarrow when the store is used
+            from ingest import iterStoredLogs
+            logs = iterStoredLogs(storeDir, logFile)
+        with instrumentation.timer("logs.streamMetricsPerSubmission"):
+            submissionMetrics = streamMetricsPerSubmission(logs)
+    with instrumentation.timer("logs.writeToCSV"):
+        writeToCSV(outFile, submissionMetrics)
+    if viewportFile is not None:
+        with instrumentation.timer("logs.writeViewports"):
+            writeViewports(viewportFile, submissionMetrics)
+    cacheInfo = parseQueryserpURL.cache_info()
+    instrumentation.count("logs.urlCacheHits", cacheInfo.hits)
+    instrumentation.count("logs.urlCacheMisses", cacheInfo.misses)
+    instrumentation.log(instrumentation.INFO, "Query/SERP URL cache for " + logFile + ": " + str(cacheInfo))
+
+
+def processLogFiles(logFiles, outFiles, workers=1, storeDir=None, cacheFiles=None, viewportFiles=None):
+    """
+    Process several log files, each in its own worker process. Every file
+    is still processed by one worker in file order, so the CSV files are
+    identical to the ones of a serial run.
+
+    :param logFiles: files containing the raw logs
+    :param outFiles: CSV file to write to for each log file
+    :param workers: number of worker processes, 1 to process serially
+    :param storeDir: read the events from this columnar store, log files
+                     that changed since the last run are ingested first
+    :param cacheFiles: binary cache to read the events from for each log file,
+                       built first if it is missing or the log file changed
+    :param viewportFiles: .npz file to write the viewport sizes to for each log file
+    :return: None
+    """
+    if storeDir is not None:
+        from ingest import ingestLogs
+        for logFile in logFiles:
+            ingestLogs(logFile, storeDir)
+    if cacheFiles is None:
+        cacheFiles = [None] * len(logFiles)
+    else:
+        from eventCache import buildEventCache, isCurrent
+        for logFile, cacheFile in zip(logFiles, cacheFiles):
+            if not isCurrent(cacheFile, logFile):
+                with instrumentation.timer("logs.buildEventCache"):
+                    buildEventCache(logFile, cacheFile)
+    if viewportFiles is None:
+        viewportFiles = [None] * len(logFiles)
+
+    if workers <= 1:
+        for logFile, outFile, cacheFile, viewportFile in zip(logFiles, outFiles, cacheFiles, viewportFiles):
+            processLogFile(logFile, outFile, storeDir, cacheFile, viewportFile)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            settings = instrumentation.settings()
+            futures = [executor.submit(instrumentation.runInstrumented, settings, processLogFile, logFile, outFile, storeDir, cacheFile, viewportFile)
+                       for (logFile, outFile, cacheFile, viewportFile) in zip(logFiles, outFiles, cacheFiles, viewportFiles)]
+            # Consume the results so errors in the workers are raised here
+            for (logFile, future) in zip(logFiles, futures):
+                _, report = future.result()
+                instrumentation.merge(report, logFile)
 
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calculate search behavior metrics from the LogUI logs.")
+    parser.add_argument("conditions", nargs="*", default=CONDITIONS, help="conditions to process (default: all)")
+    parser.add_argument("--workers", type=int, default=1, help="number of log files to process in parallel")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the in/ and out/ directories")
+    parser.add_argument("--store", default=None, help="read the logs from this columnar store (see ingest.py)")
+    parser.add_argument("--cache", action="store_true", help="read the logs from binary caches grouped per participant (see eventCache.py)")
+    parser.add_argument("--incremental", action="store_true", help="only process the events added since the last incremental run (see incremental.py)")
+    instrumentation.addArguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args)
+
+    logFiles = [args.data_dir + "/in/logs-" + condition + ".log" for condition in args.conditions]
+    outFiles = [args.data_dir + "/out/behavior-" + condition + ".csv" for condition in args.conditions]
+    if args.incremental:
+        from incremental import updateLogFile
+        for condition, logFile, outFile in zip(args.conditions, logFiles, outFiles):
+            updateLogFile(logFile, outFile, args.data_dir + "/out/.behavior-" + condition + ".checkpoint")
+    else:
+        cacheFiles = [args.data_dir + "/out/.events-" + condition + ".cache" for condition in args.conditions] if args.cache else None
+        viewportFiles = [args.data_dir + "/out/viewports-" + condition + ".npz" for condition in args.conditions]
+        processLogFiles(logFiles, outFiles, args.workers, args.store, cacheFiles, viewportFiles)
+    instrumentation.writeReport(args.report)
@@ -0,0 +1,325 @@
+from urllib.parse import unquote
+import re
+import functools
+import instrumentation
+from logEvent import LogEvent, CLICK_TYPES
+
+# Accumulator classes registered with registerAccumulator, in registration order
+ACCUMULATORS = []
+
+
+def registerAccumulator(accumulator):
+    """
+    Register an accumulator class so that it is used for every participant.
+    Can be used as a class decorator. Accumulators are finalized in the
+    order in which they were registered, so an accumulator can use the
+    metrics of the accumulators registered before it.
+
+    :param accumulator: subclass of MetricAccumulator to register
+    :return: the registered class
+    """
+    ACCUMULATORS.append(accumulator)
+    return accumulator
+
+
+class MetricAccumulator:
+    """
+    Computes one or more metrics in a single pass over the logs of one
+    participant. Only logs whose eventDetails type is listed in eventTypes
+    are fed to the accumulator, as LogEvent, in the order in which they
+    were logged.
+    """
+    eventTypes = ()
+
+    def feed(self, log):
+        """
+        Update the state of the accumulator with one log.
+
+        :param log: LogEvent of one of the types in eventTypes
+        :return: None
+        """
+        raise NotImplementedError
+
+    def finalize(self, metrics):
+        """
+        Add the metrics to the metrics of the participant. Does not change
+        the state, so more logs can be fed afterwards.
+
+        :param metrics: the metrics calculated so far
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class SubmissionMetrics:
+    """
+    Calculate the metrics of one participant by feeding each log to the
+    accumulators interested in its type.
+    """
+
+    def __init__(self, submission, accumulators=None):
+        """
+        :param submission: prolific ID of the participant
+        :param accumulators: accumulator classes to use, defaults
+                             to all registered accumulators
+        """
+        self.submission = submission
+        self.accumulators = [accumulator() for accumulator in (ACCUMULATORS if accumulators is None else accumulators)]
+        self.accumulatorsPerType = {}
+        for accumulator in self.accumulators:
+            for eventType in accumulator.eventTypes:
+                self.accumulatorsPerType.setdefault(eventType, []).append(accumulator)
+
+    def feed(self, log):
+        """
+        Feed one log of the participant to the accumulators. Logs decoded
+        from JSON are only converted to a LogEvent if an accumulator uses them.
+
+        :param log: the log to process, as LogEvent or as JSON
+        :return: None
+        """
+        if isinstance(log, LogEvent):
+            accumulators = self.accumulatorsPerType.get(log.type, ())
+        else:
+            accumulators = self.accumulatorsPerType.get(log['eventDetails']['type'], ())
+            if accumulators:
+                log = LogEvent.fromLog(log)
+        for accumulator in accumulators:
+            accumulator.feed(log)
+
+    def finalize(self):
+        """
+        Collect the metrics of all accumulators.
+
+        :return: the metrics of the participant
+        """
+        submissionMetrics = {"prolificId": self.submission}
+        for accumulator in self.accumulators:
+            accumulator.finalize(submissionMetrics)
+        return submissionMetrics
+
+
+# URL of a SERP, followed by the SERP number and the query
+QUERYSERP_URL = re.compile(r'^https?:[\/]{2}[0-9.\/a-z-]+\?#([0-9]+)-(.*)$')
+
+
+@functools.lru_cache(maxsize=1024)
+def parseQueryserpURL(url):
+    """
+    Parse the SERP number and query from a URL. Cached because the new URL
+    of one URLChange event is the previous URL of the next one, so every
+    URL is only parsed once. parseQueryserpURL.cache_info() shows the hits.
+
+    :param url: the URL to parse
+    :return: (serp number, query still URL encoded), None if not a SERP
+    """
+    queryserp = QUERYSERP_URL.search(url)
+    if not queryserp:
+        return None
+    return int(queryserp.group(1)), queryserp.group(2)
+
+
+@registerAccumulator
+class PagefocusAccumulator(MetricAccumulator):
+    """
+    Calculate the intervals in which the pagefocus was on the SERP and
+    the time used. Start/stop logs are included in case the participant
+    started with focus/ended without focus.
+
+    Metrics calculated:
+    - [dwellTimePerMinute] dwell time on SERPs per minute (H)
+    - [timeUsed] time used in secs
+    """
+    eventTypes = ("started", "stopped", "viewportFocusChange")
+
+    def __init__(self):
+        self.startTime = None
+        self.stopTime = None
+        self.lastTimestamp = None
+        self.lastFocus = False
+        self.focusTime = 0
+
+    def feed(self, log):
+        eventType = log.type
+        if eventType == "viewportFocusChange":
+            timestamp = log.timestamp
+            hasFocus = log.hasFocus
+
+            # Add a focus interval if we went from true to false.
+            if not hasFocus:
+                self.focusTime += timestamp - self.lastTimestamp
+
+            self.lastTimestamp = timestamp
+            self.lastFocus = hasFocus
+        elif eventType == "started":
+            # Only the first start counts
+            if self.startTime is None:
+                self.startTime = log.timestamp
+                self.lastTimestamp = self.startTime
+        else:
+            # The last stop counts
+            self.stopTime = log.timestamp
+
+    def finalize(self, metrics):
+        focusTime = self.focusTime
+        # Close off last focus interval with stoptime if unfocused when time was over
+        if self.lastFocus:
+            focusTime += self.stopTime - self.lastTimestamp
+
+        timeUsedSecs = (self.stopTime - self.startTime) / 1000
+        timeUsedMins = timeUsedSecs / 60
+        dwellTime = focusTime / 1000 / timeUsedMins
+        if dwellTime == 0:
+            # If no page focus intervals were collected, the participants was on the SERP all the time.
+            # However, using the above dwell time calculation this would come down to 0. Therefore, we set it
+            # to the true value of 60 if 0 is calculated.
+            dwellTime = 60
+        metrics['dwellTimePerMinute'] = dwellTime
+        metrics['timeUsed'] = timeUsedSecs
+
+
+@registerAccumulator
+class ResultClickAccumulator(MetricAccumulator):
+    """
+    Calculate the result click metrics from the rank of each clicked result.
+    The last two are set to 0 if no results were clicked.
+
+    Metrics calculated:
+    - [noOfResultsClicked] number of results clicked
+    - [deepestRankVisitedResults] deepest rank of search results visited (H)
+    - [avgRankVisitedResults] average rank of search results visited
+    """
+    eventTypes = CLICK_TYPES
+
+    def __init__(self):
+        self.clicks = 0
+        self.deepestRank = 0
+        self.rankSum = 0
+
+    def feed(self, log):
+        if instrumentation.LEVEL >= instrumentation.TRACE:
+            instrumentation.log(instrumentation.TRACE, "SERP: " + log.resultQuery + " | " + log.resultTitle)
+        rank = log.rank
+        self.clicks += 1
+        self.deepestRank = rank if self.clicks == 1 else max(self.deepestRank, rank)
+        self.rankSum += rank
+
+    def finalize(self, metrics):
+        metrics['noOfResultsClicked'] = self.clicks
+        metrics['deepestRankVisitedResults'] = 0 if self.clicks == 0 else self.deepestRank
+        metrics['avgRankVisitedResults'] = 0 if self.clicks == 0 else self.rankSum / self.clicks
+
+
+@registerAccumulator
+class QueryserpAccumulator(MetricAccumulator):
+    """
+    Filter out all the queries and SERP changes. Done in
+    this way since are incoorperated in one type of log.
+    Requires timeUsed, so must be finalized after PagefocusAccumulator.
+
+    Metrics calculated:
+    - [queriesIssued] number of queries issued in total
+    - [queryRate] number of queries issued per minute (H)
+    - [avgQueryLengthWords] average length of queries issued in words (H)
+    - [avgQueryLengthChars] average length of queries issued in characters
+    - [serpsVisited] number of SERPs visited
+    """
+    eventTypes = ("URLChange",)
+
+    def __init__(self):
+        self.queries = 0
+        self.queryWords = 0
+        self.queryChars = 0
+        self.serps = 0
+
+    def feed(self, log):
+        # parse query and serp number
+        queryserp_newURL = parseQueryserpURL(log.newURL)
+        queryserp_previousURL = parseQueryserpURL(log.previousURL)
+        # Look at the previous and new query/serp to identify cases below
+        if queryserp_newURL and queryserp_previousURL:
+            if queryserp_newURL[1] == queryserp_previousURL[1]:
+                # Case where query stayed the same and serp number changed
+                self.addSerp(queryserp_newURL[0])
+            else:
+                # Case where query differed, thus new query issued
+                self.addSerp(1)
+                self.addQuery(unquote(unquote(queryserp_newURL[1])))
+        elif not queryserp_newURL:
+            # Case where no new query was issued. Can happen on refresh or return to main landing page.
+            # Pass since its no serp visit or query issued
+            pass
+        elif not queryserp_previousURL and queryserp_newURL:
+            # Case without previous query, thus new query issued (from main)
+            self.addSerp(1)
+            self.addQuery(unquote(unquote(queryserp_newURL[1])))
+
+    def addSerp(self, serp):
+        if instrumentation.LEVEL >= instrumentation.TRACE:
+            instrumentation.log(instrumentation.TRACE, "SERP visited: " + str(serp))
+        self.serps += 1
+
+    def addQuery(self, query):
+        if instrumentation.LEVEL >= instrumentation.TRACE:
+            instrumentation.log(instrumentation.TRACE, "Query issued: " + query)
+        self.queries += 1
+        self.queryWords += len(query.split())
+        self.queryChars += len(query)
+
+    def finalize(self, metrics):
+        metrics['queriesIssued'] = self.queries
+        metrics['queryRate'] = self.queries / (metrics['timeUsed'] / 60)
+        metrics['avgQueryLengthWords'] = 0 if self.queries == 0 else self.queryWords / self.queries
+        metrics['avgQueryLengthChars'] = 0 if self.queries == 0 else self.queryChars / self.queries
+        metrics['serpsVisited'] = self.serps
+
+
+# Viewport size as logged by LogUI, e.g. 1280x720
+VIEWPORT_SIZE = re.compile(r'^([0-9]+)x([0-9]+)$')
+
+
+@functools.lru_cache(maxsize=1024)
+def parseViewportSize(size):
+    """
+    Parse the width and height from a viewport size. Cached because most
+    participants have one of a few common sizes.
+
+    :param size: the viewport size, e.g. 1280x720
+    :return: (width, height), None if not a size
+    """
+    viewportSize = VIEWPORT_SIZE.match(size)
+    if not viewportSize:
+        return None
+    return int(viewportSize.group(1)), int(viewportSize.group(2))
+
+
+@registerAccumulator
+class ViewportAccumulator(MetricAccumulator):
+    """
+    Collect the viewport sizes: the initial size when LogUI was
+    started and the sizes after the viewport has been resized.
+    Not written to the behavior CSV, see logs.writeViewports.
+
+    Metrics calculated:
+    - [initialViewport] (width, height) when started, None if unknown
+    - [viewportResizes] list of (width, height) after every resize
+    """
+    eventTypes = ("started", "viewportResize")
+
+    def __init__(self):
+        self.initialSize = None
+        self.viewportSizes = []
+
+    def feed(self, log):
+        if log.type == "viewportResize":
+            size = parseViewportSize(log.viewportSize)
+            if size is not None:
+                self.viewportSizes.append(size)
+        elif self.initialSize is None:
+            self.initialSize = parseViewportSize(log.viewportSize)
+
+    def finalize(self, metrics):
+        metrics['initialViewport'] = self.initialSize
+        metrics['viewportResizes'] = list(self.viewportSizes)
+        if instrumentation.LEVEL >= instrumentation.DEBUG:
+            instrumentation.log(instrumentation.DEBUG, [self.initialSize] + self.viewportSizes)
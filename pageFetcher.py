@@ -0,0 +1,221 @@
+import hashlib
+import http.client
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+USER_AGENT = "Mozilla/5.0 (compatible; bbt-analysis)"
+
+# HTTP status codes worth retrying, other HTTP errors are permanent
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Errors of downloading a page: URLError, HTTPError, timeouts and connection
+# errors are all OSErrors, a broken response raises an HTTPException
+DOWNLOAD_ERRORS = (OSError, http.client.HTTPException)
+
+
+class ExtractionError(Exception):
+    """
+    The text of a page could not be extracted. Any error of the extractor,
+    e.g. of its parser, only fails the page; it is kept as the __cause__.
+    """
+
+
+# Errors of extracting the text of a page
+EXTRACTION_ERRORS = (ExtractionError,)
+
+
+def cachePath(cacheDir, url, extension):
+    """
+    Get the path of a cached file of a URL. Files are named after
+    the SHA-256 of the URL, so any URL maps to a valid file name.
+
+    :param cacheDir: directory of the content cache
+    :param url: the URL of the web page
+    :param extension: html for the page, charset for the charset of its Content-Type header,
+                      <extractor>.txt for the text extracted by a backend
+    :return: path of the cached file
+    """
+    return os.path.join(cacheDir, hashlib.sha256(url.encode("utf-8")).hexdigest() + "." + extension)
+
+
+def writeAtomically(path, content):
+    """
+    Write a file so that an interrupted run never leaves a partial file behind.
+
+    :param path: the file to write
+    :param content: bytes to write
+    :return: None
+    """
+    temporaryPath = path + ".tmp" + str(threading.get_ident())
+    with open(temporaryPath, "wb") as file:
+        file.write(content)
+    os.replace(temporaryPath, path)
+
+
+def readCachedText(cacheDir, url, extractor):
+    """
+    Read the extracted text of a web page from the content cache.
+    Texts are cached per text extraction backend, as the backends
+    extract different texts from the same page.
+
+    :param cacheDir: directory of the content cache
+    :param url: the URL of the web page
+    :param extractor: name of the text extraction backend, see textExtraction.py
+    :return: the text, None if the text of the page is not cached
+    """
+    path = cachePath(cacheDir, url, extractor + ".txt")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return file.read()
+
+
+def readCachedHTML(cacheDir, url):
+    """
+    Read the HTML of a web page from the content cache, with the charset
+    of the Content-Type header it was served with.
+
+    :param cacheDir: directory of the content cache
+    :param url: the URL of the web page
+    :return: (the HTML as bytes, the charset or None), None if the page is not cached
+    """
+    path = cachePath(cacheDir, url, "html")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        html = file.read()
+    charsetPath = cachePath(cacheDir, url, "charset")
+    if not os.path.exists(charsetPath):
+        return html, None
+    with open(charsetPath, encoding="ascii") as file:
+        return html, file.read()
+
+
+def isUnknownHost(error):
+    """
+    :param error: the reason of a URLError
+    :return: True if the host name does not resolve; a temporary failure of the name server is not
+    """
+    return isinstance(error, socket.gaierror) and error.errno != socket.EAI_AGAIN
+
+
+def isTransient(error):
+    """
+    Check whether fetching a page failed for a reason that may be gone
+    on a later run, such as a timeout, rather than for good, such as a 404
+    or a host that does not exist.
+
+    :param error: the error of fetchPages
+    :return: True if fetching the page again may succeed
+    """
+    if isinstance(error, HTTPError):
+        return error.code in RETRY_STATUS
+    if isinstance(error, URLError) and isUnknownHost(error.reason):
+        return False
+    return isinstance(error, DOWNLOAD_ERRORS)
+
+
+def downloadPage(url, timeout, retries, backoff):
+    """
+    Download a web page, retrying timeouts, connection errors and
+    temporary HTTP errors with exponential backoff. Unknown hosts are
+    not retried.
+
+    :param url: the URL of the web page
+    :param timeout: seconds to wait for the server per attempt
+    :param retries: number of attempts after the first one
+    :param backoff: seconds to wait before the first retry, doubled every retry
+    :return: (the HTML as bytes, the charset of the Content-Type header or None)
+    """
+    for attempt in range(retries + 1):
+        try:
+            with urlopen(Request(url, headers={"User-Agent": USER_AGENT}), timeout=timeout) as response:
+                return response.read(), response.headers.get_content_charset()
+        except HTTPError as error:
+            if error.code not in RETRY_STATUS or attempt == retries:
+                raise
+        except (URLError, socket.timeout, ConnectionError) as error:
+            if attempt == retries or (isinstance(error, URLError) and isUnknownHost(error.reason)):
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+
+def fetchPages(urls, cacheDir, extractText, extractor, workers=16, perHost=4, timeout=30, retries=2, backoff=1.0):
+    """
+    Fetch the text of web pages concurrently. Every URL is fetched once,
+    however often it occurs, and at most perHost pages are downloaded from
+    the same host at a time. The HTML and the extracted text are stored in
+    the content cache, so pages fetched before are read from disk. The text
+    is cached per extractor; pages of which only the HTML is cached, e.g.
+    after switching extractors, are extracted again without downloading them.
+    Pages that failed to download are not cached, so they are downloaded
+    again on the next run; of pages that failed to extract only the HTML is.
+    The charset of the Content-Type header of a page is cached next to its
+    HTML and passed to extractText, so the page is decoded as it was served.
+    Only download and extraction errors are returned as failed pages,
+    other errors are raised; any error of extractText is an ExtractionError.
+
+    :param urls: the URLs of the web pages, may contain duplicates
+    :param cacheDir: directory of the content cache
+    :param extractText: function converting the HTML of a page and its charset (or None) to text
+    :param extractor: name of the text extraction backend of extractText, the key of the text cache
+    :param workers: number of pages downloaded at a time
+    :param perHost: number of pages downloaded from one host at a time
+    :param timeout: seconds to wait for the server per attempt
+    :param retries: number of attempts after the first one
+    :param backoff: seconds to wait before the first retry, doubled every retry
+    :return: (dictionary url -> text, dictionary url -> error of the failed pages)
+    """
+    os.makedirs(cacheDir, exist_ok=True)
+    texts = {}
+    errors = {}
+    hostSemaphores = {}
+    lock = threading.Lock()
+
+    def fetch(url):
+        with lock:
+            semaphore = hostSemaphores.setdefault(urlsplit(url).netloc, threading.BoundedSemaphore(perHost))
+        cached = readCachedHTML(cacheDir, url)
+        if cached is None:
+            try:
+                with semaphore:
+                    cached = downloadPage(url, timeout, retries, backoff)
+            except DOWNLOAD_ERRORS as error:
+                errors[url] = error
+                return
+            (html, charset) = cached
+            # The HTML is written last, a cached page always has its charset
+            if charset is None:
+                if os.path.exists(cachePath(cacheDir, url, "charset")):
+                    os.remove(cachePath(cacheDir, url, "charset"))
+            else:
+                writeAtomically(cachePath(cacheDir, url, "charset"), charset.encode("ascii"))
+            writeAtomically(cachePath(cacheDir, url, "html"), html)
+        (html, charset) = cached
+        try:
+            text = extractText(html, charset)
+        except Exception as error:
+            errors[url] = ExtractionError(repr(error))
+            errors[url].__cause__ = error
+            return
+        writeAtomically(cachePath(cacheDir, url, extractor + ".txt"), text.encode("utf-8"))
+        texts[url] = text
+
+    toFetch = []
+    for url in dict.fromkeys(urls):
+        text = readCachedText(cacheDir, url, extractor)
+        if text is None:
+            toFetch.append(url)
+        else:
+            texts[url] = text
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, toFetch))
+
+    return texts, errors
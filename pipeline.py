@@ -0,0 +1,319 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import args as argsModule
+import condition
+import instrumentation
+import join
+import logs
+import posttask
+import pretask
+import ratedArgs
+import timeline
+
+# Directory of the scripts, their source is part of the hash of a stage
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stage:
+    """
+    One step of the analysis: a function reading the input files and
+    writing the output files. With a list of inputs the function is called
+    with the paths of the inputs followed by the paths of the outputs. With
+    a dictionary of inputs it is called with the paths of the outputs and
+    the inputs as keyword arguments, named by their role in the stage.
+    """
+
+    def __init__(self, name, function, inputs, outputs, code, options=None):
+        """
+        :param name: name of the stage
+        :param function: module level function running the stage
+        :param inputs: files read by the stage, either a list of paths or a dictionary
+        from the role of the files to a path, a list of paths or a dictionary of paths
+        :param outputs: files written by the stage
+        :param code: scripts implementing the stage, a change reruns the stage
+        :param options: keyword arguments for the function
+        """
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.outputs = outputs
+        self.code = code
+        self.options = options or {}
+
+    def inputFiles(self):
+        """
+        List all files read by the stage, whether they are passed by
+        position or by role.
+
+        :return: list of the paths
+        """
+        if not isinstance(self.inputs, dict):
+            return list(self.inputs)
+        files = []
+        for role in self.inputs.values():
+            if isinstance(role, str):
+                files.append(role)
+            elif isinstance(role, dict):
+                files.extend(role.values())
+            else:
+                files.extend(role)
+        return files
+
+    def run(self, settings):
+        """
+        Run the function of the stage with instrumentation.runInstrumented,
+        in a worker process when submitted to an executor.
+
+        :param settings: instrumentation settings of the main process
+        :return: the result of instrumentation.runInstrumented
+        """
+        if isinstance(self.inputs, dict):
+            return instrumentation.runInstrumented(settings, self.function, *self.outputs, **self.inputs, **self.options)
+        return instrumentation.runInstrumented(settings, self.function, *(self.inputs + self.outputs), **self.options)
+
+
+def runArgs(argsFile, timesFile, argumentsFile):
+    argsSubmissions = argsModule.importArgs(argsFile)
+    argsModule.writeTimeStatsAndNoOfArgsToCSV(timesFile, argsSubmissions)
+    argsModule.writeArgumentsIndividuallyToCSV(argumentsFile, argsSubmissions)
+
+
+def runRatedArgs(ratingsFile, outFile):
+    ratedArgs.writeAvgRatingsToCSV(outFile, ratedArgs.processRatings(ratingsFile))
+
+
+def runPosttask(posttaskFile, outFile):
+    posttask.writeToCSV(outFile, posttask.processSubmissions(posttask.importPosttasks(posttaskFile)))
+
+
+def runLogs(logFile, outFile, viewportFile):
+    logs.processLogFile(logFile, outFile, viewportFile=viewportFile)
+
+
+def runListReliance(listFile, gridFile, ilspFile, saFile, argsFile, outFile, errorFile, cacheDir):
+    # Imported here since fetching and scoring pulls in lxml and scikit-learn
+    import listReliance
+    listReliance.calculateReliance([listFile, gridFile, ilspFile, saFile], argsFile, outFile, errorFile, cacheDir)
+
+
+def runJoin(outFile, reportFile, sources, behaviorFiles, logFiles):
+    # The sources are passed as a dictionary, joinParticipants takes (name, file) pairs in order
+    join.joinParticipants(list(sources.items()), behaviorFiles, logFiles, outFile, reportFile)
+
+
+def defineStages(dataDir):
+    """
+    Declare the stages of the analysis with their inputs and outputs.
+    The dependencies between stages follow from the files: a stage
+    depends on the stages writing its inputs.
+
+    :param dataDir: directory with the in/ and out/ directories
+    :return: list of the stages
+    """
+    inDir = os.path.join(dataDir, "in")
+    outDir = os.path.join(dataDir, "out")
+    logFiles = [os.path.join(inDir, "logs-" + c + ".log") for c in logs.CONDITIONS]
+    stages = [
+        Stage("args", runArgs, [os.path.join(inDir, "args.json")],
+              [os.path.join(outDir, "submissionTimesAndNoOfArgs.csv"), os.path.join(outDir, "argumentsToRate.csv")], ["args.py", "tableWriter.py"]),
+        # The arguments are rated by hand from argumentsToRate.csv to allArgsRated.csv
+        Stage("ratedArgs", runRatedArgs, [os.path.join(inDir, "allArgsRated.csv")],
+              [os.path.join(outDir, "argumentsAvgRatings.csv")], ["ratedArgs.py", "tableWriter.py"]),
+        Stage("pretask", pretask.importPretasks, [os.path.join(inDir, "pretask.json")],
+              [os.path.join(outDir, "pretasks.csv")], ["pretask.py", "scales.py", "tableWriter.py"]),
+        Stage("posttask", runPosttask, [os.path.join(inDir, "posttask.json")],
+              [os.path.join(outDir, "posttask.csv")], ["posttask.py", "scales.py", "tableWriter.py"]),
+        Stage("condition", condition.processConditions, [os.path.join(inDir, "condition.json")],
+              [os.path.join(outDir, "condition.csv")], ["condition.py", "tableWriter.py"]),
+        Stage("listReliance", runListReliance, logFiles + [os.path.join(inDir, "args.json")],
+              [os.path.join(outDir, "listReliance.csv"), os.path.join(outDir, "listReliance-errors.csv")],
+              ["listReliance.py", "instrumentation.py", "logs.py", "pageFetcher.py", "similarity.py", "tableWriter.py", "textExtraction.py"],
+              {"cacheDir": os.path.join(dataDir, "cache", "pages")}),
+    ]
+    for (c, logFile) in zip(logs.CONDITIONS, logFiles):
+        stages.append(Stage("logs-" + c, runLogs, [logFile], [os.path.join(outDir, "behavior-" + c + ".csv"), os.path.join(outDir, "viewports-" + c + ".npz")],
+                            ["logs.py", "eventCache.py", "instrumentation.py", "logEvent.py", "metrics.py", "tableWriter.py", "timestamps.py"]))
+        stages.append(Stage("windows-" + c, timeline.processWindows, [logFile, os.path.join(inDir, "args.json")],
+                            [os.path.join(outDir, "behavior-windows-" + c + ".csv")],
+                            ["timeline.py", "args.py", "eventCache.py", "instrumentation.py", "logEvent.py", "logs.py", "metrics.py", "tableWriter.py", "timestamps.py"]))
+    sources = join.defaultSources(outDir)
+    behaviorFiles = {c: os.path.join(outDir, "behavior-" + c + ".csv") for c in logs.CONDITIONS}
+    stages.append(Stage("join", runJoin, {"sources": dict(sources), "behaviorFiles": behaviorFiles, "logFiles": logFiles},
+                        [os.path.join(outDir, "participants.csv"), os.path.join(outDir, "participants-report.csv")],
+                        ["join.py", "instrumentation.py", "logs.py", "tableWriter.py"]))
+    return stages
+
+
+def hashFile(file, digests=None):
+    """
+    Hash the contents of a file. The digests of a run are kept by path,
+    modification time and size, so a file read by several stages, like
+    the logs, is only hashed once.
+
+    :param file: the file to hash
+    :param digests: dictionary with the digests hashed before in this run, None to always hash
+    :return: hex digest
+    """
+    stat = os.stat(file)
+    key = (file, stat.st_mtime_ns, stat.st_size)
+    if digests is not None and key in digests:
+        instrumentation.count("pipeline.hashCacheHits")
+        return digests[key]
+    hash = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hash.update(chunk)
+    instrumentation.count("pipeline.hashedBytes", stat.st_size)
+    if digests is not None:
+        digests[key] = hash.hexdigest()
+    return hash.hexdigest()
+
+
+def hashStage(stage, digests=None):
+    """
+    Hash the inputs and the code of a stage, so it can be skipped when
+    neither changed since its last run.
+
+    :param stage: the stage to hash
+    :param digests: dictionary with the digests of the files hashed before in this run
+    :return: hex digest
+    """
+    hash = hashlib.sha256()
+    for file in stage.inputFiles() + [os.path.join(SCRIPT_DIR, script) for script in stage.code]:
+        hash.update(file.encode("utf-8") + b"\0" + hashFile(file, digests).encode("ascii") + b"\0")
+    return hash.hexdigest()
+
+
+def dependencies(stages):
+    """
+    Find the stages every stage depends on through its inputs. Stages
+    depending on each other could never run, so a cycle is an error.
+
+    :param stages: all stages
+    :return: dictionary with the names of the stages each stage depends on
+    """
+    writers = {output: stage.name for stage in stages for output in stage.outputs}
+    waitingFor = {stage.name: {writers[file] for file in stage.inputFiles() if file in writers} for stage in stages}
+
+    # Depth-first search, a stage that is reached again while it is on the path closes a cycle
+    done = set()
+    path = []
+
+    def visit(name):
+        if name in path:
+            cycle = path[path.index(name):] + [name]
+            raise ValueError("Stages depend on each other: " + " -> ".join(cycle))
+        if name in done:
+            return
+        path.append(name)
+        for dependency in sorted(waitingFor[name]):
+            visit(dependency)
+        path.pop()
+        done.add(name)
+
+    for name in waitingFor:
+        visit(name)
+    return waitingFor
+
+
+def runPipeline(stages, stateFile, workers=1, force=False):
+    """
+    Run the stages in dependency order. Stages whose dependencies are done
+    run in parallel. A stage is skipped when the hash of its inputs and
+    code is the same as in its last successful run and its outputs exist.
+    Stages depending on a failed stage are not run.
+
+    :param stages: the stages to run
+    :param stateFile: JSON file with the hash of the last run of every stage
+    :param workers: number of stages to run in parallel
+    :param force: run all stages, even if nothing changed
+    :return: dictionary with the result of each stage: ran, skipped, failed or blocked
+    """
+    state = {}
+    settings = instrumentation.settings()
+    if os.path.exists(stateFile):
+        with open(stateFile) as file:
+            state = json.load(file)
+
+    waitingFor = dependencies(stages)
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+    results = {}
+    # Digests of the files hashed in this run, by path, modification time and size
+    digests = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                if waitingFor[name] & (set(pending) | {name for (name, _, _) in running.values()}):
+                    continue
+                stage = pending.pop(name)
+                if any(results.get(dependency) in ("failed", "blocked") for dependency in waitingFor[name]):
+                    instrumentation.log(instrumentation.INFO, "[" + name + "] blocked by a failed stage")
+                    results[name] = "blocked"
+                    continue
+                missing = [file for file in stage.inputFiles() if not os.path.exists(file)]
+                if missing:
+                    instrumentation.log(instrumentation.INFO, "[" + name + "] failed: missing input " + ", ".join(missing))
+                    results[name] = "failed"
+                    continue
+                with instrumentation.timer("pipeline.hashStage"):
+                    stageHash = hashStage(stage, digests)
+                if not force and state.get(name) == stageHash and all(os.path.exists(output) for output in stage.outputs):
+                    instrumentation.log(instrumentation.INFO, "[" + name + "] unchanged, skipped")
+                    results[name] = "skipped"
+                    continue
+                instrumentation.log(instrumentation.INFO, "[" + name + "] running")
+                for output in stage.outputs:
+                    os.makedirs(os.path.dirname(output), exist_ok=True)
+                state.pop(name, None)
+                future = executor.submit(stage.run, settings)
+                running[future] = (name, stageHash, time.perf_counter())
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                (name, stageHash, start) = running.pop(future)
+                instrumentation.record("pipeline.stage." + name, time.perf_counter() - start)
+                instrumentation.observe("pipeline.stageSeconds", time.perf_counter() - start)
+                if future.exception() is None:
+                    state[name] = stageHash
+                    results[name] = "ran"
+                    instrumentation.merge(future.result()[1], name)
+                    instrumentation.log(instrumentation.INFO, "[" + name + "] done")
+                else:
+                    results[name] = "failed"
+                    instrumentation.log(instrumentation.INFO, "[" + name + "] failed: " + repr(future.exception()))
+            # Save after every stage so an interrupted run does not redo finished stages
+            with open(stateFile, "w") as file:
+                json.dump(state, file, indent=2)
+
+    for result in results.values():
+        instrumentation.count("pipeline." + result)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the analysis, skipping stages whose inputs did not change.")
+    parser.add_argument("stages", nargs="*", help="stages to run (default: all)")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the in/ and out/ directories")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of stages to run in parallel")
+    parser.add_argument("--force", action="store_true", help="run stages even if their inputs did not change")
+    instrumentation.addArguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args)
+
+    stages = defineStages(args.data_dir)
+    if args.stages:
+        stages = [stage for stage in stages if stage.name in args.stages]
+    os.makedirs(os.path.join(args.data_dir, "out"), exist_ok=True)
+    results = runPipeline(stages, os.path.join(args.data_dir, "out", ".pipeline-state.json"), args.workers, args.force)
+    instrumentation.writeReport(args.report)
+    if "failed" in results.values():
+        raise SystemExit(1)
@@ -1,14 +1,23 @@
+import argparse
 import json
 
+from tableWriter import writeTable
 
-def importPosttasks(file):
+
+def importPosttasks(file, storeDir=None):
     """
     Import the raw JSON posttask questionnaires as a
     list of JSON object.
 
     :param file: file containing the raw JSON to import
+    :param storeDir: read the posttasks from this columnar store (see ingest.py) instead
     :return: imported args as JSON objects
     """
+    if storeDir is not None:
+        # Only import pyarrow when the store is used
+        from ingest import readCollection
+        return readCollection(storeDir, "bbtPosttask")
+
     posttasks_json = []
     with open(file) as file:
         for line in file:
@@ -16,81 +25,35 @@ def importPosttasks(file):
     return posttasks_json
 
 
-def processSubmission(posttaskSubmission):
+def processSubmissions(posttaskSubmissions):
     """
     Calculate the ATI score and the sub and total scores of the
-    User Experience Scale. Also check if attention check was passed.
+    User Experience Scale for all submissions at once, see scales.py.
+    Also check if attention check was passed.
 
-    :param posttaskSubmission: the posttask questionnaire in JSON
-    :return: calculated metrics in JSON format.
+    :param posttaskSubmissions: the posttask questionnaires in JSON
+    :return: calculated metrics of every submission in JSON format.
     """
-    posttaskMetrics = { 'prolificID': posttaskSubmission['_id'] }
-
-    # Reverse score of items using a reverse scale
-    posttaskSubmission['pus1'] = reverseLikertScore(posttaskSubmission['pus1'])
-    posttaskSubmission['pus2'] = reverseLikertScore(posttaskSubmission['pus2'])
-    posttaskSubmission['pus3'] = reverseLikertScore(posttaskSubmission['pus3'])
-    posttaskSubmission['ati3'] = reverseLikertScore6(posttaskSubmission['ati3'])
-    posttaskSubmission['ati6'] = reverseLikertScore6(posttaskSubmission['ati6'])
-    posttaskSubmission['ati8'] = reverseLikertScore6(posttaskSubmission['ati8'])
+    # scales.py imports NumPy, so it is only imported when the questionnaires are scored
+    from scales import ScaleScorer, POSTTASK_SCALES, POSTTASK_ATTENTION_CHECKS
 
-    # Calculate ATI score
-    posttaskMetrics['ati'] = sum([posttaskSubmission['ati' + str(i)] for i in range(1, 10)]) / 9
-
-    # Calculate UES subscores and final scores
-    posttaskMetrics['uesRws'] = sum([posttaskSubmission['rws' + str(i)] for i in range(1, 4)]) / 3
-    posttaskMetrics['uesAes'] = sum([posttaskSubmission['aes' + str(i)] for i in range(1, 4)]) / 3
-    posttaskMetrics['uesPus'] = sum([posttaskSubmission['pus' + str(i)] for i in range(1, 4)]) / 3
-    posttaskMetrics['uesFas'] = sum([posttaskSubmission['fas' + str(i)] for i in range(1, 4)]) / 3
-    posttaskMetrics['uesTotal'] = (posttaskMetrics['uesRws'] + posttaskMetrics['uesAes'] + posttaskMetrics['uesPus'] + posttaskMetrics['uesFas']) / 4
-
-    # Add question asking whether participants felt they had enough time
-    posttaskMetrics['timeconstraint'] = posttaskSubmission['timeconstraint']
+    scorer = ScaleScorer(POSTTASK_SCALES, POSTTASK_ATTENTION_CHECKS)
+    scores = {name: values.tolist() for (name, values) in scorer.score(posttaskSubmissions).items()}
 
     # Print message if attention check was failed
-    if not posttaskSubmission['attn'] == 2:
-        print("[WARNING] Participant " + posttaskSubmission['_id'] + " failed the attention check!")
-
+    scorer.warnFailedAttentionChecks(posttaskSubmissions)
+
+    posttaskMetrics = []
+    for (i, posttaskSubmission) in enumerate(posttaskSubmissions):
+        metrics = {'prolificID': posttaskSubmission['_id']}
+        for (name, values) in scores.items():
+            metrics[name] = values[i]
+        # Add question asking whether participants felt they had enough time
+        metrics['timeconstraint'] = posttaskSubmission['timeconstraint']
+        posttaskMetrics.append(metrics)
     return posttaskMetrics
 
 
-def reverseLikertScore(score):
-    """
-    Function that returns a reversed score (5-point Likert scale)
-    :param score: unreversed score
-    :return: reversed score
-    """
-    if score == 1:
-        return 5
-    if score == 2:
-        return 4
-    if score == 3:
-        return 3
-    if score == 4:
-        return 2
-    if score == 5:
-        return 1
-
-
-def reverseLikertScore6(score):
-    """
-    Function that returns a reversed score (6-point Likert scale)
-    :param score: unreversed score
-    :return: reversed score
-    """
-    if score == 1:
-        return 6
-    if score == 2:
-        return 5
-    if score == 3:
-        return 4
-    if score == 4:
-        return 3
-    if score == 5:
-        return 2
-    if score == 6:
-        return 1
-
 def writeToCSV(out_file, processedSubmissions):
     """
     Write the calculated metrics to a CSV file.
@@ -100,18 +63,19 @@ def writeToCSV(out_file, processedSubmissions):
                                     to the file.
     :return: None
     """
-    file = open(out_file, "w")
-    file.write("prolificID,ati,uesRws,uesAes,uesPus,uesFas,uesTotal,timeconstraint\n")
-    for s in processedSubmissions:
-        file.write(s['prolificID'] + "," + str(s['ati']) + "," + str(s['uesRws']) + "," + str(s['uesAes']) + "," + str(s['uesPus']) + "," + str(s['uesFas']) + "," + str(s['uesTotal']) + "," + str(s['timeconstraint']) + "\n")
-    file.close()
+    columns = ["prolificID", "ati", "uesRws", "uesAes", "uesPus", "uesFas", "uesTotal", "timeconstraint"]
+    writeTable(out_file, columns, ([s[column] for column in columns] for s in processedSubmissions))
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="ATI and UES scores of the posttask questionnaires.")
+    parser.add_argument("--store", default=None, help="read the posttasks from this columnar store (see ingest.py)")
+    args = parser.parse_args()
+
     # Load raw posttask questionnaires from file
-    posttaskSubmissions = importPosttasks("/home/mike/git/bbt-analysis/data/in/posttask.json")
+    posttaskSubmissions = importPosttasks("/home/mike/git/bbt-analysis/data/in/posttask.json", args.store)
 
     # Calculate the necessary metrics
-    processedSubmissions = [processSubmission(s) for s in posttaskSubmissions]
+    processedSubmissions = processSubmissions(posttaskSubmissions)
 
     # Write the required metrics to a CSV file to be able to import later for statistical analysis.
     writeToCSV("/home/mike/git/bbt-analysis/data/out/posttask.csv", processedSubmissions)
@@ -1,26 +1,37 @@
+import argparse
 import json
 
+from tableWriter import TableWriter
 
-def importPretasks(file, outfile):
+
+def importPretasks(file, outfile, storeDir=None):
     """
     Convert the raw JSON pretask questionnaires to a CSV file.
-    Output warning if an attention check was failed.
+    Output warning if an attention check was failed, see scales.py.
 
     :param file: file containing the raw pretasks to convert
+    :param storeDir: read the pretasks from this columnar store (see ingest.py) instead
     :return: None
     """
-    with open(file, "r") as pretasks_file:
-        with open(outfile, "w") as csv_file:
-            csv_file.write("prolificID,gender,age,education,wse,priorknowl,interest,taskdef\n")
-            for line in pretasks_file:
-                pretask = json.loads(line)
-                if not pretask['attn'] == 1:
-                    print("[WARNING] Participant " + pretask['_id'] + " failed the attention check!")
-                csv_file.write(pretask['_id'] + "," + str(pretask['gender']) + "," + str(pretask['age']) + "," + str(pretask['education']) + "," + str(pretask['wse']) + "," + str(pretask['priorknowl']) + "," + str(pretask['interest']) + "," + str(pretask['taskdef']) + "\n")
-        csv_file.close()
-    pretasks_file.close()
+    columns = ["_id", "gender", "age", "education", "wse", "priorknowl", "interest", "taskdef"]
+    if storeDir is not None:
+        # Only import pyarrow when the store is used
+        from ingest import readCollection
+        pretasks = readCollection(storeDir, "bbtPretask")
+    else:
+        with open(file, "r") as pretasks_file:
+            pretasks = [json.loads(line) for line in pretasks_file]
+    # scales.py imports NumPy, so it is only imported when the questionnaires are checked
+    from scales import ScaleScorer, PRETASK_ATTENTION_CHECKS
+    ScaleScorer([], PRETASK_ATTENTION_CHECKS).warnFailedAttentionChecks(pretasks)
+    with TableWriter(outfile, ["prolificID"] + columns[1:]) as writer:
+        writer.writeRows([pretask[column] for column in columns] for pretask in pretasks)
 
 
 if __name__ == '__main__':
-    pretaskSubmissions = importPretasks("/home/mike/git/bbt-analysis/data/in/pretask.json", "/home/mike/git/bbt-analysis/data/out/pretasks.csv")
+    parser = argparse.ArgumentParser(description="Convert the pretask questionnaires to a CSV file.")
+    parser.add_argument("--store", default=None, help="read the pretasks from this columnar store (see ingest.py)")
+    args = parser.parse_args()
+
+    pretaskSubmissions = importPretasks("/home/mike/git/bbt-analysis/data/in/pretask.json", "/home/mike/git/bbt-analysis/data/out/pretasks.csv", args.store)
 
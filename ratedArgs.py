@@ -1,52 +1,189 @@
+import argparse
+import itertools
 import re
 
+from tableWriter import readTable, writeTable
 
-def processRatings(file):
+# Prolific IDs are 24 lowercase hexadecimal characters
+PROLIFIC_ID = re.compile(r'^[a-z0-9]{24}$')
+
+# Valid values of the TDepth (subtopic, 0 if none), DQual and DIntrp ratings
+RATINGS = frozenset("01234")
+
+# Rated metrics, in the order of the columns after the prolific ID
+METRICS = ("TDepth", "DQual", "DIntrp")
+
+
+def parseRatingRow(row):
     """
-    Read the rated arguments from the CSV and sort them by prolificId and
-    by metrics (TDepth, DQual, DInterp)
-    As for T-Depth, each argument should have the number of one of the four
-    subtopics it fits with best.
+    Parse one row of a rated arguments file: prolific ID, TDepth, DQual,
+    DIntrp and the argument. Rows that are not rated are skipped.
+
+    :param row: the row as read by the csv module
+    :return: (prolific ID, argument, (TDepth, DQual, DIntrp) as ints), None if the row is not rated
+    """
+    if len(row) < 4 or row[1] not in RATINGS or row[2] not in RATINGS or row[3] not in RATINGS or not PROLIFIC_ID.match(row[0]):
+        return None
+    return row[0], row[4] if len(row) > 4 else "", (int(row[1]), int(row[2]), int(row[3]))
+
+
+class RaterAgreement:
+    """
+    Inter-rater agreement on one metric, updated one argument at a time.
+    Only counts are kept: the number of arguments per combination of
+    ratings for Cohen's kappa and the number of ratings per category for
+    Fleiss' kappa.
+    """
+
+    def __init__(self, raters, categories=5):
+        """
+        :param raters: number of raters rating every argument
+        :param categories: number of possible ratings, 0 up to categories - 1
+        """
+        self.raters = raters
+        self.categories = categories
+        self.items = 0
+        # Cohen's kappa, only for two raters
+        self.pairs = [[0] * categories for _ in range(categories)]
+        # Fleiss' kappa
+        self.categoryTotals = [0] * categories
+        self.agreementSum = 0.0
+
+    def add(self, ratings):
+        """
+        Add the ratings of all raters of one argument.
+
+        :param ratings: the rating of every rater
+        :return: None
+        """
+        self.items += 1
+        if self.raters == 2:
+            self.pairs[ratings[0]][ratings[1]] += 1
+        counts = [0] * self.categories
+        for rating in ratings:
+            counts[rating] += 1
+            self.categoryTotals[rating] += 1
+        self.agreementSum += (sum(count * count for count in counts) - self.raters) / (self.raters * (self.raters - 1))
+
+    def cohenKappa(self):
+        """
+        :return: Cohen's kappa of two raters, None for more raters or if it is undefined
+        """
+        if self.raters != 2 or self.items == 0:
+            return None
+        observed = sum(self.pairs[i][i] for i in range(self.categories)) / self.items
+        expected = sum(sum(self.pairs[i]) * sum(row[i] for row in self.pairs) for i in range(self.categories)) / self.items ** 2
+        return None if expected == 1 else (observed - expected) / (1 - expected)
+
+    def fleissKappa(self):
+        """
+        :return: Fleiss' kappa, None if it is undefined
+        """
+        if self.items == 0:
+            return None
+        observed = self.agreementSum / self.items
+        expected = sum((total / (self.items * self.raters)) ** 2 for total in self.categoryTotals)
+        return None if expected == 1 else (observed - expected) / (1 - expected)
 
 
-    :param file: the file to read the rated arguments from
-    :return: argument ratings for all submissions sorted by prolificId and metric
+def aggregateRatings(files):
     """
+    Aggregate the rated arguments of one or more raters in a single pass.
+    Only running counts and sums are kept per participant. The files are
+    read side by side; an argument rated by every rater is added to the
+    inter-rater agreement as soon as all its ratings have been read.
+    Arguments are matched on prolific ID and their position among the
+    arguments of the participant, so the files may have the participants
+    in a different order and a participant may submit the same argument
+    twice.
+
+    As for T-Depth, each argument should have the number of one of the four
+    subtopics it fits with best. T-Depth is calculated per rater and averaged.
+
+    :param files: the files of the raters to read the rated arguments from
+    :return: (aggregated ratings per participant, RaterAgreement per metric)
+    """
+    raters = len(files)
     ratingsPerSubmission = {}
-    with open(file) as ratings_file:
-        next(ratings_file)
-        for line in ratings_file:
-            regexRes = re.search("^([a-z0-9]{24}),([0-4]),([0-4]),([0-4]),(.*)$", line)
-            if regexRes:
-                if not regexRes.group(1) in ratingsPerSubmission:
-                    ratingsPerSubmission[regexRes.group(1)] = {"DQual": [], "DIntrp": [], "TDepth-subtopic1": 0,
-                                                               "TDepth-subtopic2": 0, "TDepth-subtopic3": 0, "TDepth-subtopic4": 0}
-                if regexRes.group(2) != '0':
-                    ratingsPerSubmission[regexRes.group(1)]['TDepth-subtopic' + regexRes.group(2)] += 1
-                ratingsPerSubmission[regexRes.group(1)]['DQual'].append(int(regexRes.group(3)))
-                ratingsPerSubmission[regexRes.group(1)]['DIntrp'].append(int(regexRes.group(4)))
-
-    # Calculate T-Depth
-    for (submission, ratings) in ratingsPerSubmission.items():
-        ratingsPerSubmission[submission]['TDepth'] = avg([min(3, ratings["TDepth-subtopic" + str(i)]) for i in range(1, 5)])
-
-    return ratingsPerSubmission
+    agreement = {metric: RaterAgreement(raters) for metric in METRICS}
+    # Ratings of arguments that not every rater has rated yet
+    pending = {}
+
+    readers = []
+    for file in files:
+        rows = readTable(file)
+        next(rows)
+        readers.append(rows)
+
+    for rows in itertools.zip_longest(*readers):
+        parsed = [None if row is None else parseRatingRow(row) for row in rows]
+        # (prolific ID, position of the argument) of the rating of every rater
+        keys = [None] * raters
+        for (rater, rating) in enumerate(parsed):
+            if rating is None:
+                continue
+            (prolificId, argument, (subtopic, dqual, dintrp)) = rating
+            submission = ratingsPerSubmission.get(prolificId)
+            if submission is None:
+                submission = {"args": [0] * raters, "subtopics": [[0] * 4 for _ in range(raters)],
+                              "DQualSum": 0, "DIntrpSum": 0, "ratings": 0}
+                ratingsPerSubmission[prolificId] = submission
+            keys[rater] = (prolificId, submission["args"][rater])
+            submission["args"][rater] += 1
+            if subtopic != 0:
+                submission["subtopics"][rater][subtopic - 1] += 1
+            submission["DQualSum"] += dqual
+            submission["DIntrpSum"] += dintrp
+            submission["ratings"] += 1
+
+        if raters < 2:
+            continue
+        if all(key is not None for key in keys) and len(set(keys)) == 1:
+            # All raters rated the same argument on this row
+            for (i, metric) in enumerate(METRICS):
+                agreement[metric].add([rating[2][i] for rating in parsed])
+            continue
+        for (rater, rating) in enumerate(parsed):
+            if rating is None:
+                continue
+            ratingsPerRater = pending.setdefault(keys[rater], {})
+            ratingsPerRater[rater] = rating[2]
+            if len(ratingsPerRater) == raters:
+                for (i, metric) in enumerate(METRICS):
+                    agreement[metric].add([ratingsPerRater[r][i] for r in range(raters)])
+                del pending[keys[rater]]
+
+    for submission in ratingsPerSubmission.values():
+        submission["TDepth"] = sum(avg([min(3, count) for count in subtopics]) for subtopics in submission["subtopics"]) / raters
+        submission["avgDQual"] = submission["DQualSum"] / submission["ratings"]
+        submission["avgDIntrp"] = submission["DIntrpSum"] / submission["ratings"]
+        submission["NoOfArgsSubmitted"] = max(submission["args"])
+
+    return ratingsPerSubmission, agreement
+
+
+def processRatings(files):
+    """
+    Read the rated arguments from the CSV and aggregate them per prolificId
+    and metric (TDepth, DQual, DInterp), see aggregateRatings.
+
+    :param files: the file to read the rated arguments from, or a list with the files of several raters
+    :return: aggregated argument ratings for all submissions
+    """
+    return aggregateRatings([files] if isinstance(files, str) else files)[0]
 
 
 def writeAvgRatingsToCSV(file, ratings):
     """
-    Calculate the average ratings of each metrics of each submission.
-    Then, write to CSV file.
+    Write the average ratings of each metrics of each submission to a CSV file.
 
     :param file: the CSV file to write the average ratings to.
     :param ratings: the processed ratings.
     :return: None
     """
-    file = open(file, "w")
-    file.write("prolificId,avgTDepth,avgDQual,avgDIntrp,NoOfArgsSubmitted\n")
-    for (prolificId, pRatings) in ratings.items():
-        file.write(str(prolificId) + "," + str(pRatings['TDepth']) + "," + str(avg(pRatings['DQual'])) + "," + str(avg(pRatings['DIntrp'])) + "," + str(len(pRatings['DIntrp'])) + "\n")
-    file.close()
+    writeTable(file, ["prolificId", "avgTDepth", "avgDQual", "avgDIntrp", "NoOfArgsSubmitted"],
+               ([prolificId, pRatings['TDepth'], pRatings['avgDQual'], pRatings['avgDIntrp'], pRatings['NoOfArgsSubmitted']]
+                for (prolificId, pRatings) in ratings.items()))
 
 
 def avg(list):
@@ -60,6 +197,15 @@ def avg(list):
 
 
 if __name__ == '__main__':
-    processedRatings = processRatings("/home/mike/git/bbt-analysis/data/in/allArgsRated.csv")
-    writeAvgRatingsToCSV("/home/mike/git/bbt-analysis/data/out/argumentsAvgRatings.csv", processedRatings)
+    parser = argparse.ArgumentParser(description="Average the ratings of the arguments per participant.")
+    parser.add_argument("files", nargs="*", default=["/home/mike/git/bbt-analysis/data/in/allArgsRated.csv"], help="rated arguments, one file per rater")
+    parser.add_argument("--out", default="/home/mike/git/bbt-analysis/data/out/argumentsAvgRatings.csv", help="file to write the average ratings to")
+    args = parser.parse_args()
+
+    processedRatings, agreement = aggregateRatings(args.files)
+    writeAvgRatingsToCSV(args.out, processedRatings)
     print(processedRatings)
+    if len(args.files) > 1:
+        for (metric, metricAgreement) in agreement.items():
+            print(metric + ": " + str(metricAgreement.items) + " arguments rated by all raters, Cohen's kappa " + str(metricAgreement.cohenKappa()) +
+                  ", Fleiss' kappa " + str(metricAgreement.fleissKappa()))
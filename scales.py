@@ -0,0 +1,120 @@
+import numpy as np
+
+# Questionnaire scales as declared data. A scale is either the mean of its
+# items, answered on a Likert scale from low to high, with the reversed items
+# scored as low + high - answer, or the mean of other scales ("subscales").
+ATI_SCALES = [
+    {"name": "ati", "items": ["ati" + str(i) for i in range(1, 10)], "range": (1, 6), "reverse": ["ati3", "ati6", "ati8"]},
+]
+
+UES_SCALES = [
+    {"name": "uesRws", "items": ["rws1", "rws2", "rws3"], "range": (1, 5)},
+    {"name": "uesAes", "items": ["aes1", "aes2", "aes3"], "range": (1, 5)},
+    {"name": "uesPus", "items": ["pus1", "pus2", "pus3"], "range": (1, 5), "reverse": ["pus1", "pus2", "pus3"]},
+    {"name": "uesFas", "items": ["fas1", "fas2", "fas3"], "range": (1, 5)},
+    {"name": "uesTotal", "subscales": ["uesRws", "uesAes", "uesPus", "uesFas"]},
+]
+
+POSTTASK_SCALES = ATI_SCALES + UES_SCALES
+
+# Attention checks as item -> expected answer
+POSTTASK_ATTENTION_CHECKS = {"attn": 2}
+PRETASK_ATTENTION_CHECKS = {"attn": 1}
+
+
+class ScaleScorer:
+    """
+    Scores questionnaires of a whole cohort at once from scale definitions.
+    The answers of all participants are collected in one matrix with a
+    column per item; reversing, summing the items of every scale and
+    checking the attention checks are then array operations on that matrix.
+    """
+
+    def __init__(self, scales, attentionChecks=None):
+        """
+        :param scales: scale definitions, see POSTTASK_SCALES. Subscales must be defined before the scales using them.
+        :param attentionChecks: dictionary item -> expected answer
+        """
+        self.scales = scales
+        self.attentionChecks = attentionChecks or {}
+        self.items = list(dict.fromkeys(item for scale in scales for item in scale.get("items", [])))
+        column = {item: i for (i, item) in enumerate(self.items)}
+
+        # Reversed answers are low + high - answer: multiply by -1 and add low + high
+        self.sign = np.ones(len(self.items), dtype=np.int64)
+        self.offset = np.zeros(len(self.items), dtype=np.int64)
+        self.low = np.full(len(self.items), np.iinfo(np.int64).min)
+        self.high = np.full(len(self.items), np.iinfo(np.int64).max)
+        # Membership of the items in the scales, to sum all scales with one product
+        itemScales = [scale for scale in scales if "items" in scale]
+        self.membership = np.zeros((len(self.items), len(itemScales)), dtype=np.int64)
+        for (j, scale) in enumerate(itemScales):
+            (low, high) = scale["range"]
+            for item in scale["items"]:
+                self.membership[column[item], j] = 1
+                self.low[column[item]] = low
+                self.high[column[item]] = high
+            for item in scale.get("reverse", []):
+                self.sign[column[item]] = -1
+                self.offset[column[item]] = low + high
+        self.itemScales = [scale["name"] for scale in itemScales]
+        self.itemCounts = self.membership.sum(axis=0)
+
+    def answers(self, submissions, items):
+        """
+        Collect the answers of all participants to some items.
+
+        :param submissions: the questionnaires in JSON
+        :param items: the items to collect
+        :return: matrix with a row per participant and a column per item
+        """
+        return np.array([[submission[item] for item in items] for submission in submissions], dtype=np.int64).reshape(len(submissions), len(items))
+
+    def score(self, submissions):
+        """
+        Score all scales for all participants.
+
+        :param submissions: the questionnaires in JSON, with an '_id'
+        :return: dictionary scale name -> array with the score of every participant
+        """
+        answers = self.answers(submissions, self.items)
+        outOfRange = (answers < self.low) | (answers > self.high)
+        if outOfRange.any():
+            (row, col) = np.argwhere(outOfRange)[0]
+            raise ValueError("Participant " + submissions[row]['_id'] + " answered " + str(answers[row, col]) + " to " + self.items[col] +
+                             ", expected " + str(self.low[col]) + " to " + str(self.high[col]))
+        sums = (answers * self.sign + self.offset) @ self.membership
+        scores = {name: sums[:, j] / self.itemCounts[j] for (j, name) in enumerate(self.itemScales)}
+        for scale in self.scales:
+            if "subscales" in scale:
+                # Added one by one, in the order of the definition
+                total = scores[scale["subscales"][0]]
+                for subscale in scale["subscales"][1:]:
+                    total = total + scores[subscale]
+                scores[scale["name"]] = total / len(scale["subscales"])
+        return {scale["name"]: scores[scale["name"]] for scale in self.scales}
+
+    def failedAttentionChecks(self, submissions):
+        """
+        Check the attention checks of all participants.
+
+        :param submissions: the questionnaires in JSON
+        :return: boolean array, True for participants who failed an attention check
+        """
+        items = list(self.attentionChecks)
+        if not items:
+            return np.zeros(len(submissions), dtype=bool)
+        expected = np.array([self.attentionChecks[item] for item in items])
+        return (self.answers(submissions, items) != expected).any(axis=1)
+
+    def warnFailedAttentionChecks(self, submissions):
+        """
+        Print a warning for every participant who failed an attention check.
+
+        :param submissions: the questionnaires in JSON, with an '_id'
+        :return: boolean array, True for participants who failed an attention check
+        """
+        failed = self.failedAttentionChecks(submissions)
+        for i in failed.nonzero()[0]:
+            print("[WARNING] Participant " + submissions[i]['_id'] + " failed the attention check!")
+        return failed
@@ -0,0 +1,306 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse, load_npz, save_npz
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+
+def clickMatrix(participants, urls, clicksPerParticipant):
+    """
+    Build a sparse participant x page matrix with a 1 for every page
+    clicked by a participant, however often it was clicked.
+
+    :param participants: the participants, in the order of the rows
+    :param urls: the pages, in the order of the columns
+    :param clicksPerParticipant: clicked URLs per participant
+    :return: the click matrix in CSR format
+    """
+    column = {url: j for j, url in enumerate(urls)}
+    rows = []
+    columns = []
+    for i, participant in enumerate(participants):
+        for j in {column[url] for url in clicksPerParticipant[participant] if url in column}:
+            rows.append(i)
+            columns.append(j)
+    return csr_matrix(([1.0] * len(rows), (rows, columns)), shape=(len(participants), len(urls)))
+
+
+def calculateSimilarities(argsPerParticipant, clicksPerParticipant, webPageTexts):
+    """
+    Calculate the cosine similarity between the arguments of each
+    participant and each web page they clicked. One Bag of Words vocabulary
+    is fitted on all arguments and all distinct pages, so every page is
+    vectorized once however many participants clicked it. All vectors stay
+    sparse and only the similarities of the clicked pairs are calculated,
+    as the row-wise dot products of the gathered argument and page vectors.
+
+    Words that occur in neither text of a pair are zero in both vectors,
+    so the similarities equal the ones of listReliance.calculateBoWVectors.
+
+    :param argsPerParticipant: arguments of each participant as one string
+    :param clicksPerParticipant: clicked URLs per participant
+    :param webPageTexts: text of each web page that could be fetched
+    :return: (participants, urls, sparse participant x page matrix with the
+             similarities of the clicked pages)
+    """
+    participants = [participant for participant in clicksPerParticipant if participant in argsPerParticipant]
+    urls = list(dict.fromkeys(url for participant in participants for url in clicksPerParticipant[participant] if url in webPageTexts))
+    if not urls:
+        # Nothing to compare, and the vocabulary of no texts at all would be empty
+        return participants, urls, csr_matrix((len(participants), 0))
+
+    vectorizer = CountVectorizer(strip_accents='unicode')
+    vectors = vectorizer.fit_transform([argsPerParticipant[participant] for participant in participants] + [webPageTexts[url] for url in urls])
+    # Cosine similarity is the dot product of the normalized vectors
+    vectors = normalize(vectors)
+    argVectors = vectors[:len(participants)]
+    pageVectors = vectors[len(participants):]
+
+    clicks = clickMatrix(participants, urls, clicksPerParticipant).tocoo()
+    (rows, columns) = (clicks.row, clicks.col)
+    similarities = np.asarray(argVectors[rows].multiply(pageVectors[columns]).sum(axis=1)).ravel()
+    return participants, urls, csr_matrix((similarities, (rows, columns)), shape=(len(participants), len(urls)))
+
+
+def calculateMaxSimilarities(argsPerParticipant, clicksPerParticipant, webPageTexts):
+    """
+    Calculate the highest cosine similarity between the arguments of each
+    participant and the web pages they clicked, see calculateSimilarities.
+    Participants without any fetched page get 0.0.
+
+    :param argsPerParticipant: arguments of each participant as one string
+    :param clicksPerParticipant: clicked URLs per participant
+    :param webPageTexts: text of each web page that could be fetched
+    :return: dictionary with the highest similarity per participant
+    """
+    participants, urls, similarities = calculateSimilarities(argsPerParticipant, clicksPerParticipant, webPageTexts)
+    if not participants:
+        return {}
+    similarities = similarities.tocoo()
+    # Word counts are never negative, so participants without a page keep 0.0
+    highest = np.zeros(len(participants))
+    np.maximum.at(highest, similarities.row, similarities.data)
+    return {participant: float(highest[i]) for i, participant in enumerate(participants)}
+
+
+# Scoring backends: bow compares the word counts of the texts, tfidf weighs the
+# words by their document frequency over all fetched pages and embedding
+# compares the sentence embeddings of the texts
+BACKENDS = ("bow", "tfidf", "embedding")
+
+# Local sentence-embedding model of the embedding backend, run on the CPU
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+def textDigest(text):
+    """
+    :param text: the text of a web page
+    :return: digest telling whether the text of a page changed
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# The model only reads the start of a long text, so pages are embedded in
+# passages of this many words and their embeddings averaged
+PASSAGE_WORDS = 200
+
+
+def embedTexts(model, texts):
+    """
+    Calculate the normalized embedding of every text as the average of
+    the embeddings of its passages.
+
+    :param model: the SentenceTransformer model
+    :param texts: the texts to embed
+    :return: dense matrix with a row per text
+    """
+    passages = []
+    owners = []
+    for (i, text) in enumerate(texts):
+        words = text.split()
+        for start in range(0, max(1, len(words)), PASSAGE_WORDS):
+            passages.append(" ".join(words[start:start + PASSAGE_WORDS]))
+            owners.append(i)
+    embeddings = model.encode(passages, batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+    vectors = np.zeros((len(texts), embeddings.shape[1]), dtype=np.float32)
+    np.add.at(vectors, np.array(owners, dtype=np.int64), embeddings)
+    return normalize(vectors)
+
+
+class PageIndex:
+    """
+    Normalized vectors of the fetched web pages for the tfidf or embedding
+    backend, calculated once and kept on disk. The arguments of a
+    participant are vectorized the same way, after which the similarity
+    with a page is a lookup of the row of the page and a dot product.
+    The tfidf index holds the fitted vectorizer, since the document
+    frequencies are those of all pages in the index. The index keeps a
+    digest of the text of every page, so a page whose text changed is
+    not taken for the one in the index.
+    """
+
+    def __init__(self, backend, urls, vectors, vectorizer=None, model=EMBEDDING_MODEL, digests=None):
+        """
+        :param backend: tfidf or embedding
+        :param urls: the pages, in the order of the rows
+        :param vectors: sparse (tfidf) or dense (embedding) matrix with the normalized vector of every page
+        :param vectorizer: the fitted TfidfVectorizer of the tfidf backend
+        :param model: name of the sentence-embedding model of the embedding backend
+        :param digests: textDigest of the text of every page, in the order of the rows
+        """
+        self.backend = backend
+        self.urls = urls
+        self.rows = {url: i for (i, url) in enumerate(urls)}
+        self.digests = digests or []
+        self.vectors = vectors
+        self.vectorizer = vectorizer
+        self.model = model
+        self.encoder = None
+
+    def fingerprint(self):
+        """
+        :return: string that changes when the similarities of the index could change
+        """
+        # A page that was added or whose text changed changes the similarities of its
+        # clicks, with tfidf also the document frequencies and so all vectors
+        pages = hashlib.sha256("\n".join(sorted(url + " " + digest for (url, digest) in zip(self.urls, self.digests))).encode("utf-8")).hexdigest()
+        if self.backend == "tfidf":
+            return "tfidf:" + pages
+        return "embedding:" + self.model + ":" + pages
+
+    def vectorize(self, texts):
+        """
+        :param texts: texts to compare with the pages, e.g. the arguments of participants
+        :return: the normalized vectors of the texts, in the format of the page vectors
+        """
+        if self.backend == "tfidf":
+            return self.vectorizer.transform(texts)
+        if self.encoder is None:
+            # sentence-transformers is optional, it is only needed for the embedding backend
+            from sentence_transformers import SentenceTransformer
+            self.encoder = SentenceTransformer(self.model, device="cpu")
+        return embedTexts(self.encoder, texts)
+
+    def save(self, indexDir):
+        """
+        Write the index to a directory, replacing an older index.
+
+        :param indexDir: the directory
+        :return: None
+        """
+        os.makedirs(indexDir, exist_ok=True)
+        # Removed first and written last, so an index is only used once it is complete
+        if os.path.exists(os.path.join(indexDir, "index.json")):
+            os.remove(os.path.join(indexDir, "index.json"))
+        # Every file is written under another name and renamed, an older index may still be memory-mapped
+        if self.backend == "tfidf":
+            with open(os.path.join(indexDir, "vectors.npz.tmp"), "wb") as file:
+                save_npz(file, self.vectors)
+            os.replace(os.path.join(indexDir, "vectors.npz.tmp"), os.path.join(indexDir, "vectors.npz"))
+            with open(os.path.join(indexDir, "vectorizer.pickle.tmp"), "wb") as file:
+                pickle.dump(self.vectorizer, file)
+            os.replace(os.path.join(indexDir, "vectorizer.pickle.tmp"), os.path.join(indexDir, "vectorizer.pickle"))
+        else:
+            with open(os.path.join(indexDir, "vectors.npy.tmp"), "wb") as file:
+                np.save(file, self.vectors)
+            os.replace(os.path.join(indexDir, "vectors.npy.tmp"), os.path.join(indexDir, "vectors.npy"))
+        with open(os.path.join(indexDir, "index.json"), "w") as file:
+            json.dump({"backend": self.backend, "model": self.model, "urls": self.urls, "digests": self.digests}, file)
+
+    @classmethod
+    def load(cls, indexDir):
+        """
+        Read an index written by save. The vectors of the embedding backend
+        are memory-mapped, so only the rows that are used are read.
+
+        :param indexDir: the directory of the index
+        :return: the index, None if there is none
+        """
+        if not os.path.exists(os.path.join(indexDir, "index.json")):
+            return None
+        with open(os.path.join(indexDir, "index.json")) as file:
+            meta = json.load(file)
+        if meta["backend"] == "tfidf":
+            with open(os.path.join(indexDir, "vectorizer.pickle"), "rb") as file:
+                vectorizer = pickle.load(file)
+            return cls("tfidf", meta["urls"], load_npz(os.path.join(indexDir, "vectors.npz")).tocsr(), vectorizer, digests=meta.get("digests"))
+        return cls("embedding", meta["urls"], np.load(os.path.join(indexDir, "vectors.npy"), mmap_mode="r"), model=meta["model"],
+                   digests=meta.get("digests"))
+
+
+def buildPageIndex(backend, webPageTexts, indexDir=None, model=EMBEDDING_MODEL):
+    """
+    Build the page index of a backend over all fetched pages, reusing the
+    index in indexDir where possible: a tfidf index is only built again if
+    the pages or their texts changed, an embedding index only embeds the
+    new pages and the pages whose text changed.
+
+    :param backend: tfidf or embedding
+    :param webPageTexts: text of each web page that could be fetched
+    :param indexDir: directory to keep the index in, None to not keep it
+    :param model: name of the sentence-embedding model of the embedding backend
+    :return: the PageIndex
+    """
+    if backend not in BACKENDS[1:]:
+        raise ValueError("No page index for scoring backend " + backend + ", use one of " + ", ".join(BACKENDS[1:]))
+    urls = list(webPageTexts)
+    digests = {url: textDigest(webPageTexts[url]) for url in urls}
+    index = None if indexDir is None else PageIndex.load(indexDir)
+    if index is not None and (index.backend != backend or index.model != model or len(index.digests) != len(index.urls)):
+        index = None
+    # Pages of the index with the same text as now
+    indexed = {} if index is None else {url: row for (row, (url, digest)) in enumerate(zip(index.urls, index.digests)) if digests.get(url) == digest}
+
+    if backend == "tfidf":
+        if index is not None and len(indexed) == len(index.urls) == len(urls):
+            return index
+        vectorizer = TfidfVectorizer(strip_accents='unicode')
+        index = PageIndex("tfidf", urls, vectorizer.fit_transform([webPageTexts[url] for url in urls]).tocsr(), vectorizer,
+                          digests=[digests[url] for url in urls])
+    else:
+        known = list(indexed)
+        new = [url for url in urls if url not in indexed]
+        if index is not None and not new and len(known) == len(index.urls):
+            return index
+        vectors = [] if index is None else [np.asarray(index.vectors[[indexed[url] for url in known]])]
+        encoder = PageIndex("embedding", [], None, model=model)
+        if new:
+            vectors.append(encoder.vectorize([webPageTexts[url] for url in new]))
+        index = PageIndex("embedding", known + new, np.concatenate(vectors), model=model, digests=[digests[url] for url in known + new])
+        index.encoder = encoder.encoder
+    if indexDir is not None:
+        index.save(indexDir)
+    return index
+
+
+def calculateIndexedMaxSimilarities(index, argsPerParticipant, clicksPerParticipant):
+    """
+    Calculate the highest similarity between the arguments of each
+    participant and the web pages they clicked with a page index. Only the
+    arguments are vectorized; the similarity of a click is the dot product
+    of the argument vector with the row of the page. Clicked pages that are
+    not in the index are skipped, participants without any page get 0.0.
+
+    :param index: the PageIndex
+    :param argsPerParticipant: arguments of each participant as one string
+    :param clicksPerParticipant: clicked URLs per participant
+    :return: dictionary with the highest similarity per participant
+    """
+    participants = [participant for participant in clicksPerParticipant if participant in argsPerParticipant]
+    if not participants:
+        return {}
+    clicks = clickMatrix(participants, index.urls, clicksPerParticipant).tocoo()
+    (rows, columns) = (clicks.row, clicks.col)
+    argVectors = index.vectorize([argsPerParticipant[participant] for participant in participants])
+    if issparse(argVectors):
+        similarities = np.asarray(argVectors[rows].multiply(index.vectors[columns]).sum(axis=1)).ravel()
+    else:
+        similarities = np.einsum("ij,ij->i", argVectors[rows], np.asarray(index.vectors[columns]))
+    # Embeddings can have a negative similarity, so start below any similarity
+    highest = np.full(len(participants), -np.inf)
+    np.maximum.at(highest, rows, similarities)
+    highest[np.isinf(highest)] = 0.0
+    return {participant: float(highest[i]) for (i, participant) in enumerate(participants)}
@@ -0,0 +1,267 @@
+import argparse
+import datetime
+import heapq
+import json
+import os
+import random
+from urllib.parse import quote
+
+from tableWriter import TableWriter
+
+# Words the synthetic queries are made of
+QUERY_TERMS = ["nuclear", "energy", "climate", "change", "school", "uniforms", "vegan", "diet",
+               "pros", "cons", "arguments", "health", "cost", "safety", "renewable", "ban"]
+
+# Conditions of the study, as in logs.CONDITIONS
+CONDITIONS = ["list", "grid", "ilsp", "sa"]
+
+# Parts the synthetic arguments are made of, some with commas, quotes and newlines as in real submissions
+ARGUMENT_PARTS = ["Nuclear energy is clean", "it is expensive, though", "school uniforms reduce \"peer pressure\"",
+                  "a vegan diet is healthy", "renewable energy creates jobs", "safety is a concern\nfor many people",
+                  "the cost of climate change is high", "a ban would not work"]
+
+
+def formatMillis(millis):
+    """
+    Format millis since epoch as a LogUI eventTimestamp.
+
+    :param millis: timestamp in millis
+    :return: timestamp in the format YYYY-MM-DDTHH:MM:SS.fffZ
+    """
+    return datetime.datetime.fromtimestamp(millis / 1000, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def prolificID(rng):
+    """
+    Generate a random prolific ID (24 hexadecimal characters).
+
+    :param rng: random number generator to use
+    :return: the prolific ID
+    """
+    return '%024x' % rng.getrandbits(96)
+
+
+def generateParticipantLogs(rng, participant, startMillis):
+    """
+    Generate the LogUI events of one session: started, then URLChange,
+    mouseClick, viewportFocusChange and viewportResize events, and stopped.
+
+    :param rng: random number generator to use
+    :param participant: prolific ID of the participant
+    :param startMillis: time the session started in millis
+    :return: list of the events in the order they are logged
+    """
+    logs = []
+    time = startMillis
+
+    def log(eventType, eventDetails, metadata=None):
+        event = {'eventType': eventType,
+                 'eventDetails': eventDetails,
+                 'timestamps': {'eventTimestamp': formatMillis(time)},
+                 'applicationSpecificData': {'prolificID': participant}}
+        if metadata is not None:
+            event['metadata'] = metadata
+        logs.append(event)
+
+    width, height = rng.choice([(1920, 969), (1536, 754), (1440, 789), (1366, 657), (1280, 648)])
+    log('statusEvent', {'type': 'started', 'viewportResolution': {'width': width, 'height': height}})
+
+    previousURL = 'http://localhost/'
+    query = None
+    for _ in range(rng.randint(5, 60)):
+        time += rng.randint(200, 20000)
+        kind = rng.random()
+        if kind < 0.3:
+            if query is None or rng.random() < 0.6:
+                # New query, double encoded as in the URLs of the search interface
+                query = quote(quote(' '.join(rng.sample(QUERY_TERMS, rng.randint(1, 4)))))
+                serp = 1
+            else:
+                serp = rng.randint(2, 5)
+            newURL = 'http://localhost/?#' + str(serp) + '-' + query
+            log('browserEvent', {'type': 'URLChange', 'newURL': newURL, 'previousURL': previousURL})
+            previousURL = newURL
+        elif kind < 0.5 and query is not None:
+            rank = rng.randint(1, 10)
+            log('interactionEvent', {'type': 'mouseClick', 'name': rng.choice(['SEARCH_RESULT_CLICKED', 'SEARCH_RESULT_CLICKED_AUX'])},
+                [{'name': 'rank', 'value': str(rank)},
+                 {'name': 'url', 'value': 'https://example.org/page/' + str(rng.randint(1, 500))},
+                 {'name': 'serp', 'value': previousURL.split('#')[-1].split('-')[0]},
+                 {'name': 'title', 'value': 'Result ' + str(rank)},
+                 {'name': 'query', 'value': query}])
+        elif kind < 0.8:
+            log('browserEvent', {'type': 'viewportFocusChange', 'hasFocus': rng.random() < 0.5})
+        else:
+            width, height = max(400, width + rng.randint(-300, 300)), max(300, height + rng.randint(-200, 200))
+            log('browserEvent', {'type': 'viewportResize', 'stringRepr': str(width) + 'x' + str(height)})
+
+    time += rng.randint(200, 5000)
+    log('statusEvent', {'type': 'stopped'})
+    return logs
+
+
+def generateLogs(participants, seed=0, prolificIDs=None):
+    """
+    Generate a synthetic LogUI export. Sessions of different participants
+    overlap in time, so their events are interleaved like in the real logs.
+    Only the start time and the seed of every session are kept in memory.
+    A session is generated when the export reaches its start and its events
+    are merged with the ones of the sessions still going on through a heap,
+    so the memory used depends on the number of overlapping sessions, not
+    on the number of participants.
+
+    :param participants: number of participants
+    :param seed: seed of the random number generator
+    :param prolificIDs: prolific IDs of the participants, random IDs if None
+    :return: generator yielding the events, sorted by time
+    """
+    rng = random.Random(seed)
+    # (start, participant number, seed of the session)
+    sessions = sorted((1620000000000 + rng.randint(0, 14 * 24 * 3600 * 1000), i, rng.getrandbits(64)) for i in range(participants))
+    # Events of the started sessions by (timestamp, participant number, number of the event in the session),
+    # which keeps the events logged in the same millisecond in the order of the participants and the session
+    pending = []
+    started = 0
+    while pending or started < len(sessions):
+        while started < len(sessions) and (not pending or formatMillis(sessions[started][0]) <= pending[0][0]):
+            (startMillis, i, sessionSeed) = sessions[started]
+            sessionRng = random.Random(sessionSeed)
+            participant = prolificID(sessionRng) if prolificIDs is None else prolificIDs[i]
+            for (j, log) in enumerate(generateParticipantLogs(sessionRng, participant, startMillis)):
+                heapq.heappush(pending, (log['timestamps']['eventTimestamp'], i, j, log))
+            started += 1
+        yield heapq.heappop(pending)[3]
+
+
+def writeLogs(file, logs, ndjson=False):
+    """
+    Write logs as a LogUI export, one event at a time.
+
+    :param file: file to write to
+    :param logs: iterable with the events to write, e.g. the generator of generateLogs
+    :param ndjson: write one event per line instead of a JSON array
+    :return: None
+    """
+    with open(file, "w") as log_file:
+        if ndjson:
+            for log in logs:
+                log_file.write(json.dumps(log) + "\n")
+        else:
+            # The same output as json.dump of the whole list
+            log_file.write("[")
+            for (i, log) in enumerate(logs):
+                log_file.write((", " if i else "") + json.dumps(log))
+            log_file.write("]")
+
+
+def generateArguments(rng, participant):
+    """
+    Generate the submission of a participant in the bbtArguments collection.
+
+    :param rng: random number generator to use
+    :param participant: prolific ID of the participant
+    :return: the document as JSON
+    """
+    timeConstraint = rng.choice([300, 600, 900])
+    return {'_id': participant,
+            'args': [', '.join(rng.sample(ARGUMENT_PARTS, rng.randint(1, 3))) + '.' for _ in range(rng.randint(1, 8))],
+            'timeConstraint': timeConstraint,
+            # A few participants submit late
+            'timeUsed': rng.randint(60, timeConstraint + 10)}
+
+
+def generatePretask(rng, participant):
+    """
+    Generate the questionnaire of a participant in the bbtPretask collection.
+
+    :param rng: random number generator to use
+    :param participant: prolific ID of the participant
+    :return: the document as JSON
+    """
+    return {'_id': participant, 'attn': 1 if rng.random() < 0.95 else rng.randint(2, 5),
+            'gender': rng.randint(1, 3), 'age': rng.randint(18, 70), 'education': rng.randint(1, 7),
+            'wse': rng.randint(1, 5), 'priorknowl': rng.randint(1, 5), 'interest': rng.randint(1, 5), 'taskdef': rng.randint(1, 5)}
+
+
+def generatePosttask(rng, participant):
+    """
+    Generate the questionnaire of a participant in the bbtPosttask collection,
+    with the items of the scales in scales.py.
+
+    :param rng: random number generator to use
+    :param participant: prolific ID of the participant
+    :return: the document as JSON
+    """
+    posttask = {'_id': participant, 'attn': 2 if rng.random() < 0.95 else rng.choice([1, 3, 4, 5]), 'timeconstraint': rng.randint(1, 5)}
+    for i in range(1, 10):
+        posttask['ati' + str(i)] = rng.randint(1, 6)
+    for subscale in ["rws", "aes", "pus", "fas"]:
+        for i in range(1, 4):
+            posttask[subscale + str(i)] = rng.randint(1, 5)
+    return posttask
+
+
+def writeCollection(file, documents):
+    """
+    Write documents as a MongoDB export, one JSON document per line.
+
+    :param file: file to write to
+    :param documents: iterable with the documents
+    :return: None
+    """
+    with open(file, "w") as collection_file:
+        for document in documents:
+            collection_file.write(json.dumps(document) + "\n")
+
+
+def generateDataset(dataDir, participants, logParticipants=None, seed=0):
+    """
+    Generate all inputs of the analysis in dataDir/in: the exports of the
+    bbtArguments, bbtPretask, bbtPosttask and bbtCondition collections, the
+    rated arguments and the LogUI logs of every condition. The collections
+    and the logs are written one document or event at a time, so their
+    size is only limited by the disk; logParticipants can still limit the
+    logs to the first participants to save time.
+
+    :param dataDir: directory to create the in/ directory in
+    :param participants: number of participants
+    :param logParticipants: number of participants with logs, all if None
+    :param seed: seed of the random number generator
+    :return: None
+    """
+    rng = random.Random(seed)
+    inDir = os.path.join(dataDir, "in")
+    os.makedirs(inDir, exist_ok=True)
+    prolificIDs = [prolificID(rng) for _ in range(participants)]
+    conditions = [rng.choice(CONDITIONS) for _ in range(participants)]
+
+    writeCollection(os.path.join(inDir, "condition.json"), ({'_id': participant, 'condition': condition} for (participant, condition) in zip(prolificIDs, conditions)))
+    writeCollection(os.path.join(inDir, "pretask.json"), (generatePretask(rng, participant) for participant in prolificIDs))
+    writeCollection(os.path.join(inDir, "posttask.json"), (generatePosttask(rng, participant) for participant in prolificIDs))
+    with open(os.path.join(inDir, "args.json"), "w") as args_file:
+        with TableWriter(os.path.join(inDir, "allArgsRated.csv"), ["prolificId", "TDepth", "DQual", "DIntrp", "Argument"]) as rated:
+            for participant in prolificIDs:
+                arguments = generateArguments(rng, participant)
+                args_file.write(json.dumps(arguments) + "\n")
+                rated.writeRows([participant, rng.randint(0, 4), rng.randint(0, 4), rng.randint(0, 4), argument] for argument in arguments['args'])
+
+    withLogs = participants if logParticipants is None else min(participants, logParticipants)
+    for (i, condition) in enumerate(CONDITIONS):
+        inCondition = [participant for (participant, c) in zip(prolificIDs[:withLogs], conditions) if c == condition]
+        writeLogs(os.path.join(inDir, "logs-" + condition + ".log"), generateLogs(len(inCondition), seed + i, inCondition))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic LogUI export, or all inputs of the analysis with --dataset.")
+    parser.add_argument("participants", type=int, help="number of participants")
+    parser.add_argument("out", help="file to write the logs to, or the data directory with --dataset")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random number generator")
+    parser.add_argument("--ndjson", action="store_true", help="write one event per line")
+    parser.add_argument("--dataset", action="store_true", help="write the exports of all collections and the logs to out/in")
+    parser.add_argument("--log-participants", type=int, default=None, help="with --dataset, only generate logs for this many participants")
+    args = parser.parse_args()
+
+    if args.dataset:
+        generateDataset(args.out, args.participants, args.log_participants, args.seed)
+    else:
+        writeLogs(args.out, generateLogs(args.participants, args.seed), args.ndjson)
@@ -0,0 +1,159 @@
+import csv
+import gzip
+
+# Number of rows passed to the CSV writer at once
+BATCH_SIZE = 10000
+
+# Size of the write buffer of uncompressed files
+BUFFER_SIZE = 1 << 20
+
+# Key in the schema metadata of a Parquet file written without column names
+NO_HEADER = b"bbt.noHeader"
+
+
+def openText(file, mode="r"):
+    """
+    Open a text file, compressed with gzip when its name ends with .gz and
+    with zstd when it ends with .zst. Newlines are not translated, as
+    required by the csv module.
+
+    :param file: the file to open
+    :param mode: "r" to read, "w" to write
+    :return: the open text file
+    """
+    if file.endswith(".gz"):
+        return gzip.open(file, mode + "t", encoding="utf-8", newline="")
+    if file.endswith(".zst"):
+        # Only import zstandard when zstd compression is used
+        import zstandard
+        return zstandard.open(file, mode + "t", encoding="utf-8", newline="")
+    return open(file, mode, encoding="utf-8", newline="", buffering=BUFFER_SIZE)
+
+
+class TableWriter:
+    """
+    Writes rows to a CSV file in batches through the csv module, so values
+    with commas, quotes or newlines are quoted and read back unchanged.
+    The file can be compressed, see openText. A file name ending with
+    .parquet writes a Parquet file instead; its rows are written as one
+    table when the writer is closed, so the column types follow from all rows.
+    A Parquet file always has column names, without columns they are named
+    column0, column1, ... and marked as generated, so readTable leaves them out.
+    """
+
+    def __init__(self, file, columns, batchSize=BATCH_SIZE):
+        """
+        :param file: the file to write to
+        :param columns: names of the columns, None to write a CSV file without header
+        :param batchSize: number of rows collected before they are written
+        """
+        self.file = file
+        self.columns = columns
+        self.batchSize = batchSize
+        self.batch = []
+        if file.endswith(".parquet"):
+            self.stream = None
+            self.writer = None
+        else:
+            self.stream = openText(file, "w")
+            self.writer = csv.writer(self.stream, lineterminator="\n")
+            if columns is not None:
+                self.writer.writerow(columns)
+
+    def writeRow(self, row):
+        """
+        Write one row.
+
+        :param row: the values of the row, in the order of the columns
+        :return: None
+        """
+        self.batch.append(row)
+        if self.writer is not None and len(self.batch) >= self.batchSize:
+            self.flush()
+
+    def writeRows(self, rows):
+        """
+        Write many rows.
+
+        :param rows: iterable with the rows
+        :return: None
+        """
+        for row in rows:
+            self.writeRow(row)
+
+    def flush(self):
+        """
+        Write the collected rows to a CSV file.
+
+        :return: None
+        """
+        if self.writer is not None:
+            self.writer.writerows(self.batch)
+            self.batch = []
+
+    def close(self):
+        """
+        Write the remaining rows and close the file.
+
+        :return: None
+        """
+        if self.writer is not None:
+            self.flush()
+            self.stream.close()
+        else:
+            # Only import pyarrow when Parquet is written
+            import pyarrow
+            import pyarrow.parquet
+            columns = self.columns
+            if columns is None:
+                # Rows of a file without header can differ in length, shorter rows are padded with nulls
+                columns = ["column" + str(i) for i in range(max(map(len, self.batch), default=0))]
+                self.batch = [list(row) + [None] * (len(columns) - len(row)) for row in self.batch]
+            table = pyarrow.table({column: [row[i] for row in self.batch] for i, column in enumerate(columns)})
+            if self.columns is None:
+                table = table.replace_schema_metadata({NO_HEADER: b"1"})
+            pyarrow.parquet.write_table(table, self.file, compression="zstd")
+            self.batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def writeTable(file, columns, rows, batchSize=BATCH_SIZE):
+    """
+    Write rows to a CSV or Parquet file, see TableWriter.
+
+    :param file: the file to write to
+    :param columns: names of the columns, None to write a file without header
+    :param rows: iterable with the rows, in the order of the columns
+    :param batchSize: number of rows collected before they are written
+    :return: None
+    """
+    with TableWriter(file, columns, batchSize) as writer:
+        writer.writeRows(rows)
+
+
+def readTable(file):
+    """
+    Read the rows of a CSV or Parquet file written by TableWriter. The
+    values of a Parquet file are converted to the strings the CSV file
+    would have held, so the callers do not depend on the format.
+
+    :param file: the file to read, optionally compressed
+    :return: generator yielding the header and then every row as a list of strings
+    """
+    if file.endswith(".parquet"):
+        # Only import pyarrow when Parquet is read
+        import pyarrow.parquet
+        parquetFile = pyarrow.parquet.ParquetFile(file)
+        if NO_HEADER not in (parquetFile.schema_arrow.metadata or {}):
+            yield parquetFile.schema_arrow.names
+        for batch in parquetFile.iter_batches():
+            for row in zip(*(column.to_pylist() for column in batch.columns)):
+                yield ["" if value is None else str(value) for value in row]
+        return
+    with openText(file, "r") as stream:
+        yield from csv.reader(stream)
@@ -0,0 +1,35 @@
+from eventCache import buildEventCache, isCurrent, openEventCache
+from logEvent import LogEvent
+from logs import groupLogsPerSubmission, iterLogs
+from synthetic import generateLogs, writeLogs
+
+
+def fields(event):
+    return [getattr(event, field) for field in LogEvent.__slots__]
+
+
+def test_round_trip(tmp_path):
+    logFile = str(tmp_path / "logs.log")
+    cacheFile = str(tmp_path / "logs.cache")
+    writeLogs(logFile, generateLogs(40, seed=9))
+    expected = groupLogsPerSubmission(iterLogs(logFile))
+
+    buildEventCache(logFile, cacheFile)
+    assert isCurrent(cacheFile, logFile)
+    with openEventCache(logFile, cacheFile) as cache:
+        assert len(cache) == len(expected)
+        assert cache.participants() == list(expected)
+        for (prolificid, events) in expected.items():
+            assert [fields(event) for event in cache.events(prolificid)] == [fields(event) for event in events]
+
+
+def test_changed_log_file_rebuilds_the_cache(tmp_path):
+    logFile = str(tmp_path / "logs.log")
+    cacheFile = str(tmp_path / "logs.cache")
+    writeLogs(logFile, generateLogs(10, seed=10))
+    openEventCache(logFile, cacheFile).close()
+
+    writeLogs(logFile, generateLogs(12, seed=11))
+    assert not isCurrent(cacheFile, logFile)
+    with openEventCache(logFile, cacheFile) as cache:
+        assert cache.participants() == list(groupLogsPerSubmission(iterLogs(logFile)))
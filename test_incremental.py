@@ -0,0 +1,61 @@
+import json
+
+from incremental import updateLogFile
+from logs import processLogFile
+from synthetic import generateLogs, writeLogs
+from tableWriter import readTable
+
+
+def readRows(file):
+    return list(readTable(file))
+
+
+def test_appended_ndjson_gives_the_full_run(tmp_path):
+    logs = list(generateLogs(60, seed=5))
+    logFile = str(tmp_path / "logs.log")
+    outFile = str(tmp_path / "behavior.csv")
+    checkpointFile = str(tmp_path / "checkpoint")
+
+    writeLogs(logFile, logs[:len(logs) // 2], ndjson=True)
+    assert updateLogFile(logFile, outFile, checkpointFile) == len(logs) // 2
+    with open(logFile, "a") as log_file:
+        log_file.writelines(json.dumps(log) + "\n" for log in logs[len(logs) // 2:])
+    assert updateLogFile(logFile, outFile, checkpointFile) == len(logs) - len(logs) // 2
+
+    processLogFile(logFile, str(tmp_path / "full.csv"))
+    assert readRows(outFile) == readRows(str(tmp_path / "full.csv"))
+
+
+def test_reexported_json_array_gives_the_full_run(tmp_path):
+    logs = list(generateLogs(60, seed=6))
+    logFile = str(tmp_path / "logs.log")
+    outFile = str(tmp_path / "behavior.csv")
+    checkpointFile = str(tmp_path / "checkpoint")
+
+    # Every export contains the previous one followed by the new events
+    previousEnd = 0
+    for end in (len(logs) // 3, 2 * len(logs) // 3, len(logs)):
+        writeLogs(logFile, logs[:end])
+        assert updateLogFile(logFile, outFile, checkpointFile) == end - previousEnd
+        # Only participants that stopped have a row
+        stopped = {log['applicationSpecificData']['prolificID'] for log in logs[:end] if log['eventDetails']['type'] == "stopped"}
+        assert {row[0] for row in readRows(outFile)[1:]} == stopped
+        previousEnd = end
+
+    processLogFile(logFile, str(tmp_path / "full.csv"))
+    assert readRows(outFile) == readRows(str(tmp_path / "full.csv"))
+
+
+def test_rewritten_log_is_processed_again(tmp_path):
+    logFile = str(tmp_path / "logs.log")
+    outFile = str(tmp_path / "behavior.csv")
+    checkpointFile = str(tmp_path / "checkpoint")
+
+    writeLogs(logFile, generateLogs(30, seed=7))
+    updateLogFile(logFile, outFile, checkpointFile)
+    logs = list(generateLogs(30, seed=8))
+    writeLogs(logFile, logs)
+    assert updateLogFile(logFile, outFile, checkpointFile) == len(logs)
+
+    processLogFile(logFile, str(tmp_path / "full.csv"))
+    assert readRows(outFile) == readRows(str(tmp_path / "full.csv"))
@@ -0,0 +1,47 @@
+import json
+
+from logs import iterLogs
+from synthetic import generateLogs, writeLogs
+
+# Strings with the characters the JSON array is split on and characters that are escaped or not ASCII
+TRICKY_EVENTS = [{'eventType': 'browserEvent', 'eventDetails': {'type': 'URLChange', 'newURL': 'http://localhost/?#1-a%2C%5D', 'previousURL': '], [{"x": 1}, '},
+                  'timestamps': {'eventTimestamp': '2021-05-03T00:02:19.571Z'}, 'applicationSpecificData': {'prolificID': 'café \\ "quoted"\n☃'}}]
+
+
+def test_json_array_split_across_chunks(tmp_path):
+    logs = list(generateLogs(20, seed=1)) + TRICKY_EVENTS
+    logFile = str(tmp_path / "logs.log")
+    writeLogs(logFile, logs)
+    for chunkSize in (1, 2, 7, 100, 1 << 16):
+        assert list(iterLogs(logFile, chunkSize)) == logs, chunkSize
+
+
+def test_json_array_with_whitespace(tmp_path):
+    logs = list(generateLogs(5, seed=2))
+    logFile = tmp_path / "logs.log"
+    logFile.write_text("\n  " + json.dumps(logs, indent=2) + "\n")
+    for chunkSize in (1, 3, 1 << 16):
+        assert list(iterLogs(str(logFile), chunkSize)) == logs, chunkSize
+
+
+def test_ndjson(tmp_path):
+    logs = list(generateLogs(20, seed=3)) + TRICKY_EVENTS
+    logFile = str(tmp_path / "logs.log")
+    writeLogs(logFile, logs, ndjson=True)
+    for chunkSize in (1, 5, 1 << 16):
+        assert list(iterLogs(logFile, chunkSize)) == logs, chunkSize
+
+
+def test_ndjson_with_blank_lines(tmp_path):
+    logs = list(generateLogs(3, seed=4))
+    logFile = tmp_path / "logs.log"
+    logFile.write_text("\n\n" + "\n\n".join(json.dumps(log) for log in logs) + "\n\n")
+    for chunkSize in (1, 4, 1 << 16):
+        assert list(iterLogs(str(logFile), chunkSize)) == logs, chunkSize
+
+
+def test_empty_exports(tmp_path):
+    for text in ("", "  \n", "[]", " [ ] "):
+        logFile = tmp_path / "logs.log"
+        logFile.write_text(text)
+        assert list(iterLogs(str(logFile), 1)) == [], text
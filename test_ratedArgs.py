@@ -0,0 +1,55 @@
+import pytest
+
+from ratedArgs import RaterAgreement, aggregateRatings
+from tableWriter import writeTable
+
+# Cohen's kappa of two raters answering yes (1) or no (0) for 50 items, 0.4
+COHEN_PAIRS = [([1, 1], 20), ([1, 0], 5), ([0, 1], 10), ([0, 0], 15)]
+
+# Fleiss' kappa of 14 raters putting 10 items in 5 categories, 0.210:
+# the number of raters choosing every category for every item
+FLEISS_COUNTS = [[0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+                 [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7]]
+
+HEADER = ["prolificId", "TDepth", "DQual", "DIntrp", "Argument"]
+
+
+def test_cohen_kappa():
+    agreement = RaterAgreement(2)
+    for (ratings, items) in COHEN_PAIRS:
+        for _ in range(items):
+            agreement.add(ratings)
+    assert agreement.cohenKappa() == pytest.approx(0.4)
+    # Scott's pi, with the ratings of both raters pooled
+    assert agreement.fleissKappa() == pytest.approx((0.7 - 0.505) / (1 - 0.505))
+
+
+def test_fleiss_kappa():
+    agreement = RaterAgreement(14)
+    for counts in FLEISS_COUNTS:
+        agreement.add([category for (category, count) in enumerate(counts) for _ in range(count)])
+    assert agreement.fleissKappa() == pytest.approx(0.20993, abs=1e-5)
+    assert agreement.cohenKappa() is None
+
+
+def test_undefined_kappa():
+    agreement = RaterAgreement(2)
+    assert agreement.cohenKappa() is None
+    agreement.add([3, 3])
+    assert agreement.cohenKappa() is None
+    assert agreement.fleissKappa() is None
+
+
+def test_files_in_different_order_with_repeated_arguments(tmp_path):
+    first = "a" * 24
+    second = "b" * 24
+    # The second participant submitted the same argument twice, with different ratings
+    writeTable(str(tmp_path / "rater1.csv"), HEADER, [[first, 1, 2, 3, "An argument"], [second, 1, 4, 0, "Same"], [second, 2, 1, 1, "Same"]])
+    writeTable(str(tmp_path / "rater2.csv"), HEADER, [[second, 1, 4, 0, "Same"], [second, 2, 1, 1, "Same"], [first, 1, 2, 3, "An argument"]])
+    ratings, agreement = aggregateRatings([str(tmp_path / "rater1.csv"), str(tmp_path / "rater2.csv")])
+
+    assert ratings[second]["NoOfArgsSubmitted"] == 2
+    assert ratings[second]["avgDQual"] == 2.5
+    for metric in agreement.values():
+        assert metric.items == 3
+        assert metric.cohenKappa() == pytest.approx(1.0)
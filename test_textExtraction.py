@@ -0,0 +1,31 @@
+from textExtraction import BACKENDS
+
+# XHTML page with an XML declaration, the text is not UTF-8 so the declared encoding must be used
+XHTML_PAGE = ('<?xml version="1.0" encoding="iso-8859-1"?>\n'
+              '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+              '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Café</title><style>p {}</style></head>'
+              '<body><p>Vegan café menu</p><script>var x = 1;</script></body></html>').encode("iso-8859-1")
+
+
+def test_xhtml_with_xml_declaration():
+    for (backend, extractText) in BACKENDS.items():
+        text = extractText(XHTML_PAGE)
+        assert "Vegan café menu" in text, backend
+        assert "var x" not in text, backend
+
+
+def test_xhtml_with_xml_declaration_as_str():
+    for (backend, extractText) in BACKENDS.items():
+        assert "Vegan café menu" in extractText(XHTML_PAGE.decode("iso-8859-1")), backend
+
+
+# Page without a declared charset in Latin-1, so its encoding must be detected
+UNDECLARED_PAGE = '<html><body><p>Crème brûlée à la carte</p><template><p>Hidden</p></template><p>After</p></body></html>'.encode("iso-8859-1")
+
+
+def test_undeclared_charset_gives_the_reference_text():
+    reference = BACKENDS["bs4"](UNDECLARED_PAGE)
+    assert "Crème brûlée à la carte" in reference
+    assert "Hidden" not in reference
+    for (backend, extractText) in BACKENDS.items():
+        assert extractText(UNDECLARED_PAGE) == reference, backend
@@ -0,0 +1,35 @@
+import math
+
+from logs import CSV_COLUMNS, iterLogs, processLogFile
+from synthetic import formatMillis, generateLogs, writeLogs
+from tableWriter import readTable
+from timeline import WINDOW_COLUMNS, buildTimelines
+
+
+def event(participant, millis, eventType, details):
+    return {'eventType': eventType, 'eventDetails': details, 'timestamps': {'eventTimestamp': formatMillis(millis)},
+            'applicationSpecificData': {'prolificID': participant}}
+
+
+# A participant whose SERP lost focus at the start and never got it back, so the dwell time is 0
+NO_FOCUS = [event("nofocus", 1620000000000, 'statusEvent', {'type': 'started', 'viewportResolution': {'width': 1920, 'height': 969}}),
+            event("nofocus", 1620000000000, 'browserEvent', {'type': 'viewportFocusChange', 'hasFocus': False}),
+            event("nofocus", 1620000060000, 'statusEvent', {'type': 'stopped'})]
+
+
+def test_whole_session_window_equals_logs(tmp_path):
+    logFile = str(tmp_path / "logs.log")
+    writeLogs(logFile, list(generateLogs(200, seed=3)) + NO_FOCUS, ndjson=True)
+    processLogFile(logFile, str(tmp_path / "behavior.csv"))
+    rows = readTable(str(tmp_path / "behavior.csv"))
+    header = next(rows)
+    expected = {row[0]: dict(zip(header, row)) for row in rows}
+
+    timelines = buildTimelines(iterLogs(logFile))
+    assert set(timelines) == set(expected)
+    assert float(expected["nofocus"]["dwellTimePerMinute"]) == 60
+    for (prolificid, timeline) in timelines.items():
+        metrics = timeline.window(timeline.start, timeline.stop)
+        for column in WINDOW_COLUMNS[4:]:
+            assert column in CSV_COLUMNS
+            assert math.isclose(metrics[column], float(expected[prolificid][column]), rel_tol=1e-9), (prolificid, column)
@@ -0,0 +1,141 @@
+import re
+from html.parser import HTMLParser
+
+# Tags whose contents are not part of the text of a web page. BeautifulSoup
+# also leaves the contents of <template> out of the text.
+SKIPPED_TAGS = ("script", "style", "header", "template")
+
+# XML declaration at the start of an XHTML page, e.g. <?xml version="1.0" encoding="utf-8"?>
+XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+
+def normalizeText(text):
+    """
+    Break text into lines, remove leading/trailing blank spaces & blank lines.
+
+    :param text: the raw text of a web page
+    :return: the normalized text
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def decodeHTML(html, charset=None):
+    """
+    Decode the HTML of a web page the way BeautifulSoup does, so all
+    backends see the same text: with the charset of the HTTP response,
+    else the one declared in the page or in the XML declaration of an
+    XHTML page, and for pages that declare none (or a wrong one) with the
+    first encoding that fits the bytes, e.g. UTF-8 or Windows-1252.
+
+    :param html: the HTML as bytes or str
+    :param charset: charset of the Content-Type header of the page, None if it had none
+    :return: the HTML as str
+    """
+    if isinstance(html, str):
+        return html
+    # The encoding detection of bs4 is only imported when bytes are decoded
+    from bs4.dammit import UnicodeDammit
+
+    decoded = UnicodeDammit(html, [charset] if charset else [], is_html=True).unicode_markup
+    return html.decode("utf-8", errors="replace") if decoded is None else decoded
+
+
+def extractTextBeautifulSoup(html, charset=None):
+    """
+    Get the text contents of the HTML of a web page with BeautifulSoup.
+    The reference implementation for the other backends.
+
+    :param html: the HTML of the web page
+    :param charset: charset of the Content-Type header of the page, None if it had none
+    :return: contents of the web page as plain text.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, features="html.parser", from_encoding=charset if isinstance(html, bytes) else None)
+
+    # Delete tags
+    for script in soup(list(SKIPPED_TAGS)):
+        script.extract()
+
+    return normalizeText(soup.get_text())
+
+
+def extractTextLxml(html, charset=None):
+    """
+    Get the text contents of the HTML of a web page with the
+    libxml2 HTML parser of lxml.
+
+    :param html: the HTML of the web page
+    :param charset: charset of the Content-Type header of the page, None if it had none
+    :return: contents of the web page as plain text.
+    """
+    import lxml.etree
+    import lxml.html
+
+    try:
+        # lxml refuses a str with an encoding declaration, the page is already decoded
+        document = lxml.html.document_fromstring(XML_DECLARATION.sub('', decodeHTML(html, charset), count=1))
+    except lxml.etree.ParserError:
+        # Raised for pages without any content
+        return ''
+    lxml.etree.strip_elements(document, *SKIPPED_TAGS, with_tail=False)
+    return normalizeText(document.text_content())
+
+
+class TextCollector(HTMLParser):
+    """
+    Collects the text of a web page while it is parsed, skipping the
+    contents of SKIPPED_TAGS. No document tree is built.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.skipping:
+            # Also closes skipped tags that were left open inside it
+            del self.skipping[len(self.skipping) - 1 - self.skipping[::-1].index(tag):]
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def extractTextStreaming(html, charset=None):
+    """
+    Get the text contents of the HTML of a web page with the streaming
+    HTMLParser of the standard library, without building a document tree.
+
+    :param html: the HTML of the web page
+    :param charset: charset of the Content-Type header of the page, None if it had none
+    :return: contents of the web page as plain text.
+    """
+    collector = TextCollector()
+    collector.feed(decodeHTML(html, charset))
+    collector.close()
+    return normalizeText(''.join(collector.parts))
+
+
+# Text extraction backends by name
+BACKENDS = {"bs4": extractTextBeautifulSoup,
+            "lxml": extractTextLxml,
+            "stream": extractTextStreaming}
+
+
+def getExtractor(backend):
+    """
+    Get the text extraction function of a backend.
+
+    :param backend: name of the backend: bs4, lxml or stream
+    :return: function converting the HTML of a page to text
+    """
+    if backend not in BACKENDS:
+        raise ValueError("Unknown text extraction backend " + backend + ", use one of " + ", ".join(BACKENDS))
+    return BACKENDS[backend]
@@ -0,0 +1,297 @@
+import argparse
+from bisect import bisect_left, bisect_right
+
+import instrumentation
+from logEvent import CLICK_TYPES
+from logs import iterLogs, CONDITIONS
+from metrics import QueryserpAccumulator, SubmissionMetrics
+from tableWriter import TableWriter
+
+# Columns of the windowed behavior CSV files
+WINDOW_COLUMNS = ["prolificId", "window", "windowStart", "windowEnd", "queriesIssued", "queryRate", "serpsVisited",
+                  "dwellTimePerMinute", "noOfResultsClicked", "deepestRankVisitedResults", "avgRankVisitedResults"]
+
+
+class Timeline:
+    """
+    Index of the events of one participant for metrics over any time window.
+    Queries, SERP visits and clicks are kept as sorted timestamps with
+    prefix sums, and the focus as the boundaries of the focus intervals
+    with the focus time up to each boundary. A window is then answered
+    with a few binary searches, whatever its length, and the deepest
+    clicked rank with a sparse table of maxima.
+    All times are in milliseconds since epoch.
+    """
+
+    def __init__(self, start, stop, focusTimes, focused, queryTimes, serpTimes, clickTimes, clickRanks):
+        """
+        :param start: time of the started event
+        :param stop: time of the stopped event
+        :param focusTimes: sorted boundaries of the focus intervals, the first is start
+        :param focused: whether the SERP had focus from each boundary to the next (or to stop)
+        :param queryTimes: sorted times of the queries
+        :param serpTimes: sorted times of the SERP visits
+        :param clickTimes: sorted times of the clicks on results
+        :param clickRanks: rank of the result of each click
+        """
+        self.start = start
+        self.stop = stop
+        self.focusTimes = focusTimes
+        self.focused = focused
+        # Focus time from start up to every boundary
+        self.focusPrefix = [0]
+        for i in range(1, len(focusTimes)):
+            self.focusPrefix.append(self.focusPrefix[-1] + (focusTimes[i] - focusTimes[i - 1] if focused[i - 1] else 0))
+        self.queryTimes = queryTimes
+        self.serpTimes = serpTimes
+        self.clickTimes = clickTimes
+        self.clickRanks = clickRanks
+        self.rankPrefix = [0]
+        for rank in clickRanks:
+            self.rankPrefix.append(self.rankPrefix[-1] + rank)
+        # maxima[k][i] is the deepest rank of clicks i up to i + 2^k
+        self.maxima = [clickRanks]
+        while (1 << len(self.maxima)) <= len(clickRanks):
+            previous = self.maxima[-1]
+            half = 1 << (len(self.maxima) - 1)
+            self.maxima.append([max(previous[i], previous[i + half]) for i in range(len(previous) - half)])
+
+    def focusTimeUntil(self, time):
+        """
+        :param time: a time within the session
+        :return: milliseconds the SERP had focus between start and time
+        """
+        i = bisect_right(self.focusTimes, time) - 1
+        if i < 0:
+            return 0
+        return self.focusPrefix[i] + (time - self.focusTimes[i] if self.focused[i] else 0)
+
+    def deepestRank(self, first, last):
+        """
+        :param first: index of the first click
+        :param last: index after the last click, > first
+        :return: deepest rank of the clicks in between
+        """
+        k = (last - first).bit_length() - 1
+        return max(self.maxima[k][first], self.maxima[k][last - (1 << k)])
+
+    def window(self, begin, end):
+        """
+        Calculate the metrics of calculateMetricsPerSubmission over a time
+        window, clipped to the session. Events at begin are in the window,
+        events at end are not. The window from start to stop gives the same
+        metrics as the whole session. As in PagefocusAccumulator, a dwell
+        time of 0 is taken as 60 seconds per minute.
+
+        :param begin: start of the window
+        :param end: end of the window
+        :return: the metrics of the window, None if it does not overlap the session
+        """
+        begin = max(begin, self.start)
+        end = min(end, self.stop)
+        if end <= begin:
+            return None
+        minutes = (end - begin) / 60000
+        # Events at the stop time are still part of the session
+        until = end + 1 if end == self.stop else end
+
+        queries = bisect_left(self.queryTimes, until) - bisect_left(self.queryTimes, begin)
+        first = bisect_left(self.clickTimes, begin)
+        last = bisect_left(self.clickTimes, until)
+        focusTime = self.focusTimeUntil(end) - self.focusTimeUntil(begin)
+        dwellTime = focusTime / 1000 / minutes
+        if dwellTime == 0:
+            # The rule of PagefocusAccumulator, see metrics.py
+            dwellTime = 60
+        return {"queriesIssued": queries,
+                "queryRate": queries / minutes,
+                "serpsVisited": bisect_left(self.serpTimes, until) - bisect_left(self.serpTimes, begin),
+                "dwellTimePerMinute": dwellTime,
+                "noOfResultsClicked": last - first,
+                "deepestRankVisitedResults": self.deepestRank(first, last) if last > first else 0,
+                "avgRankVisitedResults": (self.rankPrefix[last] - self.rankPrefix[first]) / (last - first) if last > first else 0}
+
+    def minuteWindows(self, minutes=1):
+        """
+        :param minutes: length of the windows, at least one millisecond
+        :return: list of (begin, end) of consecutive windows from start to stop
+        """
+        length = int(minutes * 60000)
+        if length < 1:
+            raise ValueError("Windows of " + str(minutes) + " minutes are shorter than a millisecond")
+        return [(begin, min(begin + length, self.stop)) for begin in range(self.start, self.stop, length)]
+
+    def deadlineWindows(self, timeConstraint):
+        """
+        :param timeConstraint: the time the participant had for the task in seconds, see args.py
+        :return: list with (begin, end) before and after the deadline, without the one after if there is none
+        """
+        deadline = self.start + timeConstraint * 1000
+        if deadline >= self.stop:
+            return [(self.start, self.stop)]
+        return [(self.start, deadline), (deadline, self.stop)]
+
+
+class TimelineAccumulator(QueryserpAccumulator):
+    """
+    Collect the events of one participant into a Timeline. Queries and
+    SERP visits are recognized as by QueryserpAccumulator and the focus
+    intervals as by PagefocusAccumulator. Not registered, so it is only
+    used when passed to SubmissionMetrics, e.g. by buildTimelines.
+
+    Metrics calculated:
+    - [timeline] the Timeline of the participant
+    """
+    eventTypes = ("started", "stopped", "viewportFocusChange", "URLChange") + CLICK_TYPES
+
+    def __init__(self):
+        super().__init__()
+        self.time = None
+        self.start = None
+        self.stop = None
+        self.focusChanges = []
+        self.queryTimes = []
+        self.serpTimes = []
+        self.clickTimes = []
+        self.clickRanks = []
+
+    def feed(self, log):
+        eventType = log.type
+        self.time = log.timestamp
+        if eventType == "URLChange":
+            super().feed(log)
+        elif eventType == "viewportFocusChange":
+            self.focusChanges.append((log.timestamp, log.hasFocus))
+        elif eventType == "started":
+            # Only the first start counts
+            if self.start is None:
+                self.start = log.timestamp
+        elif eventType == "stopped":
+            # The last stop counts
+            self.stop = log.timestamp
+        else:
+            self.clickTimes.append(log.timestamp)
+            self.clickRanks.append(log.rank)
+
+    def addSerp(self, serp):
+        self.serpTimes.append(self.time)
+
+    def addQuery(self, query):
+        self.queryTimes.append(self.time)
+
+    def finalize(self, metrics):
+        # As in PagefocusAccumulator, the time up to a focus change counts as focus if
+        # the SERP lost focus, and the time after the last one if it got focus
+        focusTimes = [self.start]
+        focused = []
+        for (timestamp, hasFocus) in self.focusChanges:
+            focused.append(not hasFocus)
+            focusTimes.append(timestamp)
+        # Without focus changes the participant was on the SERP all the time
+        focused.append(self.focusChanges[-1][1] if self.focusChanges else True)
+        clicks = sorted(zip(self.clickTimes, self.clickRanks))
+        metrics['timeline'] = Timeline(self.start, self.stop, focusTimes, focused, sorted(self.queryTimes), sorted(self.serpTimes),
+                                       [time for (time, _) in clicks], [rank for (_, rank) in clicks])
+
+
+def buildTimelines(logs):
+    """
+    Build the Timeline of every participant while reading the logs.
+    Participants are included as by logs.streamMetricsPerSubmission.
+
+    :param logs: the raw, ungrouped logs, e.g. from logs.iterLogs
+    :return: dictionary prolific ID -> Timeline
+    """
+    submissions = {}
+    for log in logs:
+        prolificid = log['applicationSpecificData']['prolificID']
+        metrics = submissions.get(prolificid)
+        if metrics is None:
+            if not (log['eventType'] == "statusEvent" and log['eventDetails']['type'] == "started"):
+                continue
+            metrics = SubmissionMetrics(prolificid, [TimelineAccumulator])
+            submissions[prolificid] = metrics
+        metrics.feed(log)
+    submissions.pop(None, None)
+    return {prolificid: metrics.finalize()['timeline'] for (prolificid, metrics) in submissions.items()}
+
+
+def writeWindowsToCSV(outFile, timelines, windows):
+    """
+    Write the metrics of every window of every participant to a CSV file.
+    windowStart and windowEnd are in seconds since the start of the participant.
+
+    :param outFile: the file to write to, see tableWriter.py
+    :param timelines: dictionary prolific ID -> Timeline
+    :param windows: function giving the list of (name, begin, end) of the windows of a participant
+    :return: None
+    """
+    with TableWriter(outFile, WINDOW_COLUMNS) as writer:
+        for (prolificid, timeline) in timelines.items():
+            for (name, begin, end) in windows(prolificid, timeline):
+                metrics = timeline.window(begin, end)
+                if metrics is not None:
+                    writer.writeRow([prolificid, name, (begin - timeline.start) / 1000, (end - timeline.start) / 1000] +
+                                    [metrics[column] for column in WINDOW_COLUMNS[4:]])
+
+
+def processWindows(logFile, argsFile, outFile, minutes=None):
+    """
+    Calculate the search behavior metrics per time window of all
+    participants in one log file and write them to a CSV file. The
+    windows are before and after the deadline of the time constraint
+    of every participant, or consecutive windows of some minutes.
+
+    :param logFile: file containing the raw logs
+    :param argsFile: file with the raw arguments, for the time constraints
+    :param outFile: CSV file to write the metrics to
+    :param minutes: length of the windows, None for the windows around the deadline
+    :return: None
+    """
+    if minutes is None:
+        from args import importArgs
+        timeConstraints = {s['_id']: s['timeConstraint'] for s in importArgs(argsFile)}
+
+        def windows(prolificid, timeline):
+            if prolificid not in timeConstraints:
+                instrumentation.log(instrumentation.INFO, "[WARNING] No time constraint for participant " + prolificid + ", no windows")
+                return []
+            return [(name, begin, end) for (name, (begin, end)) in zip(["beforeDeadline", "afterDeadline"], timeline.deadlineWindows(timeConstraints[prolificid]))]
+    else:
+        def windows(prolificid, timeline):
+            return [("minute" + str(i), begin, end) for (i, (begin, end)) in enumerate(timeline.minuteWindows(minutes))]
+
+    with instrumentation.timer("timeline.buildTimelines"):
+        timelines = buildTimelines(iterLogs(logFile))
+    with instrumentation.timer("timeline.writeWindowsToCSV"):
+        writeWindowsToCSV(outFile, timelines, windows)
+    instrumentation.log(instrumentation.INFO, logFile + ": windows of " + str(len(timelines)) + " participants")
+
+
+def windowMinutes(value):
+    """
+    Parse the --minutes argument, the windows are at least a millisecond long.
+
+    :param value: the argument
+    :return: the length of the windows in minutes
+    """
+    minutes = float(value)
+    # Also rejects nan
+    if not minutes * 60000 >= 1:
+        raise argparse.ArgumentTypeError("windows must be longer than 0 minutes (at least a millisecond), not " + value)
+    return minutes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calculate search behavior metrics per time window.")
+    parser.add_argument("conditions", nargs="*", default=CONDITIONS, help="conditions to process (default: all)")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the in/ and out/ directories")
+    parser.add_argument("--minutes", type=windowMinutes, default=None, help="windows of this many minutes instead of before and after the deadline")
+    instrumentation.addArguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args)
+
+    for condition in args.conditions:
+        processWindows(args.data_dir + "/in/logs-" + condition + ".log", args.data_dir + "/in/args.json",
+                       args.data_dir + "/out/behavior-windows-" + condition + ".csv", args.minutes)
+    instrumentation.writeReport(args.report)
@@ -0,0 +1,104 @@
+import datetime
+import functools
+
+# Format of the eventTimestamp of LogUI, e.g. 2021-05-03T10:15:42.123Z
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+
+@functools.lru_cache(maxsize=4096)
+def _dateSeconds(date):
+    """
+    Seconds since epoch at midnight UTC of a date. Cached since all
+    timestamps of a session share the same few dates.
+
+    :param date: date in the format YYYY-MM-DD
+    :return: seconds since epoch
+    """
+    return (datetime.date(int(date[0:4]), int(date[5:7]), int(date[8:10])).toordinal() - _EPOCH_ORDINAL) * 86400
+
+
+@functools.lru_cache(maxsize=4096)
+def _minuteSeconds(minute):
+    """
+    Seconds since epoch at the start of a minute UTC. Cached since the
+    events of a session are logged in a few hundred different minutes.
+
+    :param minute: minute in the format YYYY-MM-DDTHH:MM
+    :return: seconds since epoch
+    """
+    return _dateSeconds(minute[0:10]) + int(minute[11:13]) * 3600 + int(minute[14:16]) * 60
+
+
+def parseTimestampMicros(timestamp):
+    """
+    Convert a LogUI eventTimestamp to microseconds since epoch. Timestamps
+    are interpreted as UTC (the Z suffix), independent of the local time
+    zone. The fixed format is decoded by slicing; anything else falls back
+    to strptime.
+
+    :param timestamp: timestamp in the format YYYY-MM-DDTHH:MM:SS.fffZ
+    :return: timestamp in micros, exact
+    """
+    if len(timestamp) > 20 and len(timestamp) < 28 and timestamp[-1] == 'Z' and timestamp[10] == 'T' and timestamp[19] == '.':
+        return (_minuteSeconds(timestamp[0:16]) + int(timestamp[17:19])) * 1000000 + int(timestamp[20:-1].ljust(6, '0'))
+    delta = datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def parseTimestampMillis(timestamp):
+    """
+    Convert a LogUI eventTimestamp to milliseconds since epoch, see
+    parseTimestampMicros.
+
+    The millis are calculated as int((seconds + microseconds / 1e6) * 1000),
+    the same floating point calculation as datetime.timestamp() * 1000 on
+    a machine in UTC, so the values are identical to the ones of strptime.
+
+    :param timestamp: timestamp in the format YYYY-MM-DDTHH:MM:SS.fffZ
+    :return: timestamp in millis
+    """
+    seconds, microseconds = divmod(parseTimestampMicros(timestamp), 1000000)
+    return int((seconds + microseconds / 1e6) * 1000)
+
+
+def formatTimestamp(micros):
+    """
+    Convert microseconds since epoch back to a LogUI eventTimestamp.
+    Always uses six digits for the fraction, which parses to the same value.
+
+    :param micros: timestamp in micros
+    :return: timestamp in the format YYYY-MM-DDTHH:MM:SS.ffffffZ
+    """
+    return (_EPOCH + datetime.timedelta(microseconds=micros)).strftime(TIMESTAMP_FORMAT)
+
+
+def parseTimestampsMillis(timestamps):
+    """
+    Convert many LogUI eventTimestamps to milliseconds since epoch at once
+    using NumPy datetime64. Gives the same values as parseTimestampMillis.
+
+    :param timestamps: sequence of timestamps in the format YYYY-MM-DDTHH:MM:SS.fffZ
+    :return: NumPy int64 array with the timestamps in millis
+    """
+    # NumPy is only needed for the batch path, so it is not imported by the scripts using the scalar path
+    import numpy as np
+
+    # datetime64 does not accept the Z suffix, all timestamps are UTC
+    return microsToMillis(np.array([timestamp[:-1] for timestamp in timestamps], dtype='datetime64[us]').astype(np.int64))
+
+
+def microsToMillis(micros):
+    """
+    Convert an array of timestamps in micros to millis with the same
+    floating point calculation as parseTimestampMillis.
+
+    :param micros: NumPy int64 array with timestamps in micros
+    :return: NumPy int64 array with the timestamps in millis
+    """
+    import numpy as np
+
+    seconds, microseconds = np.divmod(micros, 1000000)
+    return ((seconds.astype(np.float64) + microseconds / 1e6) * 1000).astype(np.int64)
@@ -1,30 +1,61 @@
-import matplotlib.pyplot as plt
-import re
+import argparse
 
-def importSizes(path):
+from logs import CONDITIONS, readViewports
+
+
+def importSizes(files):
     """
-    Import the initial viewport sizes from the CSV file.
+    Import the initial viewport sizes written by logs.py.
 
-    :param path: Path to the CSV file.
-    :return: Array of initial sizes
+    :param files: the viewports-<condition>.npz files to read
+    :return: (widths, heights) as arrays with one element per participant
     """
-    initialSizes = []
+    viewports = readViewports(files)
+    initial = viewports['initial']
+    return viewports['width'][initial], viewports['height'][initial]
 
-    with open(path) as file:
-        for line in file:
-            # Use regex to extract Prolific ID, width, height
-            regexRes = re.search("^([a-z0-9]{24}),([0-9]+),([0-9]+)$", line)
-            if regexRes:
-                initialSizes.append((int(regexRes.group(2)), int(regexRes.group(3))))
 
-    return initialSizes
+def plotSizes(widths, heights, hist2d=False, bins=100):
+    """
+    Plot the initial sizes of all participants at once, as a scatter
+    plot or as a 2D histogram for large cohorts.
+
+    :param widths: the width of every participant
+    :param heights: the height of every participant
+    :param hist2d: plot the number of participants per bin instead of every size
+    :param bins: number of bins per axis of the 2D histogram
+    :return: None
+    """
+    # matplotlib takes most of the startup time, so it is only imported to plot
+    import matplotlib.pyplot as plt
+
+    if hist2d:
+        plt.hist2d(widths, heights, bins=bins, cmin=1)
+        plt.colorbar(label="participants")
+    else:
+        plt.scatter(widths, heights, s=4)
+    plt.xlabel("width")
+    plt.ylabel("height")
 
 
 if __name__ == '__main__':
-    sizes = importSizes("/home/mike/git/bbt-analysis/data/out/initialViewports.csv")
+    parser = argparse.ArgumentParser(description="Plot the initial viewport sizes of the participants.")
+    parser.add_argument("conditions", nargs="*", default=CONDITIONS, help="conditions to plot (default: all)")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the out/ directory")
+    parser.add_argument("--out", default=None, help="save the plot to this file, e.g. viewports.png, instead of showing it")
+    parser.add_argument("--hist2d", action="store_true", help="plot a 2D histogram instead of every size")
+    parser.add_argument("--bins", type=int, default=100, help="number of bins per axis of the 2D histogram")
+    args = parser.parse_args()
+
+    sizes = importSizes([args.data_dir + "/out/viewports-" + condition + ".npz" for condition in args.conditions])
+    if args.out is not None:
+        # Render to the file without a display
+        import matplotlib
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
-    # Plot all initial sizes.
-    xcors = [cor[0] for cor in sizes]
-    ycors = [cor[1] for cor in sizes]
-    plt.scatter(xcors, ycors)
-    plt.show()
\ No newline at end of file
+    plotSizes(*sizes, hist2d=args.hist2d, bins=args.bins)
+    if args.out is None:
+        plt.show()
+    else:
+        plt.savefig(args.out, dpi=150)
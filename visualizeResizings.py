@@ -1,54 +1,82 @@
-import matplotlib.pyplot as plt
-import re
+import argparse
 
-def plotResizings(resizings, color):
+from logs import CONDITIONS, readViewports
+
+
+def importResizings(files):
     """
-    Plot arrows representing the resizing events.
+    Import the resizing events written by logs.py as arrows from every
+    size after a resize to the size after the next resize of the same
+    participant.
 
-    :param resizings: Array with the resizing events of one participant
-    :param color: Color of the resizing event.
-    :return: Nothing.
+    :param files: the viewports-<condition>.npz files to read
+    :return: (x, y, dx, dy, participant) as arrays with one element per arrow
     """
-    last = None
-    for (x, y) in resizings:
-        if last is not None:
-            plt.arrow(last[0], last[1], x - last[0], y - last[1], head_width=25, length_includes_head=True, color=color)
-            last = (x, y)
-        else:
-            last = (x, y)
+    viewports = readViewports(files)
+    resized = ~viewports['initial']
+    participant = viewports['participant'][resized]
+    widths = viewports['width'][resized]
+    heights = viewports['height'][resized]
+    # Consecutive resizes of the same participant
+    same = participant[1:] == participant[:-1]
+    return (widths[:-1][same], heights[:-1][same], (widths[1:] - widths[:-1])[same], (heights[1:] - heights[:-1])[same],
+            participant[:-1][same])
 
 
-def importResizings(path):
+def plotResizings(x, y, dx, dy, participant, hist2d=False, bins=100):
     """
-    Import the resizing events, group by participant.
+    Plot the arrows of the resizing events of all participants at once, in
+    a color per participant, or for large cohorts a 2D histogram of the
+    sizes the participants resized to.
 
-    :param path: Path to the file containing the resizing event.
-    :return: Resizing events grouped by participant.
+    :param x: width before every resize
+    :param y: height before every resize
+    :param dx: change of the width
+    :param dy: change of the height
+    :param participant: the participant of every resize
+    :param hist2d: plot the number of resizes per bin instead of every arrow
+    :param bins: number of bins per axis of the 2D histogram
+    :return: None
     """
-    resizingsPerParticipants = {}
+    # matplotlib takes most of the startup time, so it is only imported to plot
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import numpy as np
 
-    with open(path) as file:
-        for line in file:
-            # Use regex to extract Prolific ID, width, height
-            regexRes = re.search("^([a-z0-9]{24}),([0-9]+),([0-9]+)$", line)
-            if regexRes:
-                if not regexRes.group(1) in resizingsPerParticipants:
-                    resizingsPerParticipants[regexRes.group(1)] = [(int(regexRes.group(2)), int(regexRes.group(3)))]
-                else:
-                    resizingsPerParticipants[regexRes.group(1)].append((int(regexRes.group(2)), int(regexRes.group(3))))
+    if hist2d:
+        plt.hist2d(x + dx, y + dy, bins=bins, cmin=1)
+        plt.colorbar(label="resizes")
+    else:
+        # Spread the participants over the color map to be able to distinguish the arrows
+        (participants, colorIndex) = np.unique(participant, return_inverse=True)
+        colors = matplotlib.colormaps["hsv"](colorIndex / max(1, len(participants)))
+        plt.quiver(x, y, dx, dy, color=colors, angles="xy", scale_units="xy", scale=1, width=0.002)
+        if len(x):
+            plt.xlim(min(x.min(), (x + dx).min()) - 50, max(x.max(), (x + dx).max()) + 50)
+            plt.ylim(min(y.min(), (y + dy).min()) - 50, max(y.max(), (y + dy).max()) + 50)
+    plt.xlabel("width")
+    plt.ylabel("height")
 
-    return resizingsPerParticipants
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot the viewport resizings of the participants.")
+    parser.add_argument("conditions", nargs="*", default=CONDITIONS, help="conditions to plot (default: all)")
+    parser.add_argument("--data-dir", default="/home/mike/git/bbt-analysis/data", help="directory with the out/ directory")
+    parser.add_argument("--out", default=None, help="save the plot to this file, e.g. resizings.png, instead of showing it")
+    parser.add_argument("--hist2d", action="store_true", help="plot a 2D histogram of the sizes resized to instead of every arrow")
+    parser.add_argument("--bins", type=int, default=100, help="number of bins per axis of the 2D histogram")
+    args = parser.parse_args()
 
-    allResizings = importResizings("/data/out/resizings.csv")
-    print(len(allResizings))
-
-    # create a color map to be able to distinguish arrows
-    colorMap = plt.cm.get_cmap('hsv', len(allResizings))
-
-    # Plot all resizing events
-    for i, resizing in enumerate(allResizings):
-        plotResizings(allResizings[resizing], colorMap(i))
+    resizings = importResizings([args.data_dir + "/out/viewports-" + condition + ".npz" for condition in args.conditions])
+    print(str(len(resizings[0])) + " resizes of " + str(len(set(resizings[4]))) + " participants")
+    if args.out is not None:
+        # Render to the file without a display
+        import matplotlib
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
-    plt.show()
+    plotResizings(*resizings, hist2d=args.hist2d, bins=args.bins)
+    if args.out is None:
+        plt.show()
+    else:
+        plt.savefig(args.out, dpi=150)